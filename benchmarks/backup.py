@@ -0,0 +1,102 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from benchmarks.common import make_store, temp_path
+from benchmarks.send_latency import percentile
+
+'''
+backup.py
+
+p50 and p99 latency of message/send/v1 and channel/messages/v2 on a large
+workspace while another thread keeps backing the store up, next to the same
+requests with no backup running. A backup is either written from a snapshot
+("snapshot", Datastore.backup) or, for comparison, straight from the store
+with writers locked out until it is done ("locked"), which is what a backup
+that pauses writes costs. Each run is a fresh process in a temporary
+directory, as the server's data store is created when it is imported.
+
+    python3 -m benchmarks.backup [persistence] [messages]
+'''
+
+# requests sent while the backups run
+REQUESTS = 300
+
+def worker(persistence, mode, messages):
+    root = os.getcwd()
+    os.chdir(os.path.dirname(temp_path()))
+    sys.path.insert(0, root)
+    from src import config
+    config.persistence = persistence
+    from src import server, snapshot_format
+    from src.data_store import data_store
+    from src.sessions import get_token
+    from src.storage import replace
+
+    data_store.load()
+    store = make_store(messages=messages)
+    if 0 not in store["channels"][0]["all_members"]:
+        store["channels"][0]["all_members"].append(0)
+    with data_store.write():
+        data_store.set(store)
+    # user 0 is a global owner, with session 0
+    token = get_token(0, 0)
+
+    def locked_backup(path):
+        with data_store.read() as store:
+            replace(path, lambda FILE: snapshot_format.dump(store, FILE), "always")
+
+    backup = {"snapshot": data_store.backup, "locked": locked_backup}.get(mode)
+    done = threading.Event()
+    backups = []
+    def back_up():
+        while not done.is_set():
+            start = time.perf_counter()
+            backup(os.path.join(os.getcwd(), "backup.p"))
+            backups.append(time.perf_counter() - start)
+
+    running = threading.Thread(target=back_up) if backup else None
+    if running:
+        running.start()
+        # let the first backup get under way
+        time.sleep(0.05)
+    client = server.APP.test_client()
+    sends, reads = [], []
+    for index in range(REQUESTS):
+        start = time.perf_counter()
+        response = client.post("/message/send/v1", json={"token": token, "channel_id": 0, "message": "hi"})
+        sends.append(time.perf_counter() - start)
+        assert response.status_code == 200
+        start = time.perf_counter()
+        response = client.get("/channel/messages/v2", query_string={"token": token, "channel_id": 0, "start": 0})
+        reads.append(time.perf_counter() - start)
+        assert response.status_code == 200
+        time.sleep(0.005)
+    done.set()
+    if running:
+        running.join()
+    print(json.dumps([sends, reads, backups]))
+    shutil.rmtree(os.getcwd())
+
+def main(persistence, messages):
+    print(f"{'backup':>10} {'backups':>8} {'send p50':>9} {'send p99':>9} {'read p50':>9} {'read p99':>9}  (ms)")
+    for mode in ("none", "locked", "snapshot"):
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.backup", "--worker", persistence, mode, str(messages)],
+            check=True, capture_output=True, text=True
+        ).stdout
+        sends, reads, backups = json.loads(output.splitlines()[-1])
+        print(f"{mode:>10} {len(backups):>8} "
+              f"{percentile(sends, 0.5) * 1000:>9.2f} {percentile(sends, 0.99) * 1000:>9.2f} "
+              f"{percentile(reads, 0.5) * 1000:>9.2f} {percentile(reads, 0.99) * 1000:>9.2f}")
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--worker"]:
+        worker(sys.argv[2], sys.argv[3], int(sys.argv[4]))
+    else:
+        from src import config
+        main(sys.argv[1] if len(sys.argv) > 1 else config.persistence,
+             int(sys.argv[2]) if len(sys.argv) > 2 else 100000)
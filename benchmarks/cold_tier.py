@@ -0,0 +1,80 @@
+import gc
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import time
+from benchmarks.common import make_store, temp_path
+from benchmarks.send_latency import percentile
+
+'''
+cold_tier.py
+
+Resident memory of a large workspace once it is loaded, and the p50 and p99
+latency of reading the newest and the oldest page of a channel, with every
+message kept in memory ("off") and with messages more than a day old moved
+out into the cold tier's segment ("on"). A tenth of the messages are new.
+Each run is a fresh process, so its memory is the workspace's alone.
+
+    python3 -m benchmarks.cold_tier [messages]
+'''
+
+DAY = 24 * 60 * 60
+
+# pages read from each end of the channel
+READS = 200
+
+def resident():
+    # resident memory of this process in MB
+    with open("/proc/self/statm") as FILE:
+        return int(FILE.read().split()[1]) * resource.getpagesize() / 2 ** 20
+
+def worker(path, cold):
+    from src.data_store import Datastore
+    data_store = Datastore(path, "journal", cold_message_age=DAY if cold else None)
+    data_store.load()
+    gc.collect()
+    memory = resident()
+
+    store = data_store.get()
+    channel_id = max(store["channels"], key=lambda channel_id: len(store["channels"][channel_id]["messages"]))
+    oldest = len(store["channels"][channel_id]["messages"]) - 50
+    times = {"newest": [], "oldest": []}
+    for _ in range(READS):
+        for name, start in (("newest", 0), ("oldest", oldest)):
+            begin = time.perf_counter()
+            with data_store.read():
+                data_store.page_messages("channel", channel_id, start)
+            times[name].append(time.perf_counter() - begin)
+    print(json.dumps([memory, times]))
+
+def main(messages):
+    from src.data_store import Datastore
+    path = temp_path()
+    store = make_store(messages=messages)
+    now = int(time.time())
+    for message_id, message in store["messages"].items():
+        if message_id >= messages * 0.9:
+            message["time_created"] = now
+    data_store = Datastore(path, "snapshot", cold_message_age=None)
+    data_store.set(store)
+
+    print(f"{'cold':>6} {'memory (MB)':>12} {'newest p50':>11} {'newest p99':>11} {'oldest p50':>11} {'oldest p99':>11}  (ms)")
+    for cold in (False, True):
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.cold_tier", "--worker", path, "on" if cold else "off"],
+            check=True, capture_output=True, text=True
+        ).stdout
+        memory, times = json.loads(output.splitlines()[-1])
+        print(f"{'on' if cold else 'off':>6} {memory:>12.0f} "
+              f"{percentile(times['newest'], 0.5) * 1000:>11.3f} {percentile(times['newest'], 0.99) * 1000:>11.3f} "
+              f"{percentile(times['oldest'], 0.5) * 1000:>11.3f} {percentile(times['oldest'], 0.99) * 1000:>11.3f}")
+    shutil.rmtree(os.path.dirname(path))
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--worker"]:
+        worker(sys.argv[2], sys.argv[3] == "on")
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
@@ -0,0 +1,94 @@
+import random
+import tempfile
+import time
+
+'''
+common.py
+
+Helpers shared by the benchmarks. Run a benchmark from the root of the repo, eg.
+
+    python3 -m benchmarks.startup
+'''
+
+def make_store(users=1000, channels=100, messages=100000, seed=0):
+    '''
+    Builds a plain store shaped like the one the server builds
+
+    Arguments:
+        users (int)     - number of users
+        channels (int)  - number of channels, each with a tenth of the users
+        messages (int)  - number of messages, spread over the channels
+
+    Return Value:
+        store (dict)
+    '''
+    rand = random.Random(seed)
+    stats = lambda kind: [{f"num_{kind}": 0, "time_stamp": 0}]
+    store = {
+        "users":                {},
+        "channels":             {},
+        "dms":                  {},
+        "messages":             {},
+        "session_id_tracker":   users,
+        "dm_id_tracker":        0,
+        "message_id_tracker":   messages,
+        "users_stats": {
+            "channels_exist":   stats("channels_exist"),
+            "dms_exist":        stats("dms_exist"),
+            "messages_exist":   stats("messages_exist"),
+            "utilization_rate": 0
+        }
+    }
+    for u_id in range(users):
+        store["users"][u_id] = {
+            "email":            f"user{u_id}@unsw.edu.au",
+            "name_first":       "first",
+            "name_last":        f"last{u_id}",
+            "password":         "0" * 64,
+            "handle_str":       f"firstlast{u_id}",
+            "is_owner":         u_id == 0,
+            "sessions":         [u_id],
+            "profile_img_url":  "http://localhost:8080/images/default.jpg",
+            "notifications":    [],
+            "user_stats": {
+                "channels_joined":  stats("channels_joined"),
+                "dms_joined":       stats("dms_joined"),
+                "messages_sent":    stats("messages_sent"),
+                "involvement_rate": 0
+            }
+        }
+    for channel_id in range(channels):
+        members = rand.sample(range(users), max(users // 10, 1))
+        store["channels"][channel_id] = {
+            "channel_name":     f"channel{channel_id}",
+            "is_public":        True,
+            "owner_members":    members[:1],
+            "all_members":      members,
+            "messages":         [],
+            "standup":          {"is_active": False, "message_queue": [], "time_finish": 0}
+        }
+    for message_id in range(messages):
+        channel = store["channels"][rand.randrange(channels)]
+        channel["messages"].append(message_id)
+        store["messages"][message_id] = {
+            "message_id":   message_id,
+            "u_id":         rand.choice(channel["all_members"]),
+            "message":      "".join(rand.choice("abcdefghij ") for _ in range(rand.randrange(10, 200))),
+            "time_created": 1637000000 + message_id,
+            "reacts":       [{"react_id": 1, "u_ids": []}],
+            "is_pinned":    False
+        }
+    return store
+
+def timed(function, repeat=5):
+    # median time in seconds of calling function `repeat` times
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return sorted(times)[len(times) // 2]
+
+def temp_path():
+    # path for a database.p in a new temporary directory
+    return tempfile.mkdtemp(prefix="streams-bench-") + "/database.p"
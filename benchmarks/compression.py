@@ -0,0 +1,82 @@
+import os
+import random
+import shutil
+import sys
+import time
+from benchmarks.common import make_store, temp_path
+from benchmarks.send_latency import percentile
+from src import snapshot_format
+from src.data_store import Datastore
+from src.journal import LazyDict
+
+'''
+compression.py
+
+Size of database.p with and without the text of archived messages
+compressed, on a synthetic corpus of messages of words drawn with a Zipf
+distribution from a vocabulary, as chat tends to be, and the cost of reading
+them back: the p50 and p99 latency of reading a page of 50 messages of a
+channel from a paged store, which decodes (and so decompresses) the page of
+the snapshot each message is on, and the time to read every message once,
+as a search of a long history does. Every message is archived.
+
+    python3 -m benchmarks.compression [messages]
+'''
+
+VOCABULARY = 5000
+
+# pages of a channel read, and channels to read them from
+READS = 200
+
+def corpus(messages, seed=0):
+    # make_store with the text of each message drawn from the vocabulary
+    rand = random.Random(seed)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    vocabulary = ["".join(rand.choice(letters) for _ in range(rand.randint(2, 9))) for _ in range(VOCABULARY)]
+    weights = [1 / rank for rank in range(1, VOCABULARY + 1)]
+    store = make_store(messages=messages, seed=seed)
+    for message in store["messages"].values():
+        message["message"] = " ".join(rand.choices(vocabulary, weights, k=rand.randint(3, 60)))[:1000]
+    return store
+
+def read_pages(path, seed=0):
+    # latency of reading the newest page of random channels, and the time to read every message
+    data_store = Datastore(path, "paged")
+    data_store.load()
+    store = data_store.get()
+    rand = random.Random(seed)
+    times = []
+    for _ in range(READS):
+        channel_id = rand.randrange(len(store["channels"]))
+        messages = store["messages"]
+        if isinstance(messages, LazyDict):
+            # forget what the last read left in memory
+            messages._hot.clear()
+        start = time.perf_counter()
+        data_store.page_messages("channel", channel_id, 0)
+        times.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for message_id in store["messages"].keys():
+        store["messages"][message_id]["message"]
+    return times, time.perf_counter() - start
+
+def main(messages):
+    store = corpus(messages)
+    text = sum(len(message["message"].encode()) for message in store["messages"].values())
+    print(f"{messages} messages, {text / 2 ** 20:.1f} MB of text")
+    print(f"{'compressed':>10} {'size (MB)':>10} {'ratio':>7} {'page p50 (ms)':>14} {'page p99 (ms)':>14} {'read all (s)':>13}")
+    sizes = {}
+    for archive_age in (None, 0):
+        path = temp_path()
+        with open(path, 'wb') as FILE:
+            snapshot_format.dump(store, FILE, {"journal_seq": 0}, archive_age)
+        sizes[archive_age] = os.path.getsize(path)
+        times, read_all = read_pages(path)
+        print(f"{'no' if archive_age is None else 'yes':>10} {sizes[archive_age] / 2 ** 20:>10.1f} "
+              f"{sizes[None] / sizes[archive_age]:>7.2f} {percentile(times, 0.5) * 1000:>14.2f} "
+              f"{percentile(times, 0.99) * 1000:>14.2f} {read_all:>13.2f}")
+        shutil.rmtree(os.path.dirname(path))
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
@@ -0,0 +1,98 @@
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from benchmarks.common import temp_path
+
+'''
+concurrency.py
+
+Requests per second served by several threads at once under a mixed load,
+mostly channel/messages, search and users/all with some message/send,
+with read only endpoints sharing the data store's lock ("shared") and with
+every request holding it on its own ("exclusive"). Each run is a fresh
+process in a temporary directory, as the server's data store is created
+when it is imported.
+
+    python3 -m benchmarks.concurrency [persistence] [threads] [seconds]
+'''
+
+# fraction of requests that send a message
+WRITE_FRACTION = 0.1
+
+def worker(persistence, mode, threads, seconds):
+    root = os.getcwd()
+    os.chdir(os.path.dirname(temp_path()))
+    sys.path.insert(0, root)
+    from src import config
+    config.persistence = persistence
+    from src.data_store import data_store
+    from src import server
+
+    data_store.load()
+    if mode == "exclusive":
+        server.READ_ONLY_ENDPOINTS = {}
+    client = server.APP.test_client()
+    user = json.loads(client.post("/auth/register/v2", json={
+        "email": "bench@unsw.edu.au", "password": "password", "name_first": "bench", "name_last": "mark"
+    }).get_data())
+    token = user["token"]
+    for index in range(20):
+        client.post("/auth/register/v2", json={
+            "email": f"bench{index}@unsw.edu.au", "password": "password", "name_first": "bench", "name_last": "mark"
+        })
+    channel_id = json.loads(client.post("/channels/create/v2", json={
+        "token": token, "name": "bench", "is_public": True
+    }).get_data())["channel_id"]
+    for index in range(500):
+        client.post("/message/send/v1", json={"token": token, "channel_id": channel_id, "message": f"hello {index}"})
+
+    counts = []
+    stop = time.perf_counter() + seconds
+    def load(seed):
+        rand = random.Random(seed)
+        client = server.APP.test_client()
+        count = 0
+        while time.perf_counter() < stop:
+            choice = rand.random()
+            if choice < WRITE_FRACTION:
+                response = client.post("/message/send/v1", json={"token": token, "channel_id": channel_id, "message": "hi"})
+            elif choice < 0.55:
+                response = client.get("/channel/messages/v2", query_string={"token": token, "channel_id": channel_id, "start": 0})
+            elif choice < 0.8:
+                response = client.get("/search/v1", query_string={"token": token, "query_str": "hello 4"})
+            else:
+                response = client.get("/users/all/v1", query_string={"token": token})
+            assert response.status_code == 200
+            count += 1
+        counts.append(count)
+
+    running = [threading.Thread(target=load, args=(seed,)) for seed in range(threads)]
+    for thread in running:
+        thread.start()
+    for thread in running:
+        thread.join()
+    print(sum(counts) / seconds)
+    shutil.rmtree(os.getcwd())
+
+def main(persistence, threads, seconds):
+    print(f"{'lock':>10} {'threads':>8} {'requests/s':>11}")
+    for mode in ("exclusive", "shared"):
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.concurrency", "--worker", persistence, mode, str(threads), str(seconds)],
+            check=True, capture_output=True, text=True
+        ).stdout
+        print(f"{mode:>10} {threads:>8} {float(output.splitlines()[-1]):>11.0f}")
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--worker"]:
+        worker(sys.argv[2], sys.argv[3], int(sys.argv[4]), float(sys.argv[5]))
+    else:
+        from src import config
+        main(sys.argv[1] if len(sys.argv) > 1 else config.persistence,
+             int(sys.argv[2]) if len(sys.argv) > 2 else 8,
+             float(sys.argv[3]) if len(sys.argv) > 3 else 5)
@@ -0,0 +1,39 @@
+import gc
+import os
+import shutil
+import sys
+import time
+from benchmarks.common import make_store, temp_path
+from src.data_store import Datastore
+
+'''
+first_request.py
+
+Time from starting to load the store to having served a first page of a
+channel's messages, with the messages loaded in full ("journal") or read in
+from the snapshot when they are accessed ("paged").
+
+    python3 -m benchmarks.first_request [messages ...]
+'''
+
+def main(sizes):
+    print(f"{'messages':>10} {'storage':>10} {'load (s)':>10} {'first page (ms)':>16} {'total (s)':>10}")
+    for messages in sizes:
+        path = temp_path()
+        Datastore(path, "snapshot").set(make_store(messages=messages))
+        for persistence in ("journal", "paged"):
+            start = time.perf_counter()
+            data_store = Datastore(path, persistence)
+            data_store.load()
+            loaded = time.perf_counter()
+            data_store.page_messages("channel", 0, 0)
+            served = time.perf_counter()
+            print(f"{messages:>10} {persistence:>10} {loaded - start:>10.3f} "
+                  f"{(served - loaded) * 1000:>16.1f} {served - start:>10.3f}")
+            # so the next run doesn't pay for collecting this one
+            del data_store
+            gc.collect()
+        shutil.rmtree(os.path.dirname(path))
+
+if __name__ == "__main__":
+    main([int(size) for size in sys.argv[1:]] or [10000, 100000, 1000000])
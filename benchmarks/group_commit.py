@@ -0,0 +1,67 @@
+import os
+import shutil
+import sys
+import threading
+import time
+from benchmarks.common import temp_path
+from benchmarks.send_latency import percentile
+from src.data_store import Datastore
+
+'''
+group_commit.py
+
+Messages sent per second, disk writes per second and the p50 and p99
+latency of a send, for more and more threads sending at once, with and
+without group commit. Every write is synced before it returns (fsync
+"always"), as that is when each write costs the most.
+
+    python3 -m benchmarks.group_commit [persistence] [seconds]
+'''
+
+THREADS = (1, 4, 16, 64)
+
+def run(persistence, group_commit, threads, seconds):
+    path = temp_path()
+    data_store = Datastore(path, persistence, "always", group_commit)
+    data_store.load()
+    with data_store.write() as store:
+        store["channels"][0] = {"channel_name": "bench", "all_members": [0], "messages": []}
+        data_store.set(store)
+
+    times = []
+    stop = time.perf_counter() + seconds
+    def send():
+        while time.perf_counter() < stop:
+            start = time.perf_counter()
+            with data_store.transaction() as store:
+                data_store.insert_message("channel", 0, {
+                    "message_id":   store["message_id_tracker"],
+                    "u_id":         0,
+                    "message":      "hello",
+                    "time_created": 0,
+                    "reacts":       [{"react_id": 1, "u_ids": []}],
+                    "is_pinned":    False
+                })
+                data_store.set(store)
+            times.append(time.perf_counter() - start)
+
+    writes = data_store.writes
+    running = [threading.Thread(target=send) for _ in range(threads)]
+    for thread in running:
+        thread.start()
+    for thread in running:
+        thread.join()
+    writes = data_store.writes - writes
+    shutil.rmtree(os.path.dirname(path))
+    return len(times) / seconds, writes / seconds, percentile(times, 0.5), percentile(times, 0.99)
+
+def main(persistence, seconds):
+    print(f"{'group':>6} {'threads':>8} {'sends/s':>8} {'writes/s':>9} {'p50 (ms)':>9} {'p99 (ms)':>9}")
+    for group_commit in (False, True):
+        for threads in THREADS:
+            sends, writes, p50, p99 = run(persistence, group_commit, threads, seconds)
+            print(f"{'on' if group_commit else 'off':>6} {threads:>8} {sends:>8.0f} {writes:>9.0f} {p50 * 1000:>9.2f} {p99 * 1000:>9.2f}")
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else "journal",
+         float(sys.argv[2]) if len(sys.argv) > 2 else 3)
@@ -0,0 +1,75 @@
+import os
+import shutil
+import sys
+import threading
+import time
+from benchmarks.common import make_store, temp_path
+from benchmarks.send_latency import percentile
+from src.data_store import Datastore
+from src.message_gc import MessageCollector
+
+'''
+message_gc.py
+
+p50 and p99 latency of sending a message while the collector of orphaned
+messages deletes the messages of removed dms, half of every message in the
+workspace, next to the same sends with nothing collecting. The collector
+either goes a batch at a time ("incremental", with the default batch and
+pause, see config.message_gc_batch), or deletes every orphan in one unit of
+work ("all at once"), which is what holding the store for the whole
+collection costs.
+
+    python3 -m benchmarks.message_gc [messages]
+'''
+
+# sends timed in each run
+SENDS = 500
+
+def orphaned_store(messages):
+    # make_store with the messages of every other channel moved into a dm, then the dm removed
+    store = make_store(messages=messages)
+    for channel_id in range(0, len(store["channels"]), 2):
+        store["channels"][channel_id]["messages"] = []
+    return store
+
+def run(messages, mode):
+    path = temp_path()
+    data_store = Datastore(path, "journal", fsync="never")
+    data_store.set(orphaned_store(messages))
+
+    collector = None
+    if mode == "incremental":
+        collector = MessageCollector(data_store)
+    elif mode == "all at once":
+        collector = MessageCollector(data_store, batch=messages, pause=0)
+    cycles = []
+    running = threading.Thread(target=lambda: cycles.append(collector.collect())) if collector else None
+    if running:
+        running.start()
+
+    times = []
+    for index in range(SENDS):
+        start = time.perf_counter()
+        with data_store.write() as store:
+            data_store.insert_message("channel", 1, {
+                "message_id": None, "u_id": 0, "message": "hi", "time_created": 0,
+                "reacts": [{"react_id": 1, "u_ids": []}], "is_pinned": False
+            })
+            data_store.set(store)
+        times.append(time.perf_counter() - start)
+        time.sleep(0.002)
+    if running:
+        running.join()
+    shutil.rmtree(os.path.dirname(path))
+    return times, cycles[0] if cycles else None
+
+def main(messages):
+    print(f"{'collector':>12} {'send p50':>9} {'send p99':>9} {'send max':>9}  (ms) {'reclaimed':>10} {'MB':>6} {'cycle (s)':>10}")
+    for mode in ("none", "incremental", "all at once"):
+        times, cycle = run(messages, mode)
+        reclaimed = f"{cycle['records']:>10} {cycle['bytes'] / 2 ** 20:>6.1f} {cycle['duration']:>10.2f}" if cycle else ""
+        print(f"{mode:>12} {percentile(times, 0.5) * 1000:>9.2f} {percentile(times, 0.99) * 1000:>9.2f} "
+              f"{max(times) * 1000:>9.2f}       {reclaimed}")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
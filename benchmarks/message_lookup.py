@@ -0,0 +1,52 @@
+import os
+import random
+import shutil
+import sys
+import time
+from benchmarks.common import make_store, temp_path, timed
+from src.data_store import Datastore
+
+'''
+message_lookup.py
+
+Time to find the channel a message is in, as message/edit, remove, pin,
+unpin, share and react do, for workspaces of a growing number of messages:
+walking the messages of every channel until the message turns up ("scan"),
+which is what they did before, next to looking it up in the Datastore's
+index of message locations ("index", see indexes.py), and the time to build
+the index the first time it is used.
+
+    python3 -m benchmarks.message_lookup [messages ...]
+'''
+
+# lookups timed for each size
+LOOKUPS = 200
+
+def scan(store, message_id):
+    for channel_id, channel in store["channels"].items():
+        if message_id in channel["messages"]:
+            return ("channel", channel_id)
+    for dm_id, dm in store["dms"].items():
+        if message_id in dm["messages"]:
+            return ("dm", dm_id)
+
+def main(sizes):
+    print(f"{'messages':>9} {'scan (ms)':>10} {'index (ms)':>11} {'build (ms)':>11}")
+    for messages in sizes:
+        path = temp_path()
+        data_store = Datastore(path, "snapshot")
+        data_store.set(make_store(messages=messages))
+        store = data_store.get()
+        message_ids = random.Random(0).sample(range(messages), LOOKUPS)
+        locations = data_store.message_locations
+
+        start = time.perf_counter()
+        locations.locate(store, 0)
+        built = time.perf_counter() - start
+        scanned = timed(lambda: [scan(store, message_id) for message_id in message_ids])
+        indexed = timed(lambda: [locations.locate(store, message_id) for message_id in message_ids])
+        print(f"{messages:>9} {scanned / LOOKUPS * 1000:>10.3f} {indexed / LOOKUPS * 1000:>11.4f} {built * 1000:>11.1f}")
+        shutil.rmtree(os.path.dirname(path))
+
+if __name__ == "__main__":
+    main([int(size) for size in sys.argv[1:]] or [10000, 100000, 1000000])
@@ -0,0 +1,55 @@
+import os
+import shutil
+import sys
+import time
+from benchmarks.common import make_store, temp_path
+from src import migrations, snapshot_format
+from src.data_store import Datastore
+
+'''
+migrations.py
+
+Time to load a snapshot written before a migration of every message and
+every channel was added, and to read the newest page of a channel once it
+has loaded, with the records upgraded as they are accessed, next to
+upgrading every record before the store is used, which is what a restart
+that rewrote the records up front would wait for.
+
+    python3 -m benchmarks.migrations [persistence] [messages]
+'''
+
+def add_edited(message):
+    message.setdefault("is_edited", False)
+
+def add_topic(channel):
+    channel.setdefault("topic", "")
+
+def main(persistence, messages):
+    path = temp_path()
+    with open(path, 'wb') as FILE:
+        snapshot_format.dump(make_store(messages=messages), FILE, {"journal_seq": 0})
+    migrations.MIGRATIONS["messages"].append(add_edited)
+    migrations.MIGRATIONS["channels"].append(add_topic)
+
+    print(f"{'upgrade':>8} {'load (s)':>9} {'first page (ms)':>16}")
+    for eager in (True, False):
+        start = time.perf_counter()
+        data_store = Datastore(path, persistence)
+        data_store.load()
+        store = data_store.get()
+        if eager:
+            for collection in ("channels", "messages"):
+                for _ in store[collection].values():
+                    pass
+        loaded = time.perf_counter() - start
+
+        start = time.perf_counter()
+        page = data_store.page_messages("channel", 0, 0)
+        assert all("is_edited" in message for message in page)
+        first_page = time.perf_counter() - start
+        print(f"{'eager' if eager else 'lazy':>8} {loaded:>9.2f} {first_page * 1000:>16.2f}")
+    shutil.rmtree(os.path.dirname(path))
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else "journal",
+         int(sys.argv[2]) if len(sys.argv) > 2 else 200000)
@@ -0,0 +1,71 @@
+import os
+import shutil
+import sys
+import time
+from benchmarks.common import temp_path
+
+'''
+register.py
+
+Time to register a growing number of users who all have the same name, so
+every one after the first gets "johnsmith" with a number after it, each
+registration a transaction of its own as it is on the server. Handles are
+looked up in the Datastore's index of handles, which remembers the next
+number to try after each one (see indexes.Handles). For comparison, "scan"
+is the time the handle of the next John Smith took to find before, trying
+each number in turn against every user.
+
+    python3 -m benchmarks.register [users ...]
+'''
+
+# most users "scan" is timed for, as it grows with the square of them
+SCAN_USERS = 10000
+
+def scan(users, handle):
+    # the handle generate_handle gave before the index, trying every user for each number
+    def is_taken(handle):
+        return any(user["handle_str"] == handle for user in users.values())
+    if is_taken(handle):
+        number = 0
+        while is_taken(handle + str(number)):
+            number += 1
+        handle = handle + str(number)
+    return handle
+
+def main(sizes):
+    root = os.getcwd()
+    os.chdir(os.path.dirname(temp_path()))
+    sys.path.insert(0, root)
+    from src import config
+    config.persistence = "journal"
+    config.fsync = "never"
+    from src.auth import auth_register_v1
+    from src.data_store import data_store
+    from src.other import clear_v1
+
+    print(f"{'users':>7} {'register (s)':>13} {'each (ms)':>10} {'last (ms)':>10} {'scan (ms)':>10}")
+    for users in sizes:
+        with data_store.transaction():
+            clear_v1()
+        start = time.perf_counter()
+        for index in range(users):
+            last = time.perf_counter()
+            with data_store.transaction():
+                auth_register_v1(f"john{index}@unsw.edu.au", "password", "John", "Smith")
+            last = time.perf_counter() - last
+        total = time.perf_counter() - start
+
+        scanned = "-"
+        if users <= SCAN_USERS:
+            start = time.perf_counter()
+            scan(data_store.get()["users"], "johnsmith")
+            scanned = f"{(time.perf_counter() - start) * 1000:.1f}"
+        print(f"{users:>7} {total:>13.2f} {total / users * 1000:>10.3f} {last * 1000:>10.3f} {scanned:>10}")
+
+    data_store.close()
+    directory = os.getcwd()
+    os.chdir(root)
+    shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    main([int(size) for size in sys.argv[1:]] or [1000, 10000, 100000])
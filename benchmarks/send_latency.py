@@ -0,0 +1,72 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from benchmarks.common import temp_path
+
+'''
+send_latency.py
+
+p50 and p99 latency of message/send/v1 under each fsync policy, with the
+server's persistence (see config.py) unless one is given. Each policy is
+run in a fresh process in a temporary directory, as the server's data
+store is created when it is imported.
+
+    python3 -m benchmarks.send_latency [persistence] [messages]
+'''
+
+POLICIES = ("always", "interval", "never")
+
+def percentile(times, fraction):
+    return sorted(times)[min(int(len(times) * fraction), len(times) - 1)]
+
+def worker(persistence, fsync, messages):
+    # sends `messages` messages through the server, printing the latency of each
+    root = os.getcwd()
+    os.chdir(os.path.dirname(temp_path()))
+    sys.path.insert(0, root)
+    from src import config
+    config.persistence = persistence
+    config.fsync = fsync
+    from src.data_store import data_store
+    from src.server import APP
+
+    data_store.load()
+    client = APP.test_client()
+    user = json.loads(client.post("/auth/register/v2", json={
+        "email": "bench@unsw.edu.au", "password": "password", "name_first": "bench", "name_last": "mark"
+    }).get_data())
+    channel = json.loads(client.post("/channels/create/v2", json={
+        "token": user["token"], "name": "bench", "is_public": True
+    }).get_data())
+
+    times = []
+    for index in range(messages):
+        start = time.perf_counter()
+        response = client.post("/message/send/v1", json={
+            "token": user["token"], "channel_id": channel["channel_id"], "message": f"message {index}"
+        })
+        times.append(time.perf_counter() - start)
+        assert response.status_code == 200
+    print(json.dumps(times))
+    shutil.rmtree(os.getcwd())
+
+def main(persistence, messages):
+    print(f"{'fsync':>10} {'p50 (ms)':>10} {'p99 (ms)':>10}")
+    for fsync in POLICIES:
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.send_latency", "--worker", persistence, fsync, str(messages)],
+            check=True, capture_output=True, text=True
+        ).stdout
+        times = json.loads(output.splitlines()[-1])
+        print(f"{fsync:>10} {percentile(times, 0.5) * 1000:>10.2f} {percentile(times, 0.99) * 1000:>10.2f}")
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--worker"]:
+        worker(sys.argv[2], sys.argv[3], int(sys.argv[4]))
+    else:
+        from src import config
+        main(sys.argv[1] if len(sys.argv) > 1 else config.persistence,
+             int(sys.argv[2]) if len(sys.argv) > 2 else 2000)
@@ -0,0 +1,48 @@
+import os
+import pickle
+import shutil
+import sys
+from benchmarks.common import make_store, temp_path, timed
+from src import snapshot_format
+from src.data_store import Datastore
+
+'''
+snapshot_format.py
+
+Compares the size of a pickled snapshot with one in snapshot_format, the
+time to read each from disk, and the time to load each into a Datastore
+ready to serve requests. Reading a snapshot_format file already builds the
+tracked messages, which the pickle only gets once it is loaded.
+
+    python3 -m benchmarks.snapshot_format [messages ...]
+'''
+
+def main(sizes):
+    print(f"{'messages':>10} {'format':>10} {'size (MB)':>10} {'read (s)':>10} {'load (s)':>10}")
+    for messages in sizes:
+        store = make_store(messages=messages)
+        for name in ("pickle", "snapshot"):
+            path = temp_path()
+            with open(path, 'wb') as FILE:
+                if name == "pickle":
+                    pickle.dump(store, FILE)
+                    pickle.dump({"journal_seq": 0}, FILE)
+                else:
+                    snapshot_format.dump(store, FILE, {"journal_seq": 0})
+
+            def read():
+                with open(path, 'rb') as FILE:
+                    if name == "pickle":
+                        snapshot_format.load_pickle(FILE)
+                    else:
+                        snapshot_format.load(FILE)
+
+            def load():
+                Datastore(path, "snapshot").load()
+
+            size = os.path.getsize(path) / 1024 / 1024
+            print(f"{messages:>10} {name:>10} {size:>10.1f} {timed(read, 3):>10.3f} {timed(load, 3):>10.3f}")
+            shutil.rmtree(os.path.dirname(path))
+
+if __name__ == "__main__":
+    main([int(size) for size in sys.argv[1:]] or [1000000])
@@ -0,0 +1,98 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from benchmarks.common import temp_path
+from benchmarks.send_latency import percentile
+
+'''
+snapshot_reads.py
+
+p50 and p99 latency of message/send/v1 while other threads keep searching a
+large channel, with search holding the data store's lock for reading
+("read") and with it working on a snapshot ("snapshot"). Under the lock a
+send waits for the search in progress to finish; on a snapshot it only
+shares the interpreter with it. Each run is a fresh process in a temporary
+directory, as the server's data store is created when it is imported.
+
+    python3 -m benchmarks.snapshot_reads [persistence] [messages] [searchers]
+'''
+
+# messages sent while the searches run
+SENDS = 200
+
+def worker(persistence, mode, messages, searchers):
+    root = os.getcwd()
+    os.chdir(os.path.dirname(temp_path()))
+    sys.path.insert(0, root)
+    from src import config
+    config.persistence = persistence
+    from src.data_store import data_store
+    from src import server
+
+    data_store.load()
+    server.READ_ONLY_ENDPOINTS["search"] = mode
+    client = server.APP.test_client()
+    token = json.loads(client.post("/auth/register/v2", json={
+        "email": "bench@unsw.edu.au", "password": "password", "name_first": "bench", "name_last": "mark"
+    }).get_data())["token"]
+    channel_id = json.loads(client.post("/channels/create/v2", json={
+        "token": token, "name": "bench", "is_public": True
+    }).get_data())["channel_id"]
+    # sending this many through the server would take most of the run
+    with data_store.write() as store:
+        for index in range(messages):
+            data_store.insert_message("channel", channel_id, {
+                "message_id":   store["message_id_tracker"],
+                "u_id":         0,
+                "message":      f"hello {index}",
+                "time_created": 0,
+                "reacts":       [{"react_id": 1, "u_ids": []}],
+                "is_pinned":    False
+            })
+        data_store.set(store)
+
+    done = threading.Event()
+    def search():
+        client = server.APP.test_client()
+        while not done.is_set():
+            response = client.get("/search/v1", query_string={"token": token, "query_str": "hello 4"})
+            assert response.status_code == 200
+
+    running = [threading.Thread(target=search) for _ in range(searchers)]
+    for thread in running:
+        thread.start()
+    times = []
+    for index in range(SENDS):
+        start = time.perf_counter()
+        response = client.post("/message/send/v1", json={"token": token, "channel_id": channel_id, "message": "hi"})
+        times.append(time.perf_counter() - start)
+        assert response.status_code == 200
+        time.sleep(0.005)
+    done.set()
+    for thread in running:
+        thread.join()
+    print(json.dumps(times))
+    shutil.rmtree(os.getcwd())
+
+def main(persistence, messages, searchers):
+    print(f"{'search':>10} {'p50 (ms)':>10} {'p99 (ms)':>10}")
+    for mode in ("read", "snapshot"):
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.snapshot_reads", "--worker", persistence, mode, str(messages), str(searchers)],
+            check=True, capture_output=True, text=True
+        ).stdout
+        times = json.loads(output.splitlines()[-1])
+        print(f"{mode:>10} {percentile(times, 0.5) * 1000:>10.2f} {percentile(times, 0.99) * 1000:>10.2f}")
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--worker"]:
+        worker(sys.argv[2], sys.argv[3], int(sys.argv[4]), int(sys.argv[5]))
+    else:
+        from src import config
+        main(sys.argv[1] if len(sys.argv) > 1 else config.persistence,
+             int(sys.argv[2]) if len(sys.argv) > 2 else 100000,
+             int(sys.argv[3]) if len(sys.argv) > 3 else 2)
@@ -0,0 +1,37 @@
+import os
+import shutil
+import sys
+from benchmarks.common import make_store, temp_path, timed
+from src.data_store import Datastore
+
+'''
+startup.py
+
+Compares loading the store from a single database.p with loading it from one
+shard per collection, and the cost of a profile rename under each.
+
+    python3 -m benchmarks.startup [messages ...]
+'''
+
+def main(sizes):
+    print(f"{'messages':>10} {'storage':>10} {'load (s)':>10} {'rename (ms)':>12}")
+    for messages in sizes:
+        store = make_store(messages=messages)
+        for persistence in ("snapshot", "sharded"):
+            path = temp_path()
+            data_store = Datastore(path, persistence)
+            data_store.set(store)
+
+            def load():
+                Datastore(path, persistence).load()
+
+            def rename():
+                users = data_store.get()["users"]
+                users[0]["name_first"] = "renamed" if users[0]["name_first"] != "renamed" else "first"
+                data_store.set(data_store.get())
+
+            print(f"{messages:>10} {persistence:>10} {timed(load):>10.3f} {timed(rename) * 1000:>12.1f}")
+            shutil.rmtree(os.path.dirname(path))
+
+if __name__ == "__main__":
+    main([int(size) for size in sys.argv[1:]] or [10000, 100000, 500000])
@@ -0,0 +1,133 @@
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import time
+from benchmarks.common import temp_path
+
+'''
+store_server.py
+
+Requests per second served by 1 to N server processes sharing one store
+daemon, under the same mixed load as benchmarks.concurrency, next to a
+single process with the store of its own. Each server process sends its
+requests through the app directly rather than over HTTP, so the figures
+are of the app and the store alone. Only as many processes as there are
+cores can run at once, so expect no gain past os.cpu_count().
+
+    python3 -m benchmarks.store_server [processes] [seconds]
+'''
+
+# fraction of requests that send a message
+WRITE_FRACTION = 0.1
+
+def setup(socket, persistence):
+    # registers a user, with a channel of 500 messages, and returns their token
+    from src import config
+    config.persistence = persistence
+    config.store_socket = socket
+    from src import server
+
+    server.data_store.load()
+    client = server.APP.test_client()
+    token = json.loads(client.post("/auth/register/v2", json={
+        "email": "bench@unsw.edu.au", "password": "password", "name_first": "bench", "name_last": "mark"
+    }).get_data())["token"]
+    for index in range(20):
+        client.post("/auth/register/v2", json={
+            "email": f"bench{index}@unsw.edu.au", "password": "password", "name_first": "bench", "name_last": "mark"
+        })
+    channel_id = json.loads(client.post("/channels/create/v2", json={
+        "token": token, "name": "bench", "is_public": True
+    }).get_data())["channel_id"]
+    for index in range(500):
+        client.post("/message/send/v1", json={"token": token, "channel_id": channel_id, "message": f"hello {index}"})
+    return server, token, channel_id
+
+def load(server, token, channel_id, seconds, seed):
+    # number of requests sent in `seconds`
+    rand = random.Random(seed)
+    client = server.APP.test_client()
+    count = 0
+    stop = time.perf_counter() + seconds
+    while time.perf_counter() < stop:
+        choice = rand.random()
+        if choice < WRITE_FRACTION:
+            response = client.post("/message/send/v1", json={"token": token, "channel_id": channel_id, "message": "hi"})
+        elif choice < 0.55:
+            response = client.get("/channel/messages/v2", query_string={"token": token, "channel_id": channel_id, "start": 0})
+        elif choice < 0.8:
+            response = client.get("/search/v1", query_string={"token": token, "query_str": "hello 4"})
+        else:
+            response = client.get("/users/all/v1", query_string={"token": token})
+        assert response.status_code == 200
+        count += 1
+    return count
+
+def worker(directory, seconds, seed, start):
+    # one server process of a shared store, started at the same time as the rest
+    os.chdir(directory)
+    from src import config
+    config.persistence = "remote"
+    from src import server
+    server.data_store.load()
+    with open("setup.json") as FILE:
+        token, channel_id = json.load(FILE)
+    time.sleep(max(start - time.time(), 0))
+    print(load(server, token, channel_id, seconds, seed))
+
+def local(seconds):
+    # a single process with a store of its own
+    os.chdir(os.path.dirname(temp_path()))
+    server, token, channel_id = setup("database.sock", "journal")
+    print(load(server, token, channel_id, seconds, 0))
+    shutil.rmtree(os.getcwd())
+
+def run(*args):
+    return subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.store_server", *args],
+        stdout=subprocess.PIPE, text=True, cwd=os.getcwd(), env={**os.environ, "PYTHONPATH": os.getcwd()}
+    )
+
+def main(processes, seconds):
+    print(f"{'store':>10} {'processes':>10} {'requests/s':>11}")
+    output = run("--local", str(seconds)).communicate()[0]
+    print(f"{'local':>10} {1:>10} {int(output.splitlines()[-1]) / seconds:>11.0f}")
+
+    counts = [1]
+    while counts[-1] * 2 <= processes:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != processes:
+        counts.append(processes)
+    for count in counts:
+        directory = os.path.dirname(temp_path())
+        daemon = subprocess.Popen([sys.executable, "-m", "src.store_server", "database.sock"], cwd=directory,
+                                  stdout=subprocess.DEVNULL, env={**os.environ, "PYTHONPATH": os.getcwd()})
+        while not os.path.exists(os.path.join(directory, "database.sock")):
+            time.sleep(0.01)
+        seeder = run("--setup", directory)
+        seeder.communicate()
+
+        start = time.time() + 2
+        workers = [run("--worker", directory, str(seconds), str(seed), str(start)) for seed in range(count)]
+        total = sum(int(worker.communicate()[0].splitlines()[-1]) for worker in workers)
+        daemon.terminate()
+        daemon.wait()
+        shutil.rmtree(directory)
+        print(f"{'daemon':>10} {count:>10} {total / seconds:>11.0f}")
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--worker"]:
+        worker(sys.argv[2], float(sys.argv[3]), int(sys.argv[4]), float(sys.argv[5]))
+    elif sys.argv[1:2] == ["--local"]:
+        local(float(sys.argv[2]))
+    elif sys.argv[1:2] == ["--setup"]:
+        os.chdir(sys.argv[2])
+        _, token, channel_id = setup("database.sock", "remote")
+        with open("setup.json", "w") as FILE:
+            json.dump([token, channel_id], FILE)
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count() or 1,
+             float(sys.argv[2]) if len(sys.argv) > 2 else 5)
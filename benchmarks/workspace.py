@@ -0,0 +1,64 @@
+import os
+import shutil
+import sys
+import time
+import tracemalloc
+from benchmarks.common import make_store, temp_path
+from src.data_store import Datastore
+from src.workspace import export_file, import_file, import_workspace
+
+'''
+workspace.py
+
+Time to export a workspace to JSON Lines and to import it again, and the
+most memory either takes on top of the store itself, for workspaces of a
+growing number of messages, which stays flat however big the workspace is.
+The import is loaded in one set of the store, next to setting the store
+once for each record read ("per record"), as a loader built on the
+server's functions would.
+
+    python3 -m benchmarks.workspace [messages ...]
+'''
+
+def timed(function):
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+def peak(function):
+    # most memory function allocates at once in MB, timed separately as tracing slows it down
+    tracemalloc.start()
+    function()
+    memory = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    tracemalloc.stop()
+    return memory
+
+def import_per_record(data_store, path):
+    # sets the store once for every record of the export
+    with open(path) as FILE:
+        plain = import_workspace(FILE)
+    store = data_store.get()
+    for collection in ("users", "channels", "dms", "messages"):
+        for key, record in plain[collection].items():
+            store[collection][key] = record
+            data_store.set(store)
+
+def main(sizes):
+    print(f"{'messages':>9} {'MB':>6} {'export (s)':>11} {'export peak (MB)':>17} {'import (s)':>11} {'per record (s)':>15}")
+    for messages in sizes:
+        path = temp_path()
+        data_store = Datastore(path, "journal", fsync="never")
+        data_store.set(make_store(messages=messages))
+        export_path = os.path.join(os.path.dirname(path), "workspace.jsonl")
+        exported = timed(lambda: export_file(data_store, export_path))
+        memory = peak(lambda: export_file(data_store, export_path))
+
+        imported = timed(lambda: import_file(Datastore(path + ".import", "journal", fsync="never"), export_path))
+        per_record = timed(lambda: import_per_record(Datastore(path + ".records", "journal", fsync="never"), export_path))
+
+        print(f"{messages:>9} {os.path.getsize(export_path) / 2 ** 20:>6.1f} {exported:>11.2f} {memory:>17.2f} "
+              f"{imported:>11.2f} {per_record:>15.2f}")
+        shutil.rmtree(os.path.dirname(path))
+
+if __name__ == "__main__":
+    main([int(size) for size in sys.argv[1:]] or [10000, 100000])
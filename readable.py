@@ -1,6 +1,6 @@
-import pickle
 import pprint
+from src.data_store import data_store
 
-with open("database.p", "rb") as FILE:
-    pprint.pprint(pickle.load(FILE))
-
+# snapshot + journal, the same state the server would restore
+data_store.load()
+pprint.pprint(data_store.get())
@@ -1,6 +1,12 @@
+import os
+import re
+import tempfile
+from src import config
 from src.error import AccessError, InputError
 from src.data_store import data_store
 from src.message import message_edit_v1
+from src.memory_report import report
+from src.message_gc import collector
 from src.sessions import get_auth_user_id
 
 def admin_user_remove_v1(token, u_id):
@@ -27,7 +33,6 @@ def admin_user_remove_v1(token, u_id):
     store = data_store.get()
     users = store["users"]
     channels = store["channels"]
-    dms = store["dms"]
     messages = store["messages"]
 
     # check if auth_user does not have owner permissions.
@@ -47,23 +52,16 @@ def admin_user_remove_v1(token, u_id):
         raise InputError(description="u_id refers to a user who is the only global owner")
 
 
-    # remove user from channels
-    for channel_info in channels.values():
-        channel_members = channel_info["all_members"]
-        channel_owners = channel_info["owner_members"]
+    # remove user from the channels they are a member of
+    for channel_id in data_store.joined("channel", u_id):
+        channel_owners = channels[channel_id]["owner_members"]
         if u_id in channel_owners:
             channel_owners.remove(u_id)
-        if u_id in channel_members:
-            channel_members.remove(u_id)
+        data_store.remove_member("channel", channel_id, u_id)
     
-    # remove user from dms
-    for dm_info in dms.values():
-        dm_members = dm_info["members"]
-        dm_owner = dm_info["owner"]
-        if u_id in dm_members:
-            dm_members.remove(u_id)
-        if u_id == dm_owner:
-            dm_owner = None
+    # remove user from the dms they are a member of
+    for dm_id in data_store.joined("dm", u_id):
+        data_store.remove_member("dm", dm_id, u_id)
     
     # Replace user's messages with 'Removed user'
     for message_info in messages.values():
@@ -81,6 +79,8 @@ def admin_user_remove_v1(token, u_id):
     user["sessions"] = []
 
     # Make handle_str and email reusable
+    data_store.emails.discard(store, user["email"])
+    data_store.handles.discard(store, user["handle_str"])
     user["handle_str"] = None
     user["email"] = None
 
@@ -144,4 +144,144 @@ def admin_userpermission_change_v1(token, u_id, permission_id):
         users[u_id]["is_owner"] = False
 
     data_store.set(store)
-    return {}
\ No newline at end of file
+    return {}
+
+
+def check_global_owner(token):
+    # raises an AccessError unless token belongs to a global owner
+    auth_user_id = get_auth_user_id(token)
+    if data_store.get()["users"][auth_user_id]["is_owner"] == False:
+        raise AccessError(description="Authorised User is not a global owner.")
+
+
+def admin_backup_v1(token):
+    '''
+    Writes a backup of the whole of Streams as it is now to the backup
+    directory, without holding up any other request.
+
+    Arguments:
+        token       (str): the given token
+
+    Exceptions:
+        AccessError:
+            - the authorised user is not a global owner
+            - invalid token
+
+    Return Value:
+        dictionary with the name of the backup ("backup"), and when it was
+        taken ("time_stamp")
+    '''
+
+    check_global_owner(token)
+
+    os.makedirs(config.backup_directory, exist_ok=True)
+    descriptor, temp_path = tempfile.mkstemp(suffix=".tmp", dir=config.backup_directory)
+    os.close(descriptor)
+    meta = data_store.backup(temp_path)
+
+    # named after when it was taken, and the number of changes it holds
+    backup = f"backup-{meta['time']}-{meta['version']}.p"
+    os.replace(temp_path, os.path.join(config.backup_directory, backup))
+    prune_backups()
+    return {"backup": backup, "time_stamp": meta["time"]}
+
+
+def prune_backups():
+    # removes the oldest backups in the backup directory, so no more than
+    # config.max_backups are kept
+    if config.max_backups is None:
+        return
+    backups = []
+    for name in os.listdir(config.backup_directory):
+        match = re.fullmatch(R'backup-(\d+)-(\d+)\.p', name)
+        if match:
+            backups.append((int(match[1]), int(match[2]), name))
+    backups.sort()
+    for _, _, name in backups[:max(len(backups) - config.max_backups, 0)]:
+        try:
+            os.remove(os.path.join(config.backup_directory, name))
+        except FileNotFoundError:
+            # already removed by a backup taken at the same time
+            pass
+
+
+def admin_restore_v1(token, backup):
+    '''
+    Replaces the whole of Streams with a backup written by admin_backup_v1.
+
+    Arguments:
+        token       (str): the given token
+        backup      (str): name of the backup
+
+    Exceptions:
+        InputError:
+            - backup does not refer to a backup in the backup directory
+        AccessError:
+            - the authorised user is not a global owner
+            - invalid token
+
+    Return Value:
+        dictionary with when the backup was taken ("time_stamp")
+    '''
+
+    check_global_owner(token)
+
+    path = os.path.join(config.backup_directory, str(backup))
+    if os.path.basename(str(backup)) != backup or not os.path.isfile(path):
+        raise InputError(description="Invalid backup. Doesn't exist.")
+
+    try:
+        meta = data_store.restore(path)
+    except ValueError:
+        raise InputError(description="Invalid backup. Not a backup of Streams.")
+    return {"time_stamp": meta.get("time")}
+
+
+def admin_gc_stats_v1(token):
+    '''
+    Reports what the collector of orphaned messages (see message_gc.py) has
+    reclaimed since the server started.
+
+    Arguments:
+        token       (str): the given token
+
+    Exceptions:
+        AccessError:
+            - the authorised user is not a global owner
+            - invalid token
+
+    Return Value:
+        dictionary with the number of cycles run ("cycles"), the number of
+        messages deleted ("records_reclaimed"), the size of their pickles
+        ("bytes_reclaimed"), and the last cycle run ("last_cycle")
+    '''
+
+    check_global_owner(token)
+
+    return collector.metrics()
+
+
+def admin_memory_report_v1(token):
+    '''
+    Reports what the memory the store takes is spent on, see memory_report.py,
+    going through the store a little at a time so other requests carry on.
+
+    Arguments:
+        token       (str): the given token
+
+    Exceptions:
+        AccessError:
+            - the authorised user is not a global owner
+            - invalid token
+
+    Return Value:
+        dictionary with the total size of the store in bytes ("bytes"), the
+        size of each of its top level values ("keys"), and the sizes of the
+        fields of each collection of records with its largest records
+        ("collections")
+    '''
+
+    with data_store.read():
+        check_global_owner(token)
+
+    return report(data_store)
@@ -37,13 +37,13 @@ def auth_login_v1(email, password):
 
     # Check if email and password combination is registered in users dict
     return_id = None
-    for u_id, user in users.items():
-        if user["email"] == email and user["password"] == get_hash(password):
-            # generate a new token for the user indicating a new session
-            return_id = u_id
-            session_id = generate_new_session_id()
-            token = get_token(u_id, session_id)
-            user["sessions"].append(session_id)
+    u_id = data_store.emails.find(store, email)
+    if u_id is not None and users[u_id]["password"] == get_hash(password):
+        # generate a new token for the user indicating a new session
+        return_id = u_id
+        session_id = generate_new_session_id()
+        token = get_token(u_id, session_id)
+        users[u_id]["sessions"].append(session_id)
 
     # Raise input error if user cannot be logged in
     if return_id == None:
@@ -54,31 +54,25 @@ def auth_login_v1(email, password):
         'token': token
     }
 
-def is_taken(users, handle):
+def is_taken(handle):
     '''
     Check if handle is already taken by another user
 
     Arguments:
-        users (list)  - list of users in data_store
         handle (str)  - name of handle
 
     Return Values:
         if handle is taken or not (bool)
     '''
+    return data_store.handles.find(data_store.get(), handle) is not None
 
-    for user in users.values():
-        if user["handle_str"] == handle:
-            return True
-    return False
-
-def generate_handle(name_first, name_last, users):
+def generate_handle(name_first, name_last):
     '''
     Generate handle using first and last name
 
     Arguments:
         name_first (str)    - user's first name
         name_last (str)     - user's last name
-        users (list)        - list of users in data_store
 
     Return Values:
         handle (str)
@@ -92,13 +86,7 @@ def generate_handle(name_first, name_last, users):
     handle = handle[:20]
 
     # If handle is taken, add smallest integer after current handle
-    if is_taken(users, handle):
-        duplicate_number = 0
-        while is_taken(users, handle + str(duplicate_number)):
-            duplicate_number += 1
-        handle = handle + str(duplicate_number)
-
-    return handle
+    return data_store.handles.unused(data_store.get(), handle)
 
 def get_init_stats():
     '''
@@ -205,9 +193,8 @@ def auth_register_v1(email, password, name_first, name_last):
     if not valid_email(email):
         raise InputError(description="Invalid email format")
     # - Email address is already being used by another user
-    for user in users.values():
-        if user["email"] == email:
-            raise InputError(description="Email already taken")
+    if data_store.emails.find(store, email) is not None:
+        raise InputError(description="Email already taken")
     if len(password) < 6:
         raise InputError(description="Password must be at least 6 characters")
     if not 1 <= len(name_first) <= 50:
@@ -216,7 +203,7 @@ def auth_register_v1(email, password, name_first, name_last):
         raise InputError(description="Last name must be between 1 and 50 characters long")
 
     # generate handle for user
-    handle = generate_handle(name_first, name_last, users)
+    handle = generate_handle(name_first, name_last)
     # generate u_id for user
     u_id = len(users)
     # start new session and generate token for user
@@ -238,6 +225,8 @@ def auth_register_v1(email, password, name_first, name_last):
         "notifications": [],
         "user_stats": init_stats,
     }
+    data_store.emails.add(store, email, u_id)
+    data_store.handles.add(store, handle, u_id)
     # If user is first user to register, they are a global owner
     if u_id == 0:
         users[u_id]["is_owner"] = True
@@ -307,14 +296,14 @@ def auth_passwordreset_request_v1(email):
     reset_code = ""
 
     # check if there is a user with the given email
-    for user_info in users.values():
-        if user_info["email"] == email:
-            user_found = True
-            # generate reset_code from handle_str and password
-            reset_code = get_hash(user_info["handle_str"] + user_info["password"])
-            # log user out of all sessions
-            user_info["sessions"].clear()
-            break
+    u_id = data_store.emails.find(store, email)
+    if u_id is not None:
+        user_found = True
+        user_info = users[u_id]
+        # generate reset_code from handle_str and password
+        reset_code = get_hash(user_info["handle_str"] + user_info["password"])
+        # log user out of all sessions
+        user_info["sessions"].clear()
     
     # if user_found is false, then store has also not been modified
     if user_found == False:
@@ -56,7 +56,7 @@ def channel_invite_v1(token, channel_id, u_id):
 
     # If this point is reached, there must be a valid auth_user_id, channel_id and u_id.
     notifications_send_invited(auth_user_id, u_id, channel_id, "channel")
-    channel_all_members.append(u_id)
+    data_store.add_member("channel", channel_id, u_id)
 
     # Update user_stats
     update_user_stats_channels(u_id, "add")
@@ -183,7 +183,6 @@ def channel_messages_v1(token, channel_id, start):
 
     store = data_store.get()
     channels = store["channels"]
-    all_messages = store["messages"]
 
     # specified channel doesn't exist
     if channel_id not in channels.keys(): 
@@ -209,13 +208,11 @@ def channel_messages_v1(token, channel_id, start):
     if start > total_message_num:
         raise InputError(description="start is an invalid value")
 
-    # Reverse channel_messages so that most recent msg is index 0
-    # Then, slice list to get msgs between start and end index
-    channel_messages = list(reversed(channel_messages))[start:end]
-    messages = [all_messages[x] for x in channel_messages]
+    # get msgs between start and end index, with the most recent msg at index 0
+    messages = data_store.page_messages("channel", channel_id, start)
 
     # Add info about if the caller user has reacted to each message in the list of messages
-    add_user_react_info(auth_user_id, messages)
+    messages = add_user_react_info(auth_user_id, messages)
 
     # this is when you return the least recent message in the channel
     # since "start" starts from 0, we use >= rather than > 
@@ -276,7 +273,7 @@ def channel_join_v1(token, channel_id):
         raise InputError(description="Authorised user already a member of channel")
 
     # if it reaches this point, auth_user_id and channel_id are both valid
-    channel_members.append(auth_user_id)
+    data_store.add_member("channel", channel_id, auth_user_id)
 
     # Update user_stats
     update_user_stats_channels(auth_user_id, "add")
@@ -324,7 +321,7 @@ def channel_leave_v1(token, channel_id):
     if auth_user_id in channel_owners:
         channel_owners.remove(auth_user_id)
 
-    channel_all_members.remove(auth_user_id)
+    data_store.remove_member("channel", channel_id, auth_user_id)
 
     # Update user_stats
     update_user_stats_channels(auth_user_id, "remove")
@@ -27,17 +27,13 @@ def channels_list_v1(token):
     # List of channels to be returned
     return_list = []
 
-    # go through each channel's dict
-    for channel_id, channel in channels.items():
-        # go through all members of every channel dict
-        for member_id in channel["all_members"]:
-            #if auth user id present in current channel
-            if member_id == auth_user_id:
-                channel_details = {
-                    "channel_id" : channel_id,
-                    "name" : channel["channel_name"]
-                }
-                return_list.append(channel_details)
+    # go through each channel the auth user is a member of
+    for channel_id in data_store.joined("channel", auth_user_id):
+        channel_details = {
+            "channel_id" : channel_id,
+            "name" : channels[channel_id]["channel_name"]
+        }
+        return_list.append(channel_details)
 
     return {
         "channels" : return_list
@@ -129,6 +125,7 @@ def channels_create_v1(token, name, is_public):
 
     # Store changes back into database
     channels[channel_id] = new_channel
+    data_store.memberships.add(store, auth_user_id, "channel", channel_id)
 
     # Update user_stats and workplace_stats
     update_workplace_stats_channels()
@@ -0,0 +1,237 @@
+import mmap
+import pickle
+import struct
+import tempfile
+import threading
+import time
+from src import config
+from src.journal import LazyDict, TrackedDict, TrackedList
+from src.snapshot_format import PAGE_SIZE
+
+'''
+cold_tier.py
+
+Cold storage for old messages, for the storages that otherwise keep every
+message in memory (see Datastore and config.cold_message_age).
+
+Most reads only go through the newest messages of a channel or dm, so once
+a message is older than the cold age it is moved out of memory into a
+segment file: the messages of the store become a ColdDict, which keeps the
+newer messages in memory as usual, and of each cold message only its offset
+in the segment. A cold message is read back through an mmap of the segment
+when it is accessed, and the most recently read ones stay in memory for a
+while, like any LazyDict.
+
+The segment is append-only: a cold message that changes is pinned in memory
+until its change has been written, and is then appended to the segment
+again, leaving its old version behind as garbage until the segment is
+compacted. The segment is only a cache of what the storage already holds on
+disk, so it is a temporary file that goes away with the process, and is
+built afresh each time the store is loaded.
+
+Each message in the segment is laid out as:
+
+    length (4 bytes) | pickled message
+'''
+
+LENGTH = struct.Struct("<I")
+
+# the segment is compacted once it is more than this much garbage, and at least this big
+COMPACT_FRACTION = 0.5
+COMPACT_SIZE = 16 * 1024 * 1024
+
+class ColdSegment:
+    '''
+    Source of a ColdDict (see LazyDict), reading each message from its
+    offset in the segment file
+
+    Arguments:
+        directory (str)  - where to keep the segment file
+    '''
+    def __init__(self, directory=None):
+        self.__lock = threading.Lock()
+        self.__directory = directory
+        self.__FILE = tempfile.TemporaryFile(prefix="streams-cold-", dir=directory)
+        self.__map = None
+        # offset of each message in the file, and how much of it is old versions
+        self.__offsets = {}
+        self.size = 0
+        self.garbage = 0
+
+    def append(self, records):
+        '''
+        Adds the messages in `records` to the end of the segment, in place of
+        any older versions of them
+
+        Arguments:
+            records (dict)  - message_id to message
+        '''
+        if not records:
+            return
+        with self.__lock:
+            self.__FILE.seek(self.size)
+            offset = self.size
+            for key, record in records.items():
+                data = pickle.dumps(record, pickle.HIGHEST_PROTOCOL)
+                self.__FILE.write(LENGTH.pack(len(data)))
+                self.__FILE.write(data)
+                self.__forget(key)
+                self.__offsets[key] = offset
+                offset += LENGTH.size + len(data)
+            self.__FILE.flush()
+            self.size = offset
+            self.__remap()
+        if self.garbage > max(COMPACT_SIZE, self.size * COMPACT_FRACTION):
+            self.compact()
+
+    def discard(self, keys):
+        # removes messages from the segment, leaving them behind as garbage
+        with self.__lock:
+            for key in keys:
+                self.__forget(key)
+
+    def compact(self):
+        '''
+        Rewrites the segment with only the current version of each message
+        '''
+        with self.__lock:
+            FILE = tempfile.TemporaryFile(prefix="streams-cold-", dir=self.__directory)
+            offsets = {}
+            for key, offset in self.__offsets.items():
+                offsets[key] = FILE.tell()
+                FILE.write(self.__map[offset:offset + LENGTH.size + LENGTH.unpack_from(self.__map, offset)[0]])
+            FILE.flush()
+            self.__FILE.close()
+            self.__FILE, self.__offsets = FILE, offsets
+            self.size = FILE.tell()
+            self.garbage = 0
+            self.__remap()
+
+    def __forget(self, key):
+        offset = self.__offsets.pop(key, None)
+        if offset is not None:
+            self.garbage += LENGTH.size + LENGTH.unpack_from(self.__map, offset)[0]
+
+    def __remap(self):
+        # the old mapping is left to be closed once nothing reads from it
+        self.__map = mmap.mmap(self.__FILE.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+
+    def fetch(self, keys):
+        records = {}
+        with self.__lock:
+            for key in keys:
+                offset = self.__offsets.get(key)
+                if offset is None:
+                    continue
+                length = LENGTH.unpack_from(self.__map, offset)[0]
+                start = offset + LENGTH.size
+                records[key] = pickle.loads(self.__map[start:start + length])
+        return records
+
+    def contains(self, key):
+        return key in self.__offsets
+
+    def keys(self):
+        return list(self.__offsets)
+
+    def __len__(self):
+        return len(self.__offsets)
+
+class ColdDict(LazyDict):
+    '''
+    LazyDict of messages whose messages older than `age` seconds are moved
+    into a ColdSegment, at most once every `interval` seconds, see tier
+
+    The dict itself holds the messages that are still hot, and those changed
+    since the store was last written.
+    '''
+    __slots__ = ("_age", "_interval", "_tiered")
+
+    def __init__(self, segment, age, interval=60, hot_size=1000):
+        LazyDict.__init__(self, segment, hot_size)
+        self._age = age
+        self._interval = interval
+        # when the messages were last tiered
+        self._tiered = 0
+
+    def trim(self, touched):
+        # called once the store has been written, see Datastore.flush
+        if time.time() - self._tiered >= self._interval:
+            self.tier(touched)
+
+    def tier(self, touched=frozenset()):
+        '''
+        Moves every message older than the cold age into the segment, unless
+        it has changes that haven't been written yet, and drops the messages
+        removed since they were moved there
+
+        Arguments:
+            touched (set)  - ChangeLog.touched(), the changes not written yet
+        '''
+        if (self._key,) in touched:
+            return
+        with self._lock:
+            self._tiered = time.time()
+            cutoff = self._tiered - self._age
+            cold = {
+                key: record for key, record in dict.items(self)
+                if (self._key, key) not in touched and is_cold(record, cutoff)
+            }
+            self._source.append(cold)
+            for key in cold:
+                self._keep(key, dict.pop(self, key))
+
+            removed = {key for key in self._removed if (self._key, key) not in touched}
+            self._source.discard(removed)
+            self._removed -= removed
+
+def is_cold(record, cutoff):
+    # whether a message was sent before cutoff
+    return isinstance(record, dict) and isinstance(record.get("time_created"), int) and record["time_created"] < cutoff
+
+def make_cold(messages, directory, age):
+    '''
+    ColdDict holding every message of the tracked dict `messages`, which
+    takes its place in the store, with the messages older than `age`
+    already moved into a new segment in `directory`
+    '''
+    cold = ColdDict(ColdSegment(directory), age, config.cold_message_interval)
+    cold._parent, cold._key = messages._parent, messages._key
+    for key, record in dict.items(messages):
+        if isinstance(record, (TrackedDict, TrackedList)):
+            record._parent = cold
+        dict.__setitem__(cold, key, record)
+    dict.__setitem__(messages._parent, messages._key, cold)
+    cold.tier()
+    return cold
+
+def load_cold(pages, directory, age):
+    '''
+    ColdDict of the messages in the MessagePages `pages`, read a page at a
+    time so the messages older than `age` go straight into a new segment in
+    `directory` without all being in memory at once
+    '''
+    cold = ColdDict(ColdSegment(directory), age, config.cold_message_interval)
+    cold._tiered = time.time()
+    cutoff = cold._tiered - age
+    keys = pages.keys()
+    for start in range(0, len(keys), PAGE_SIZE):
+        records = {}
+        for key, record in pages.fetch(keys[start:start + PAGE_SIZE]).items():
+            if is_cold(record, cutoff):
+                records[key] = record
+            else:
+                dict.__setitem__(cold, key, record)
+        cold._source.append(records)
+        for record in records.values():
+            detach(record)
+    return cold
+
+def detach(node):
+    # breaks the references from the containers inside a message back up to
+    # it, so it is freed as soon as it is dropped rather than by the cyclic
+    # collector, which is paused while the store loads
+    for child in (dict.values(node) if isinstance(node, dict) else node):
+        if isinstance(child, (TrackedDict, TrackedList)):
+            child._parent = None
+            detach(child)
@@ -1,3 +1,57 @@
 port = 8080
 
+# how the data store is persisted, either "journal", "paged", "snapshot", "sharded"
+# or "sqlite", or "remote" to use the store kept by a store daemon (see store_server.py)
+persistence = "journal"
+
+# the store daemon's socket, and how the daemon persists the store it keeps
+store_socket = "database.sock"
+store_persistence = "journal"
+
+# when writes to disk are synced, either "always" (before the request that made
+# them returns), "interval" (at most every fsync_interval milliseconds) or
+# "never" (left to the operating system)
+fsync = "interval"
+fsync_interval = 1000
+
+# when group_commit is True, units of work that end at the same time are
+# written to disk together, by one flush, see Datastore.__wait_for_commit
+group_commit = True
+
+# when write_behind is True, the data store is written to disk by a background
+# thread every write_behind_interval milliseconds, or as soon as it has been
+# set write_behind_max_dirty times, instead of at the end of every request
+write_behind = False
+write_behind_interval = 200
+write_behind_max_dirty = 100
+
+# when cold_message_age is set, messages sent more than that many seconds ago
+# are moved out of memory into a segment file, and read back from it when
+# accessed, checking for more every cold_message_interval seconds. only the
+# storages that would otherwise keep every message in memory ("journal",
+# "snapshot", "sharded" and "remote") have a cold tier, see cold_tier.py
+cold_message_age = None
+cold_message_interval = 60
+
+# when archive_message_age is set, the text of messages sent more than that
+# many seconds ago is compressed in snapshots of the store (database.p, and
+# backups), and decompressed when the messages are read, see snapshot_format.py
+archive_message_age = None
+
+# every message_gc_interval seconds, the messages no channel or dm refers to
+# any more (eg. those of a removed dm) are deleted by a background thread,
+# message_gc_batch at a time with message_gc_pause milliseconds between
+# batches so requests are never held up for long, see message_gc.py. None
+# turns the collector off
+message_gc_interval = 300
+message_gc_batch = 500
+message_gc_pause = 10
+
+# where admin/backup/v1 writes backups of the data store, and admin/restore/v1
+# reads them from
+backup_directory = "backups"
+# most backups kept in the backup directory, the oldest are removed once
+# there are more. None keeps every backup
+max_backups = 20
+
 url = f"http://localhost:{port}/"
\ No newline at end of file
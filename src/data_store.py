@@ -1,5 +1,20 @@
+import copy
+import gc
 import json
-import pickle
+import os
+import threading
+import time
+from contextlib import contextmanager
+from src import config
+from src import migrations, snapshot_format
+from src.cold_tier import make_cold
+from src.indexes import Handles, Memberships, MessageLocations, Unique
+from src.journal import ChangeLog, LazyDict, TrackedDict, track
+from src.remote_storage import RemoteStorage
+from src.rwlock import RWLock
+from src.sqlite_storage import SqliteStorage
+from src.storage import JournalStorage, PagedStorage, ShardedStorage, SnapshotStorage, replace
+from src.store_snapshot import Snapshot, Thawed
 
 '''
 data_store.py
@@ -118,22 +133,627 @@ initial_object = {
 ## YOU SHOULD MODIFY THIS OBJECT ABOVE
 
 # Modified data_store.set to dump initial_object to json file and have persistence.
+#
+# persistence is either:
+#   - "snapshot": every set re-pickles the whole store into database.p
+#   - "journal":  every set appends the changes made since the last set to
+#                 database.journal, which is replayed on top of database.p
+#                 when the store is loaded
+#   - "paged":    like "journal", but messages are only read in from
+#                 database.p when accessed
+#   - "sharded":  every set re-pickles only the top level collections that
+#                 changed, each into its own file in database.shards/
+#   - "sqlite":   every set updates the rows changed since the last set in
+#                 database.db, and messages are only read in when accessed
+#   - "remote":   the store is kept by a store daemon, whose socket is given
+#                 in place of database.p, see RemoteDatastore
+STORAGES = {
+    "snapshot": SnapshotStorage,
+    "journal":  JournalStorage,
+    "paged":    PagedStorage,
+    "sharded":  ShardedStorage,
+    "sqlite":   SqliteStorage,
+    "remote":   RemoteStorage
+}
+
+# when writes reach the disk, see storage.py
+FSYNC_POLICIES = ("always", "interval", "never")
+
+# kinds of unit of work, see begin
+UNITS_OF_WORK = ("write", "read", "snapshot", "transaction")
+
+# where the members and messages of a channel or dm are kept
+LOCATIONS = {
+    "channel":  ("channels", "all_members"),
+    "dm":       ("dms", "members")
+}
+
 class Datastore:
-    def __init__(self):
-        self.__store = initial_object
+    def __init__(self, path='database.p', persistence=config.persistence, fsync=config.fsync,
+                 group_commit=config.group_commit, cold_message_age=config.cold_message_age):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"unknown fsync policy {fsync}")
+        self.__storage = STORAGES[persistence](path, fsync)
+        # the cold tier of the messages, see cold_tier.py
+        self.__cold_message_age = cold_message_age
+        self.__cold_directory = os.path.dirname(os.path.abspath(path))
+        if isinstance(self.__storage, SnapshotStorage):
+            # so old messages can go straight from a snapshot into the cold tier
+            self.__storage.cold_message_age = cold_message_age
+        self.__changes = ChangeLog()
+        self.__changes.enabled = self.__storage.records_changes
+        self.__changes.keep_ops = self.__storage.records_ops
+        self.__lock = threading.Lock()
+        # held by every unit of work, see begin
+        self.__rwlock = RWLock()
+        self.__local = threading.local()
+        self.__needs_full_write = False
+        # write-behind state, see start_write_behind
+        self.__write_behind = None
+        self.__writer = None
+        self.__dirty = 0
+        self.__dirty_changed = threading.Condition()
+        # group commit state, see __wait_for_commit: the number of changes
+        # made so far, and how many of them have been written to disk
+        self.__group_commit = group_commit and not self.__storage.shared
+        self.__commits = 0
+        self.__committed = 0
+        self.__committing = False
+        self.__commit_changed = threading.Condition()
+        self.__store = None
+        # number of calls to set, and number of times the store was written to disk
+        self.sets = 0
+        self.writes = 0
+        # lookup tables kept next to the store, see indexes.py
+        self.message_locations = MessageLocations()
+        self.memberships = Memberships(lambda: self.sets)
+        self.emails = Unique("users", "email")
+        self.handles = Handles()
+        self.indexes = (self.message_locations, self.memberships, self.emails, self.handles)
+        self.__store = self.__install(initial_object)
    
     def get(self):
+        # inside a snapshot the store is seen as it was when it was taken
+        snapshots = getattr(self.__local, 'snapshots', None)
+        if snapshots:
+            return snapshots[-1].get()
         return self.__store
 
     def set(self, store):
         if not isinstance(store, dict):
             raise TypeError('store must be of type dictionary')
-        self.__store = store
-        with open('database.p', 'wb') as FILE:
-            pickle.dump(self.__store, FILE)
+        with self.__lock:
+            self.sets += 1
+            if store is not self.__store:
+                # a whole new store can only be written out in full
+                self.__store = self.__install(store)
+                self.__needs_full_write = True
+
+        # inside a unit of work the flush waits until the unit of work ends
+        if getattr(self.__local, 'depth', 0):
+            self.__local.dirty = True
+        else:
+            self.__wait_for_commit(self.__changed())
+
+    def flush(self):
+        '''
+        Writes every change made since the last flush to disk
+        '''
+        # writers have to wait, so the store doesn't change while it is written
+        self.__rwlock.acquire_read()
+        try:
+            with self.__lock:
+                # every change made so far is in the operations taken
+                commits = self.__commits
+                touched = self.__changes.touched()
+                ops = self.__changes.take()
+                if self.__needs_full_write:
+                    ops = None
+                self.__needs_full_write = False
+                if self.__storage.write(self.__store, ops, touched):
+                    self.writes += 1
+
+                # messages that are now on disk no longer need to be kept in memory
+                messages = dict.get(self.__store, "messages")
+                if isinstance(messages, LazyDict):
+                    messages.trim(self.__changes.touched() | self.__storage.pinned)
+        finally:
+            self.__rwlock.release_read()
+        with self.__commit_changed:
+            self.__committed = max(self.__committed, commits)
+            self.__commit_changed.notify_all()
+
+    def insert_message(self, location_type, location_id, message):
+        '''
+        Adds a message to the end of a channel or dm, under the next message_id
+
+        Arguments:
+            location_type (str)  - "channel" or "dm"
+            location_id (int)    - channel_id or dm_id
+            message (dict)       - the message
+
+        Return Value:
+            message_id (int) the message was stored under
+        '''
+        store = self.__store
+        collection, _ = LOCATIONS[location_type]
+        message_id = store["message_id_tracker"]
+        store[collection][location_id]["messages"].append(message_id)
+        store["messages"][message_id] = message
+        store["message_id_tracker"] = message_id + 1
+        self.message_locations.add(store, message_id, location_type, location_id)
+        return message_id
+
+    def add_member(self, location_type, location_id, u_id):
+        '''
+        Adds a user to the members of a channel or dm
+
+        Arguments:
+            location_type (str)  - "channel" or "dm"
+            location_id (int)    - channel_id or dm_id
+            u_id (int)           - user to add
+        '''
+        collection, members = LOCATIONS[location_type]
+        self.__store[collection][location_id][members].append(u_id)
+        self.memberships.add(self.__store, u_id, location_type, location_id)
+
+    def remove_member(self, location_type, location_id, u_id):
+        '''
+        Removes a user from the members of a channel or dm
+
+        Arguments:
+            location_type (str)  - "channel" or "dm"
+            location_id (int)    - channel_id or dm_id
+            u_id (int)           - user to remove, who is a member
+        '''
+        collection, members = LOCATIONS[location_type]
+        self.__store[collection][location_id][members].remove(u_id)
+        self.memberships.discard(self.__store, u_id, location_type, location_id)
+
+    def joined(self, location_type, u_id):
+        '''
+        Finds the channels or dms a user is a member of, in the store get
+        returns on the calling thread
+
+        Arguments:
+            location_type (str)  - "channel" or "dm"
+            u_id (int)           - the user
+
+        Return Value:
+            list of the channel_ids or dm_ids, in order
+        '''
+        snapshots = getattr(self.__local, 'snapshots', None)
+        return self.memberships.joined(self.get(), u_id, location_type, snapshots[-1] if snapshots else None)
+
+    def page_messages(self, location_type, location_id, start, count=50):
+        '''
+        Reads a page of the messages in a channel or dm, most recent first,
+        without going through the rest of them
+
+        Arguments:
+            location_type (str)  - "channel" or "dm"
+            location_id (int)    - channel_id or dm_id
+            start (int)          - number of more recent messages to skip
+            count (int)          - most messages to return
+
+        Return Value:
+            list of messages
+        '''
+        collection, _ = LOCATIONS[location_type]
+        store = self.get()
+        message_ids = store[collection][location_id]["messages"]
+        end = max(len(message_ids) - start, 0)
+        page = message_ids[max(end - count, 0):end]
+        page.reverse()
+
+        messages = store["messages"]
+        if isinstance(messages, LazyDict):
+            messages.prefetch(page)
+        return [messages[message_id] for message_id in page]
+
+    def start_write_behind(self, interval, max_dirty):
+        '''
+        Switches the store to write-behind: setting the store only marks it
+        as dirty, and a background thread writes it to disk every `interval`
+        milliseconds, or once it has been set `max_dirty` times, whichever
+        comes first.
+
+        Arguments:
+            interval (int)   - milliseconds between writes
+            max_dirty (int)  - number of sets that triggers an early write
+
+        Exceptions:
+            RuntimeError  - the store is shared, so has to be written before
+                            each unit of work that writes lets go of it
+        '''
+        if self.__storage.shared:
+            raise RuntimeError("a shared store can't be written behind")
+        with self.__dirty_changed:
+            self.__write_behind = (interval / 1000, max_dirty)
+        if self.__writer is None:
+            self.__writer = threading.Thread(target=self.__write_behind_loop, daemon=True)
+            self.__writer.start()
+
+    def close(self):
+        '''
+        Stops the write-behind thread, if any, and flushes the store so
+        nothing is lost on shutdown
+        '''
+        with self.__dirty_changed:
+            self.__write_behind = None
+            self.__dirty_changed.notify()
+        if self.__writer is not None:
+            self.__writer.join()
+            self.__writer = None
+        self.flush()
+
+    def __changed(self):
+        # the store has changed and needs to be written to disk. returns the
+        # commit to wait for, or None if there is nothing to wait for
+        with self.__dirty_changed:
+            if self.__write_behind is not None:
+                self.__dirty += 1
+                if self.__dirty >= self.__write_behind[1]:
+                    self.__dirty_changed.notify()
+                return None
+        with self.__lock:
+            self.__commits += 1
+            commit = self.__commits
+        if not self.__group_commit:
+            self.flush()
+        return commit
+
+    def __wait_for_commit(self, commit):
+        '''
+        Waits until `commit` has been written to disk. Changes that wait at
+        the same time are written together: the first thread to wait writes
+        every change made so far in one flush, while the others wait for it,
+        and whichever of them still has to wait writes the next flush. So
+        however many threads change the store, there is at most one write
+        in progress, and each write takes in all the changes that queued up
+        during the last one.
+
+        Arguments:
+            commit (int)  - from __changed, or None
+        '''
+        if commit is None:
+            return
+        with self.__commit_changed:
+            while self.__committed < commit and self.__committing:
+                self.__commit_changed.wait()
+            if self.__committed >= commit:
+                return
+            self.__committing = True
+        try:
+            self.flush()
+        finally:
+            with self.__commit_changed:
+                self.__committing = False
+                self.__commit_changed.notify_all()
+
+    def __write_behind_loop(self):
+        while True:
+            with self.__dirty_changed:
+                if self.__write_behind is None:
+                    return
+                interval, max_dirty = self.__write_behind
+                if self.__dirty < max_dirty:
+                    self.__dirty_changed.wait(interval)
+                dirty, self.__dirty = self.__dirty, 0
+            if dirty:
+                self.flush()
+
+    def begin(self, kind="write"):
+        '''
+        Opens a unit of work on the calling thread. Until the matching end,
+        set only marks the store as dirty. Units of work can be nested.
+
+        A unit of work that writes holds the store's lock until it ends on its
+        own, and one that reads shares it with other reads. A snapshot holds
+        no lock at all: until it ends, get on the calling thread returns a
+        read only view of the store as it was when the snapshot began, which
+        writers on other threads don't disturb, see store_snapshot.py. A
+        transaction writes, and its changes can be undone by roll_back.
+
+        Arguments:
+            kind (str)  - "write", "read", "snapshot" or "transaction"
+
+        Exceptions:
+            ValueError    - unknown kind of unit of work
+            RuntimeError  - opening a unit of work that writes inside one that
+                            only reads, or one that locks inside a snapshot
+        '''
+        if kind not in UNITS_OF_WORK:
+            raise ValueError(f"unknown kind of unit of work {kind}")
+        outermost = not getattr(self.__local, 'depth', 0)
+        if outermost:
+            self.__local.depth = 0
+            self.__local.dirty = False
+            self.__local.kinds = []
+            self.__local.snapshots = []
+            self.__local.transactions = []
+            if self.__storage.shared and kind in ("read", "snapshot"):
+                self.__catch_up(False)
+        if kind == "snapshot":
+            # the snapshot has to be taken between writes, not part way through one
+            self.__rwlock.acquire_read()
+            try:
+                self.__local.snapshots.append(Snapshot(self.__store, self.sets))
+            finally:
+                self.__rwlock.release_read()
+        elif self.__local.snapshots:
+            # the view would be stale, and a write couldn't go through it
+            raise RuntimeError("can't lock the store inside a snapshot")
+        elif kind == "read":
+            self.__rwlock.acquire_read()
+        else:
+            self.__rwlock.acquire_write()
+            try:
+                if outermost and self.__storage.shared:
+                    self.__catch_up(True)
+                if kind == "transaction":
+                    # what the store held before each change, to undo it
+                    undo = Snapshot(self.__store, self.sets)
+                    self.__local.transactions.append((undo, self.__changes.mark(), self.__store, self.__local.dirty))
+            except BaseException:
+                # no unit of work was opened, so there is none to end
+                try:
+                    if outermost and self.__storage.shared:
+                        self.__storage.release()
+                finally:
+                    self.__rwlock.release_write()
+                raise
+        self.__local.depth += 1
+        self.__local.kinds.append(kind)
+
+    def end(self):
+        '''
+        Closes a unit of work on the calling thread. When the outermost unit of
+        work ends, the store is flushed once if it was set during it, and end
+        returns once the changes are on disk, see __wait_for_commit.
+
+        Exceptions:
+            RuntimeError  - no unit of work is open on the calling thread, eg.
+                            because begin raised
+        '''
+        if not getattr(self.__local, 'depth', 0):
+            raise RuntimeError("no unit of work to end")
+        commit = None
+        try:
+            self.__local.depth -= 1
+            if self.__local.depth == 0 and self.__local.dirty:
+                self.__local.dirty = False
+                commit = self.__changed()
+        finally:
+            kind = self.__local.kinds.pop()
+            if kind == "snapshot":
+                self.__local.snapshots.pop().close()
+            elif kind == "read":
+                self.__rwlock.release_read()
+            else:
+                if kind == "transaction":
+                    self.__local.transactions.pop()[0].close()
+                try:
+                    if self.__local.depth == 0 and self.__storage.shared:
+                        self.__storage.release()
+                finally:
+                    self.__rwlock.release_write()
+        # other units of work can go ahead while this one's changes are written
+        self.__wait_for_commit(commit)
+
+    def __catch_up(self, lock):
+        # applies the changes other processes have made to a shared store,
+        # see remote_storage.py
+        update = self.__storage.catch_up(lock)
+        if update is None:
+            return
+        self.__rwlock.acquire_write()
+        try:
+            with self.__lock:
+                # the changes are already stored, so aren't recorded again
+                enabled, self.__changes.enabled = self.__changes.enabled, False
+                try:
+                    store = self.__storage.apply(self.__store, update)
+                finally:
+                    self.__changes.enabled = enabled
+                if store is not None:
+                    self.__store = self.__install(store)
+                else:
+                    self.reset_indexes()
+        finally:
+            self.__rwlock.release_write()
+
+    def reset_indexes(self):
+        '''
+        Has every index built again from the store when it is next used, for
+        when the store has changed in a way the endpoints didn't keep the
+        indexes up to date with, see indexes.py
+        '''
+        for index in self.indexes:
+            index.reset()
+
+    def roll_back(self):
+        '''
+        Undoes every change made so far in the innermost transaction on the
+        calling thread, which carries on from the store as it was when the
+        transaction began. Nothing is written to disk for the changes undone.
+
+        Exceptions:
+            RuntimeError  - no transaction is open on the calling thread
+        '''
+        transactions = getattr(self.__local, 'transactions', None)
+        if not transactions:
+            raise RuntimeError("no transaction to roll back")
+        undo, mark, store, dirty = transactions[-1]
+        with self.__lock:
+            if self.__store is not store:
+                # a whole new store was set, so put the old one back in full
+                self.__store = self.__install(store)
+                self.__needs_full_write = True
+            if undo.restore():
+                self.reset_indexes()
+            self.__changes.rollback(mark)
+        self.__local.dirty = dirty
+
+    @contextmanager
+    def read(self):
+        '''
+        Unit of work that only reads the store, which runs alongside other
+        reads, eg.
+
+            with data_store.read():
+                channel_messages_v1(token, channel_id, start)
+        '''
+        self.begin("read")
+        try:
+            yield self.__store
+        finally:
+            self.end()
+
+    @contextmanager
+    def write(self):
+        '''
+        Unit of work that can change the store, which has the store to
+        itself, eg.
+
+            with data_store.write():
+                message_send_v1(token, channel_id, message)
+        '''
+        self.begin()
+        try:
+            yield self.__store
+        finally:
+            self.end()
+
+    @contextmanager
+    def snapshot(self):
+        '''
+        Unit of work that reads a snapshot of the store, which neither waits
+        for writers nor holds them up however long it takes, eg.
+
+            with data_store.snapshot() as snapshot:
+                search_v1(token, query_str)
+
+        Return Value:
+            the Snapshot, whose get() is the view of the store and whose
+            version is the number of sets the store had seen when it was taken
+        '''
+        self.begin("snapshot")
+        try:
+            yield self.__local.snapshots[-1]
+        finally:
+            self.end()
+
+    @contextmanager
+    def transaction(self):
+        '''
+        Unit of work that can change the store, whose changes are written to
+        disk together once it ends, or are all undone if it raises, eg.
+
+            with data_store.transaction():
+                dm_create_v1(token, u_ids)
+        '''
+        self.begin("transaction")
+        try:
+            yield self.__store
+        except BaseException:
+            self.roll_back()
+            raise
+        finally:
+            self.end()
+
+    unit_of_work = write
+
+    def backup(self, path):
+        '''
+        Writes the store as it is now to a snapshot file at path (see
+        snapshot_format.py), while other threads go on reading and writing
+        it. The backup is written from a snapshot of the store, so it holds
+        every change made before it began and none made after, and no lock is
+        held while it is written.
+
+        Arguments:
+            path (str)  - file to write the backup to, replaced if it exists
+
+        Return Value:
+            the backup's metadata, with the number of sets the store had seen
+            ("version"), when the backup was taken ("time") and the version of
+            each collection of records ("schema", see migrations.py)
+        '''
+        with self.snapshot() as snapshot:
+            meta = {"version": snapshot.version, "time": int(time.time()), "schema": migrations.versions()}
+            def write(FILE):
+                # each collection is copied out of the snapshot only as it is written
+                snapshot_format.dump(Thawed(snapshot.get()), FILE, meta, config.archive_message_age)
+            replace(path, write, "always")
+        return meta
+
+    def restore(self, path):
+        '''
+        Replaces the whole store with a backup written by backup, as one
+        transaction, which is written to disk in full
+
+        Arguments:
+            path (str)  - the backup
+
+        Exceptions:
+            ValueError  - path isn't a backup
+
+        Return Value:
+            the backup's metadata, see backup
+        '''
+        with open(path, 'rb') as FILE:
+            store, meta = snapshot_format.load(FILE)
+        # a backup taken before a migration was added is upgraded as it is read
+        migrations.migrate(store, meta.get("schema", {}))
+        with self.transaction():
+            self.set(store)
+        return meta
+
+    def load(self):
+        '''
+        Restores the store from disk
+        '''
+        # loading allocates millions of containers and frees none of them, so
+        # the cyclic collector would only rescan them over and over
+        paused = gc.isenabled()
+        gc.disable()
+        self.__rwlock.acquire_write()
+        try:
+            store = self.__storage.load(copy.deepcopy(initial_object))
+            with self.__lock:
+                self.__store = self.__install(store)
+        finally:
+            self.__rwlock.release_write()
+            if paused:
+                gc.enable()
+
+    def __install(self, store):
+        # detach the old store so stale references to it are no longer recorded
+        if self.__store is not None:
+            self.__store._parent = None
+        self.__changes.take()
+        self.reset_indexes()
+        store = track(store, self.__changes)
+        # storages that leave messages on disk already keep them out of memory
+        messages = dict.get(store, "messages")
+        if self.__cold_message_age is not None and not self.__storage.lazy and type(messages) is TrackedDict:
+            make_cold(messages, self.__cold_directory, self.__cold_message_age)
+        return store
+
+class RemoteDatastore(Datastore):
+    '''
+    Datastore whose store is kept by a store daemon (see store_server.py),
+    which any number of processes can share
+
+    Arguments:
+        path (str)  - the daemon's socket
+    '''
+    def __init__(self, path=config.store_socket):
+        Datastore.__init__(self, path, "remote")
 
 print('Loading Datastore...')
 
 global data_store
-data_store = Datastore()
+data_store = RemoteDatastore() if config.persistence == "remote" else Datastore()
 
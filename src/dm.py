@@ -49,6 +49,8 @@ def dm_create_v1(token, u_ids):
         "members" : u_ids,
         "messages" : []
     }
+    for u_id in u_ids:
+        data_store.memberships.add(store, u_id, "dm", dm_id)
 
     # send notification to all invitees
     for u_id in u_ids:
@@ -92,11 +94,9 @@ def dm_list_v1(token):
     store = data_store.get()
     dms = store["dms"]
     
-    #check if the user is part of a dm
-    #append the dm_is to dm list if they are
-    for dm in dms.keys():
-        if auth_user_id in dms[dm]["members"]:
-            dm_list.append({"dm_id" : dm , "name" : dms[dm]["name"]})
+    #append every dm the user is part of to dm list
+    for dm in data_store.joined("dm", auth_user_id):
+        dm_list.append({"dm_id" : dm , "name" : dms[dm]["name"]})
     
     return {
         "dms" : dm_list
@@ -201,7 +201,10 @@ def dm_remove_v1(token, dm_id):
     for u_id in u_ids:
         update_user_stats_dms(u_id, "remove")
 
-    #remove the dm
+    #remove the dm, its messages are collected later (see message_gc.py)
+    data_store.message_locations.discard(store, dms[dm_id]["messages"])
+    for u_id in u_ids:
+        data_store.memberships.discard(store, u_id, "dm", dm_id)
     del dms[dm_id]
     
     data_store.set(store)
@@ -241,7 +244,7 @@ def dm_leave_v1(token, dm_id):
         raise AccessError("user is not part of the dm")
 
     #remove the user
-    dms[dm_id]["members"].remove(auth_user_id)
+    data_store.remove_member("dm", dm_id, auth_user_id)
 
     # Update user_stats for all users in removed dm
     update_user_stats_dms(auth_user_id, "remove")
@@ -295,7 +298,6 @@ def message_senddm_v1(token, dm_id, message):
 
     # at this point, everything is valid
     message_id_tracker = store["message_id_tracker"]
-    dm_messages = dm_info["messages"]
 
     # timestamp
     timestamp = get_curr_timestamp()
@@ -318,13 +320,8 @@ def message_senddm_v1(token, dm_id, message):
         "is_pinned":    False
     }
 
-    # append new message_id to the channel messages list
-    dm_messages.append(message_id_tracker)
-
-    messages = store["messages"]
-    messages[message_id_tracker] = new_message
-
-    store["message_id_tracker"] = message_id_tracker + 1
+    # append new message to the dm messages list
+    data_store.insert_message("dm", dm_id, new_message)
 
     # Update user_stats and workspace_stats for messages_sent
     update_workspace_stats_messages("add")
@@ -369,7 +366,6 @@ def dm_messages_v1(token, dm_id, start):
 
     store = data_store.get()
     dms = store["dms"]
-    all_messages = store["messages"]
 
     # specified dm doesn't exist
     if dm_id not in dms.keys(): 
@@ -395,13 +391,11 @@ def dm_messages_v1(token, dm_id, start):
     if start > total_message_num:
         raise InputError("start is an invalid value")
 
-    # Reverse channel_messages so that most recent msg is index 0
-    # Then, slice list to get msgs between start and end index
-    dm_messages = list(reversed(dm_messages))[start:end]
-    messages = [all_messages[x] for x in dm_messages]
+    # get msgs between start and end index, with the most recent msg at index 0
+    messages = data_store.page_messages("dm", dm_id, start)
 
    # Add info about if the caller user has reacted to each message in the list of messages
-    add_user_react_info(auth_user_id, messages)
+    messages = add_user_react_info(auth_user_id, messages)
 
     # this is when you return the least recent message in the channel
     # since "start" starts from 0, we use >= rather than > 
@@ -503,24 +497,20 @@ def dm_later_helper(dm_id, auth_user_id, new_message):
     Return Value:
         None
     '''
-    #load data store
-    store = data_store.get()
-    message_id_tracker = store["message_id_tracker"]
-    dms = store["dms"]
-    
-    #add the new message to the data store
-    all_messages = dms[dm_id]["messages"]
-    all_messages.append(message_id_tracker)
-    store["messages"][message_id_tracker] = new_message
+    # runs on a timer thread, so has to take the store for writing itself
+    with data_store.transaction():
+        #load data store
+        store = data_store.get()
 
-    # send notifications to tagged users
-    notifications_send_tagged(auth_user_id, new_message["message"], dm_id, "dm")
+        #add the new message to the data store
+        data_store.insert_message("dm", dm_id, new_message)
 
-    store["message_id_tracker"] = message_id_tracker + 1
+        # send notifications to tagged users
+        notifications_send_tagged(auth_user_id, new_message["message"], dm_id, "dm")
 
-    # Update user_stats and workspace_stats for messages_sent
-    update_workspace_stats_messages("add")
-    update_user_stats_messages(auth_user_id)
+        # Update user_stats and workspace_stats for messages_sent
+        update_workspace_stats_messages("add")
+        update_user_stats_messages(auth_user_id)
 
-    data_store.set(store)
+        data_store.set(store)
 
@@ -0,0 +1,294 @@
+import heapq
+import threading
+import weakref
+
+'''
+indexes.py
+
+Lookup tables over the store that the Datastore keeps next to it in memory,
+so the endpoints can find a record by something other than its id without
+walking a whole collection, eg. the channel or dm a message is in.
+
+An index isn't part of the store: it is never written to disk, journaled or
+snapshotted, and costs nothing to load. Each one is built from the store the
+first time it is used, and from then on the endpoints that change what it
+covers keep it up to date as they change the store. Whenever the store
+changes in a way the endpoints didn't make themselves, ie. a new store is
+set, a transaction is rolled back, the store is cleared, or changes other
+processes made to a shared store are applied, the Datastore resets its
+indexes and each is built again when it is next used.
+'''
+
+# each kind of location of a message, the collection its records are in, and
+# the field of each record with its members
+LOCATIONS = (("channel", "channels", "all_members"), ("dm", "dms", "members"))
+
+class Index:
+    '''
+    Table built from the store the first time it is needed after a reset
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = None
+
+    def reset(self):
+        # built again from the store when next used
+        with self.lock:
+            self.entries = None
+
+    def table(self, store):
+        # readers can share the store, so only one of them builds the table
+        with self.lock:
+            if self.entries is None:
+                self.entries = self.build(store)
+            return self.entries
+
+    def build(self, store):
+        raise NotImplementedError
+
+class MessageLocations(Index):
+    '''
+    The channel or dm each message is in, by message_id. Messages never move
+    between channels and dms, so an entry only changes when a message is
+    sent or removed.
+    '''
+    def build(self, store):
+        entries = {}
+        for location_type, collection, _ in LOCATIONS:
+            for location_id, location in store[collection].items():
+                for message_id in location["messages"]:
+                    entries[message_id] = (location_type, location_id)
+        return entries
+
+    def locate(self, store, message_id):
+        '''
+        Finds the channel or dm a message is in
+
+        Arguments:
+            store (dict)      - the store
+            message_id (int)  - the message
+
+        Return Value:
+            (location_type, location_id), ie. ("channel", channel_id) or
+            ("dm", dm_id), or None if no channel or dm holds the message
+        '''
+        location = self.table(store).get(message_id)
+        if location is None:
+            return None
+        # the channel or dm may have been removed since
+        collection = "channels" if location[0] == "channel" else "dms"
+        if location[1] not in store[collection] or message_id not in store["messages"]:
+            return None
+        return location
+
+    def add(self, store, message_id, location_type, location_id):
+        self.table(store)[message_id] = (location_type, location_id)
+
+    def discard(self, store, message_ids):
+        # forgets messages that have been removed
+        entries = self.table(store)
+        for message_id in message_ids:
+            entries.pop(message_id, None)
+
+class Memberships(Index):
+    '''
+    The channels and dms each user is a member of, by u_id
+
+    Arguments:
+        version (function)  - gives the version of the store, which a snapshot
+                              of it is taken at, see Datastore.begin
+    '''
+    def __init__(self, version):
+        Index.__init__(self)
+        self.version = version
+        # version of the store when a member was last removed
+        self.removed = 0
+        # tables built from snapshots the index couldn't answer for
+        self.snapshots = weakref.WeakKeyDictionary()
+
+    def reset(self):
+        with self.lock:
+            self.entries = None
+            self.removed = self.version()
+
+    def build(self, store):
+        entries = {}
+        for location_type, collection, members in LOCATIONS:
+            for location_id, location in store[collection].items():
+                for u_id in location[members]:
+                    entries.setdefault(u_id, {"channel": set(), "dm": set()})[location_type].add(location_id)
+        return entries
+
+    def joined(self, store, u_id, location_type, snapshot=None):
+        '''
+        Finds the channels or dms a user is a member of
+
+        Arguments:
+            store (dict)          - the store, or a snapshot of it
+            u_id (int)            - the user
+            location_type (str)   - "channel" or "dm"
+            snapshot (Snapshot)   - the snapshot store is a view of, or None
+                                    for the store itself
+
+        Return Value:
+            list of the channel_ids or dm_ids, in order
+        '''
+        _, collection, members = LOCATIONS[0] if location_type == "channel" else LOCATIONS[1]
+        locations = store[collection]
+        if snapshot is None:
+            table = self.table(store)
+        else:
+            # the index is only ever built from the store itself
+            with self.lock:
+                table, removed = self.entries, self.removed
+                own = self.snapshots.get(snapshot)
+            if own is None and (table is None or snapshot.version <= removed):
+                # the user may have been a member of channels or dms the index
+                # no longer has when the snapshot was taken, so the snapshot
+                # gets a table of its own, built once for every user
+                own = self.build(store)
+                with self.lock:
+                    self.snapshots[snapshot] = own
+            if own is not None:
+                entries = own.get(u_id)
+                return sorted(entries[location_type]) if entries is not None else []
+
+        entries = table.get(u_id)
+        if entries is None:
+            return []
+        # a member added since a snapshot was taken isn't one in the snapshot
+        return [
+            location_id for location_id in sorted(entries[location_type])
+            if location_id in locations and u_id in locations[location_id][members]
+        ]
+
+    def add(self, store, u_id, location_type, location_id):
+        self.table(store).setdefault(u_id, {"channel": set(), "dm": set()})[location_type].add(location_id)
+
+    def discard(self, store, u_id, location_type, location_id):
+        entries = self.table(store).get(u_id)
+        self.removed = self.version()
+        if entries is not None:
+            entries[location_type].discard(location_id)
+
+class Unique(Index):
+    '''
+    The record of a collection holding each value of a field no two of its
+    records share, eg. the user with each email. Records whose value is None
+    aren't indexed.
+
+    Arguments:
+        collection (str)  - eg. "users"
+        field (str)       - eg. "email"
+    '''
+    def __init__(self, collection, field):
+        Index.__init__(self)
+        self.collection = collection
+        self.field = field
+
+    def build(self, store):
+        entries = {}
+        for key, record in store[self.collection].items():
+            value = record.get(self.field)
+            if value is not None:
+                entries[value] = key
+        return entries
+
+    def find(self, store, value):
+        '''
+        Finds the record holding a value
+
+        Arguments:
+            store (dict)  - the store
+            value         - value of the field
+
+        Return Value:
+            key of the record, or None if no record holds the value
+        '''
+        key = self.table(store).get(value)
+        if key is None:
+            return None
+        # the record may have been removed or changed since
+        record = store[self.collection].get(key)
+        if record is None or record.get(self.field) != value:
+            return None
+        return key
+
+    def add(self, store, value, key):
+        self.table(store)[value] = key
+
+    def discard(self, store, value):
+        self.table(store).pop(value, None)
+
+class Handles(Unique):
+    '''
+    The user with each handle_str, and for each handle that users have been
+    given with a number after it, the next number to try (see unused), so
+    giving the hundredth John Smith a handle doesn't try the 99 before it.
+    The numbers are worked out again from the handles whenever the index is
+    built, so a reset doesn't lose them.
+    '''
+    def __init__(self):
+        Unique.__init__(self, "users", "handle_str")
+        # next number to try after each handle, and the numbers below it
+        # that have been freed since
+        self.suffixes = {}
+        self.freed = {}
+
+    def build(self, store):
+        entries = {}
+        # handles that have been given out with 0 after them
+        numbered = []
+        for key, record in store[self.collection].items():
+            value = record.get(self.field)
+            if value is not None:
+                entries[value] = key
+                if value[-1:] == "0":
+                    numbered.append(value[:-1])
+        # every number below the next one to try is taken, so it is the first
+        # number after 0 that no user has
+        suffixes = {}
+        for handle in numbered:
+            number = 1
+            while handle + str(number) in entries:
+                number += 1
+            suffixes[handle] = number
+        self.suffixes, self.freed = suffixes, {}
+        return entries
+
+    def unused(self, store, handle):
+        '''
+        Finds the handle for a new user whose handle would be `handle`
+
+        Arguments:
+            store (dict)   - the store
+            handle (str)   - the handle
+
+        Return Value:
+            `handle` if no user has it, and otherwise `handle` followed by
+            the smallest number that makes it one no user has
+        '''
+        if self.find(store, handle) is None:
+            return handle
+        freed = self.freed.get(handle)
+        while freed:
+            number = heapq.heappop(freed)
+            if self.find(store, handle + str(number)) is None:
+                return handle + str(number)
+        # every number below the next one to try is taken
+        number = self.suffixes.get(handle, 0)
+        while self.find(store, handle + str(number)) is not None:
+            number += 1
+        self.suffixes[handle] = number + 1
+        return handle + str(number)
+
+    def discard(self, store, value):
+        Unique.discard(self, store, value)
+        if value is None:
+            return
+        # a handle given out with a number after it can be given out again
+        for end in range(len(value)):
+            handle, digits = value[:end], value[end:]
+            suffix = self.suffixes.get(handle)
+            if suffix is not None and digits.isdecimal() and str(int(digits)) == digits and int(digits) < suffix:
+                heapq.heappush(self.freed.setdefault(handle, []), int(digits))
@@ -0,0 +1,820 @@
+import bisect
+import collections
+import io
+import itertools
+import os
+import pickle
+import struct
+import threading
+import weakref
+import zlib
+
+'''
+journal.py
+
+Change tracking and the append-only journal used by the Datastore.
+
+When a dict or list is put into the store it is replaced by a TrackedDict or
+TrackedList. These behave exactly like the builtin types, except that every
+mutation is also recorded in the store's ChangeLog as a small operation, eg.
+
+    ("append", ("channels", 0, "messages"), 12)
+    ("setitem", ("messages",), 12, { "message_id": 12, ... })
+
+Each time the store is set, the recorded operations are appended to the
+journal file as one frame. On startup the latest snapshot is loaded and every
+frame written after it is replayed on top, so the cost of a write is the size
+of the change rather than the size of the whole store.
+
+Each frame is laid out as:
+
+    seq (8 bytes) | length (4 bytes) | crc32 (4 bytes) | pickled operations
+'''
+
+FRAME_HEADER = struct.Struct("<QII")
+
+class ChangeLog:
+    '''
+    Collects the operations recorded by the tracked containers of a store.
+    The root of the store has its ChangeLog as its parent.
+    '''
+    def __init__(self):
+        self.enabled = True
+        # when False only the parts of the store touched are kept, not the operations
+        self.keep_ops = True
+        self.__ops = []
+        self.__touched = set()
+
+    def record(self, op):
+        # values are pickled straight away, as they may be mutated later on
+        if self.enabled:
+            if self.keep_ops:
+                self.__ops.append(pickle.dumps(op, pickle.HIGHEST_PROTOCOL))
+            self.__touched.add(touched_key(op))
+
+    def pending(self):
+        return len(self.__ops)
+
+    def touched(self):
+        # parts of the store changed by the pending operations, see touched_key
+        return self.__touched
+
+    def take(self):
+        ops, self.__ops = self.__ops, []
+        self.__touched = set()
+        return ops
+
+    def mark(self):
+        # the pending operations so far, for rollback
+        return len(self.__ops), set(self.__touched)
+
+    def rollback(self, mark):
+        # forgets every operation recorded since `mark` was taken
+        count, touched = mark
+        del self.__ops[count:]
+        self.__touched = touched
+
+def touched_key(op):
+    '''
+    The part of the store an operation changes, eg. ("messages", 12) for a
+    change anywhere inside message 12, ("messages",) when the whole messages
+    collection is cleared, or ("message_id_tracker",) for a top level value
+    '''
+    kind, path = op[0], op[1]
+    if len(path) >= 2:
+        return path[:2]
+    if kind in ("setitem", "delitem"):
+        return path + (op[2],)
+    return path
+
+def locate(node):
+    '''
+    Find the ChangeLog and the path from the root of the store to `node`
+
+    Arguments:
+        node (TrackedDict or TrackedList)  - container inside a store
+
+    Return Value:
+        (ChangeLog, tuple) or (None, None) if `node` is no longer in a store
+    '''
+    path = []
+    while True:
+        parent = node._parent
+        if parent is None:
+            return None, None
+        if isinstance(parent, ChangeLog):
+            path.reverse()
+            return parent, tuple(path)
+        if isinstance(parent, list):
+            # list positions shift, so look the node up by identity
+            for index, item in enumerate(parent):
+                if item is node:
+                    path.append(index)
+                    break
+            else:
+                return None, None
+        else:
+            if not parent._holds(node._key, node):
+                return None, None
+            path.append(node._key)
+        node = parent
+
+# open copy-on-write snapshots of stores, see store_snapshot.py
+SNAPSHOTS = weakref.WeakSet()
+
+def preserve(node, key=None):
+    # called before `node` changes, so every open snapshot can keep what it
+    # held when the snapshot was taken. `key` is the only key of a dict that
+    # changes, or for a list that is only added to, the index added from
+    for snapshot in list(SNAPSHOTS):
+        snapshot.preserve(node, key)
+
+def record(node, *op):
+    changes, path = locate(node)
+    if changes is not None:
+        changes.record((op[0], path) + op[1:])
+
+def track(value, parent=None, key=None):
+    '''
+    Returns a tracked copy of `value` if it is a dict or list, with all of
+    its nested dicts and lists tracked as well. Any other value is returned
+    as is.
+
+    A LazyDict, or a tracked container that isn't part of a store yet (eg.
+    one built by snapshot_format.load), is adopted as is rather than copied.
+    '''
+    if isinstance(value, LazyDict) or (isinstance(value, (TrackedDict, TrackedList)) and value._parent is None):
+        value._parent, value._key = parent, key
+        return value
+    if isinstance(value, dict):
+        node = TrackedDict(parent, key)
+        for item_key, item in value.items():
+            dict.__setitem__(node, item_key, track(item, node, item_key))
+        return node
+    if isinstance(value, list):
+        node = (MemberList if key in MEMBER_FIELDS else TrackedList)(parent, key)
+        list.extend(node, [track(item, node) for item in value])
+        return node
+    return value
+
+def list_index(node, index):
+    # turn a negative list index into the position it refers to
+    if index < 0:
+        index += len(node)
+    if not 0 <= index < len(node):
+        raise IndexError("list index out of range")
+    return index
+
+class TrackedDict(dict):
+    __slots__ = ("_parent", "_key", "__weakref__")
+
+    def __init__(self, parent=None, key=None):
+        dict.__init__(self)
+        self._parent = parent
+        self._key = key
+
+    def _holds(self, key, node):
+        # whether `node` is still the value at `key`, used by locate
+        return dict.get(self, key) is node
+
+    # pickle and copy as a plain dict
+    def __reduce_ex__(self, protocol):
+        return (dict, (), None, None, iter(dict.items(self)))
+
+    def __setitem__(self, key, value):
+        if SNAPSHOTS:
+            preserve(self, key)
+        value = track(value, self, key)
+        dict.__setitem__(self, key, value)
+        record(self, "setitem", key, value)
+
+    def __delitem__(self, key):
+        if SNAPSHOTS:
+            preserve(self, key)
+        dict.__delitem__(self, key)
+        record(self, "delitem", key)
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def pop(self, key, *default):
+        if key not in self:
+            if default:
+                return default[0]
+            raise KeyError(key)
+        if SNAPSHOTS:
+            preserve(self, key)
+        value = dict.pop(self, key)
+        record(self, "delitem", key)
+        return value
+
+    def popitem(self):
+        if SNAPSHOTS:
+            preserve(self)
+        key, value = dict.popitem(self)
+        record(self, "delitem", key)
+        return key, value
+
+    def clear(self):
+        if SNAPSHOTS:
+            preserve(self)
+        dict.clear(self)
+        record(self, "clear")
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return dict.__getitem__(self, key)
+
+class TrackedList(list):
+    __slots__ = ("_parent", "_key")
+
+    def __init__(self, parent=None, key=None):
+        list.__init__(self)
+        self._parent = parent
+        self._key = key
+
+    # pickle and copy as a plain list
+    def __reduce_ex__(self, protocol):
+        return (list, (), None, iter(list.__iter__(self)), None)
+
+    def __assign(self):
+        # fallback for reorderings and slices, records the whole list
+        record(self, "assign", list(self))
+
+    def __setitem__(self, index, value):
+        if SNAPSHOTS:
+            preserve(self)
+        if isinstance(index, slice):
+            list.__setitem__(self, index, [track(item, self) for item in value])
+            self.__assign()
+            return
+        index = list_index(self, index)
+        value = track(value, self)
+        list.__setitem__(self, index, value)
+        record(self, "setitem", index, value)
+
+    def __delitem__(self, index):
+        if SNAPSHOTS:
+            preserve(self)
+        if isinstance(index, slice):
+            list.__delitem__(self, index)
+            self.__assign()
+            return
+        index = list_index(self, index)
+        list.__delitem__(self, index)
+        record(self, "delitem", index)
+
+    def __iadd__(self, values):
+        self.extend(values)
+        return self
+
+    def __imul__(self, times):
+        if SNAPSHOTS:
+            preserve(self)
+        list.__imul__(self, times)
+        self.__assign()
+        return self
+
+    def append(self, value):
+        if SNAPSHOTS:
+            preserve(self, len(self))
+        value = track(value, self)
+        list.append(self, value)
+        record(self, "append", value)
+
+    def extend(self, values):
+        if SNAPSHOTS:
+            preserve(self, len(self))
+        values = [track(item, self) for item in values]
+        list.extend(self, values)
+        record(self, "extend", values)
+
+    def insert(self, index, value):
+        # clamp the index the same way list.insert does
+        if index < 0:
+            index = max(0, len(self) + index)
+        index = min(index, len(self))
+        if SNAPSHOTS:
+            preserve(self)
+        value = track(value, self)
+        list.insert(self, index, value)
+        record(self, "insert", index, value)
+
+    def remove(self, value):
+        self.__delitem__(self.index(value))
+
+    def pop(self, index=-1):
+        index = list_index(self, index)
+        if SNAPSHOTS:
+            preserve(self)
+        value = list.pop(self, index)
+        record(self, "delitem", index)
+        return value
+
+    def clear(self):
+        if SNAPSHOTS:
+            preserve(self)
+        list.clear(self)
+        record(self, "clear")
+
+    def sort(self, *args, **kwargs):
+        if SNAPSHOTS:
+            preserve(self)
+        list.sort(self, *args, **kwargs)
+        self.__assign()
+
+    def reverse(self):
+        if SNAPSHOTS:
+            preserve(self)
+        list.reverse(self)
+        self.__assign()
+
+# fields of channels and dms that hold the u_ids of their members
+MEMBER_FIELDS = frozenset(("all_members", "owner_members", "members"))
+
+class MemberList(TrackedList):
+    '''
+    TrackedList of the members of a channel or dm. It is stored, journaled
+    and snapshotted as the list it is, in the order the members were added,
+    and keeps next to it a ticket for each u_id it holds, numbered in the
+    order of the list. A member removed leaves its ticket behind as a
+    tombstone, so the position of a member is its ticket less the tombstones
+    before it, and `in`, index and remove find a member without looking
+    through the list. The tickets are made the first time they are needed,
+    numbered afresh once half of them are tombstones, and made again after
+    anything changes the list other than adding members to the end of it or
+    removing them, see recount. A list holding a u_id twice has no tickets,
+    and finds its members as a TrackedList does.
+    '''
+    __slots__ = ("_tickets", "_tombstones", "_next")
+
+    def __init__(self, parent=None, key=None):
+        TrackedList.__init__(self, parent, key)
+        self.recount()
+
+    def recount(self):
+        # made again when next needed
+        self._tickets = None
+        self._tombstones = []
+        self._next = 0
+
+    def __index(self):
+        # the ticket of each member, or None if the list can't have them
+        tickets = self._tickets
+        if tickets is None:
+            values = list.copy(self)
+            try:
+                tickets = dict(zip(values, itertools.count()))
+            except TypeError:
+                return None
+            if len(tickets) != len(values):
+                return None
+            self._tickets, self._tombstones, self._next = tickets, [], len(values)
+        return tickets
+
+    def __position(self, ticket):
+        return ticket - bisect.bisect_left(self._tombstones, ticket)
+
+    def __added(self, values):
+        tickets = self._tickets
+        if tickets is not None:
+            for value in values:
+                try:
+                    if value in tickets:
+                        self.recount()
+                        return
+                    tickets[value] = self._next
+                except TypeError:
+                    self.recount()
+                    return
+                self._next += 1
+
+    def __removed(self, value):
+        tickets = self._tickets
+        if tickets is not None:
+            bisect.insort(self._tombstones, tickets.pop(value))
+            if len(self._tombstones) * 2 > self._next:
+                self.recount()
+
+    def holds(self, value):
+        '''
+        Whether the list holds `value`, from its tickets alone, so it can be
+        asked while the list is being changed, eg. through a snapshot
+
+        Return Value:
+            True or False, or None if the list has no tickets to tell by
+        '''
+        tickets = self._tickets
+        if tickets is None:
+            return None
+        try:
+            return value in tickets
+        except TypeError:
+            return None
+
+    def __contains__(self, value):
+        tickets = self.__index()
+        if tickets is None:
+            return list.__contains__(self, value)
+        try:
+            return value in tickets
+        except TypeError:
+            # unhashable, so can't be a u_id
+            return False
+
+    def index(self, value, *args):
+        tickets = self.__index()
+        if args or tickets is None:
+            return list.index(self, value, *args)
+        try:
+            return self.__position(tickets[value])
+        except (KeyError, TypeError):
+            raise ValueError(f"{value!r} is not in list") from None
+
+    def remove(self, value):
+        index = self.index(value)
+        TrackedList.__delitem__(self, index)
+        self.__removed(value)
+
+    def __setitem__(self, index, value):
+        TrackedList.__setitem__(self, index, value)
+        self.recount()
+
+    def __delitem__(self, index):
+        if isinstance(index, slice):
+            TrackedList.__delitem__(self, index)
+            self.recount()
+            return
+        value = list.__getitem__(self, index)
+        TrackedList.__delitem__(self, index)
+        self.__removed(value)
+
+    def __imul__(self, times):
+        TrackedList.__imul__(self, times)
+        self.recount()
+        return self
+
+    def append(self, value):
+        TrackedList.append(self, value)
+        self.__added((value,))
+
+    def extend(self, values):
+        values = list(values)
+        TrackedList.extend(self, values)
+        self.__added(values)
+
+    def insert(self, index, value):
+        end = index >= len(self)
+        TrackedList.insert(self, index, value)
+        if end:
+            self.__added((value,))
+        else:
+            self.recount()
+
+    def pop(self, index=-1):
+        value = TrackedList.pop(self, index)
+        self.__removed(value)
+        return value
+
+    def clear(self):
+        TrackedList.clear(self)
+        self._tickets, self._tombstones, self._next = {}, [], 0
+
+    def sort(self, *args, **kwargs):
+        TrackedList.sort(self, *args, **kwargs)
+        self.recount()
+
+    def reverse(self):
+        TrackedList.reverse(self)
+        self.recount()
+
+class LazyDict(TrackedDict):
+    '''
+    TrackedDict whose records stay on disk until they are accessed, eg. the
+    messages of a store kept in SQLite.
+
+    The dict itself only holds the records that are pinned in memory, ie. the
+    ones changed since the store was last written. A record that has been
+    loaded stays in memory while anything still refers to it, and the `hot`
+    most recently loaded records are kept around as well. Everything else is
+    loaded again from `source` the next time it is accessed.
+
+    `source` reads the records as they were last written, and provides
+        fetch(keys)    - dict of key to plain record, for the keys that exist
+        contains(key)  - whether there is a record for key
+        keys()         - list of every key, in order
+    '''
+    __slots__ = ("_source", "_alive", "_hot", "_hot_size", "_removed", "_lock")
+
+    def __init__(self, source, hot_size=1000):
+        TrackedDict.__init__(self)
+        self._source = source
+        self._alive = weakref.WeakValueDictionary()
+        self._hot = collections.OrderedDict()
+        self._hot_size = hot_size
+        # keys removed since the last write, which the source still has
+        self._removed = set()
+        # readers sharing the store's lock can load records at the same time
+        self._lock = threading.RLock()
+
+    def _holds(self, key, node):
+        if dict.get(self, key) is node:
+            return True
+        if self._alive.get(key) is node:
+            # the record is about to change, so pin it until it is written
+            dict.__setitem__(self, key, node)
+            return True
+        return False
+
+    def _keep(self, key, value):
+        # keeps a record that is no longer pinned for as long as it is in use
+        self._alive[key] = value
+        self._hot.pop(key, None)
+        self._hot[key] = value
+        if len(self._hot) > self._hot_size:
+            self._hot.popitem(last=False)
+
+    def __lookup(self, key):
+        value = dict.get(self, key)
+        if value is None:
+            value = self._alive.get(key)
+        if value is None and key not in self._removed:
+            self.prefetch([key])
+            value = self._alive.get(key)
+        return value
+
+    def prefetch(self, keys):
+        '''
+        Loads every record in `keys` that isn't in memory yet, in one read
+        '''
+        with self._lock:
+            missing = [
+                key for key in keys
+                if not dict.__contains__(self, key) and key not in self._alive and key not in self._removed
+            ]
+            if missing:
+                for key, value in self._source.fetch(missing).items():
+                    self._keep(key, track(value, self, key))
+
+    def resident(self):
+        '''
+        Keys of the records held in memory, ie. pinned or recently loaded,
+        without loading any
+
+        Return Value:
+            list of keys
+        '''
+        with self._lock:
+            return list(dict.keys(self)) + [key for key in self._hot if not dict.__contains__(self, key)]
+
+    def in_memory(self, key):
+        '''
+        The record at `key` if it is held in memory, without loading it
+
+        Return Value:
+            the record, or None
+        '''
+        with self._lock:
+            record = dict.get(self, key)
+            return record if record is not None else self._alive.get(key)
+
+    def trim(self, touched):
+        '''
+        Unpins every record that has been written to disk
+
+        Arguments:
+            touched (set)  - ChangeLog.touched(), the changes not written yet
+        '''
+        if (self._key,) in touched:
+            return
+        with self._lock:
+            for key in list(dict.keys(self)):
+                if (self._key, key) not in touched:
+                    self._keep(key, dict.pop(self, key))
+            self._removed = {key for key in self._removed if (self._key, key) in touched}
+
+    def __getitem__(self, key):
+        value = self.__lookup(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        value = self.__lookup(key)
+        return default if value is None else value
+
+    def __contains__(self, key):
+        if dict.__contains__(self, key) or key in self._alive:
+            return True
+        return key not in self._removed and self._source.contains(key)
+
+    def __setitem__(self, key, value):
+        if SNAPSHOTS:
+            # before the key is un-removed, or a snapshot would see the old record
+            preserve(self, key)
+        self._removed.discard(key)
+        TrackedDict.__setitem__(self, key, value)
+        self._keep(key, dict.__getitem__(self, key))
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        if SNAPSHOTS:
+            preserve(self, key)
+        dict.pop(self, key, None)
+        self._alive.pop(key, None)
+        self._hot.pop(key, None)
+        self._removed.add(key)
+        record(self, "delitem", key)
+
+    def pop(self, key, *default):
+        if key not in self:
+            if default:
+                return default[0]
+            raise KeyError(key)
+        value = self[key]
+        del self[key]
+        return value
+
+    def popitem(self):
+        keys = self.keys()
+        if not keys:
+            raise KeyError("popitem(): dictionary is empty")
+        return keys[-1], self.pop(keys[-1])
+
+    def clear(self):
+        if SNAPSHOTS:
+            # open snapshots have to keep every record
+            for key in self.keys():
+                preserve(self, key)
+        dict.clear(self)
+        self._alive = weakref.WeakValueDictionary()
+        self._hot.clear()
+        self._removed.update(self._source.keys())
+        record(self, "clear")
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def keys(self):
+        keys = [key for key in self._source.keys() if key not in self._removed]
+        stored = set(keys)
+        keys.extend(key for key in dict.keys(self) if key not in stored)
+        return keys
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def values(self):
+        return (self[key] for key in self.keys())
+
+    def items(self):
+        return ((key, self[key]) for key in self.keys())
+
+    def copy(self):
+        return dict(self.items())
+
+    def __eq__(self, other):
+        return dict(self.items()) == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    # pickle and copy as a plain dict holding every record
+    def __reduce_ex__(self, protocol):
+        return (dict, (), None, None, self.items())
+
+def apply_op(store, op):
+    '''
+    Apply an operation recorded by a ChangeLog to a plain store
+
+    Arguments:
+        store (dict)  - store to apply the operation to
+        op (tuple)    - (kind, path, *args)
+    '''
+    kind, path, args = op[0], op[1], op[2:]
+    node = store
+    for key in path:
+        node = node[key]
+
+    if kind == "setitem":
+        node[args[0]] = args[1]
+    elif kind == "delitem":
+        del node[args[0]]
+    elif kind == "clear":
+        node.clear()
+    elif kind == "append":
+        node.append(args[0])
+    elif kind == "extend":
+        node.extend(args[0])
+    elif kind == "insert":
+        node.insert(args[0], args[1])
+    elif kind == "assign":
+        node[:] = args[0]
+    else:
+        raise ValueError(f"unknown journal operation {kind}")
+
+class Journal:
+    '''
+    Append-only file of frames of operations
+    '''
+    def __init__(self, path):
+        self.path = path
+        try:
+            self.size = os.path.getsize(path)
+        except FileNotFoundError:
+            self.size = 0
+
+    def append(self, seq, ops):
+        payload = b"".join(ops)
+        header = FRAME_HEADER.pack(seq, len(payload), zlib.crc32(payload))
+        with open(self.path, "ab") as FILE:
+            FILE.write(header + payload)
+        self.size += len(header) + len(payload)
+
+    def sync(self):
+        # makes sure every frame appended so far is on the disk
+        try:
+            fd = os.open(self.path, os.O_RDONLY)
+        except FileNotFoundError:
+            return
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def frames(self):
+        '''
+        Reads every complete frame in the journal
+
+        Return Value:
+            frames (list of (seq, payload))
+            end (int) - offset just after the last complete frame
+        '''
+        try:
+            with open(self.path, "rb") as FILE:
+                data = FILE.read()
+        except FileNotFoundError:
+            return [], 0
+
+        frames = []
+        end = 0
+        while end + FRAME_HEADER.size <= len(data):
+            seq, length, crc = FRAME_HEADER.unpack_from(data, end)
+            start = end + FRAME_HEADER.size
+            payload = data[start:start + length]
+            # a torn or corrupted frame marks the end of the journal
+            if len(payload) != length or zlib.crc32(payload) != crc:
+                break
+            frames.append((seq, payload))
+            end = start + length
+        return frames, end
+
+    def replay(self, store, after_seq, upgrade=None):
+        '''
+        Applies every frame written after `after_seq` to `store`. A torn
+        frame left behind by a crash is cut off the end of the file.
+
+        Arguments:
+            store (dict)        - plain store loaded from the snapshot
+            after_seq (int)     - seq of the last frame in the snapshot
+            upgrade (function)  - applied to each operation before it is,
+                                  see migrations.upgrade_op
+
+        Return Value:
+            seq (int) of the last frame applied
+        '''
+        frames, end = self.frames()
+        for seq, payload in frames:
+            if seq <= after_seq:
+                continue
+            stream = io.BytesIO(payload)
+            while stream.tell() < len(payload):
+                op = pickle.load(stream)
+                apply_op(store, upgrade(op) if upgrade else op)
+            after_seq = seq
+
+        if end < self.size:
+            with open(self.path, "r+b") as FILE:
+                FILE.truncate(end)
+            self.size = end
+        return after_seq
+
+    def reset(self):
+        with open(self.path, "wb"):
+            pass
+        self.size = 0
@@ -0,0 +1,167 @@
+import heapq
+import sys
+import time
+from src.data_store import data_store
+from src.journal import LazyDict
+
+'''
+memory_report.py
+
+What the memory the store takes is spent on: the deep size of every top
+level value of the store, and for each collection of records (users,
+channels, dms and messages) the size of each field of the records, eg. the
+user_stats histories or the notifications of the users, with the records
+that are largest overall and in each field.
+
+The store is walked a batch of records at a time, each batch in a unit of
+work of its own with a pause after it, so a report on a live server doesn't
+hold up requests for long. Only records held in memory are counted: the
+messages a storage leaves on disk (see journal.LazyDict) or has moved into
+the cold tier (see cold_tier.py) aren't loaded just to be measured.
+
+Sizes are what sys.getsizeof says of every dict, list and value in a record.
+Values Python shares between every record rather than allocating each time
+(None, True and False, small ints, and the field names, which are the same
+strings in every record) aren't counted.
+
+    python3 -m src.memory_report [top]
+'''
+
+COLLECTIONS = ("users", "channels", "dms", "messages")
+
+# records measured in one unit of work, and seconds between units of work
+BATCH = 1000
+PAUSE = 0.001
+
+def deep_size(value, seen=None):
+    '''
+    Size in bytes of value and everything it holds, counting any object it
+    holds more than once only once
+    '''
+    if value is None or isinstance(value, bool) or (isinstance(value, int) and -5 <= value <= 256):
+        return 0
+    if seen is None:
+        seen = set()
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        for key, item in dict.items(value):
+            size += (0 if isinstance(key, str) else deep_size(key, seen)) + deep_size(item, seen)
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        for item in value:
+            size += deep_size(item, seen)
+    return size
+
+def resident(records):
+    # keys of the records of a collection that are held in memory
+    if isinstance(records, LazyDict):
+        return records.resident()
+    return list(records.keys())
+
+def in_memory(records, key):
+    # a record held in memory, or None, never loading it
+    if isinstance(records, LazyDict):
+        return records.in_memory(key)
+    return records.get(key)
+
+def largest(heap, top, item):
+    # keeps the `top` largest (bytes, id) pairs in heap
+    if len(heap) < top:
+        heapq.heappush(heap, item)
+    else:
+        heapq.heappushpop(heap, item)
+
+def ranked(heap):
+    return [{"id": key, "bytes": size} for size, key in sorted(heap, reverse=True)]
+
+def report(data_store, top=5, batch=BATCH, pause=PAUSE):
+    '''
+    Measures the store of data_store
+
+    Arguments:
+        data_store (Datastore)  - store to measure
+        top (int)               - number of largest records to list
+        batch (int)             - most records measured in one unit of work
+        pause (float)           - seconds between units of work
+
+    Return Value:
+        dictionary with the total size in bytes ("bytes"), the size of each
+        top level value of the store ("keys"), and for each collection of
+        records ("collections") the number of records ("records") and how many
+        of them are in memory ("resident"), their total and average size
+        ("bytes", "average"), the `top` largest ("largest"), and the total and
+        average size of each field, with the `top` records largest in it
+        ("fields")
+    '''
+    with data_store.read() as store:
+        names = list(store.keys())
+        keys = {name: deep_size(store[name]) for name in names if name not in COLLECTIONS}
+        collections = {
+            name: (len(store[name]), resident(store[name]))
+            for name in COLLECTIONS if name in names
+        }
+
+    details = {}
+    for name, (count, record_ids) in collections.items():
+        collection = {"records": count, "resident": 0, "bytes": 0, "largest": []}
+        fields = {}
+        for start in range(0, len(record_ids), batch):
+            with data_store.read() as store:
+                records = store[name]
+                # the collection itself, ie. the table of its records
+                if start == 0:
+                    collection["bytes"] += sys.getsizeof(records)
+                for record_id in record_ids[start:start + batch]:
+                    record = in_memory(records, record_id)
+                    if record is None:
+                        continue
+                    seen = set()
+                    size = sys.getsizeof(record) + deep_size(record_id, seen)
+                    seen.add(id(record))
+                    for field, value in dict.items(record):
+                        field_size = deep_size(value, seen)
+                        size += field_size
+                        totals = fields.setdefault(field, {"bytes": 0, "largest": []})
+                        totals["bytes"] += field_size
+                        largest(totals["largest"], top, (field_size, record_id))
+                    collection["resident"] += 1
+                    collection["bytes"] += size
+                    largest(collection["largest"], top, (size, record_id))
+            time.sleep(pause)
+
+        resident_records = max(collection["resident"], 1)
+        collection["average"] = collection["bytes"] / resident_records
+        collection["largest"] = ranked(collection["largest"])
+        collection["fields"] = {
+            field: {"bytes": totals["bytes"], "average": totals["bytes"] / resident_records,
+                    "largest": ranked(totals["largest"])}
+            for field, totals in sorted(fields.items(), key=lambda item: -item[1]["bytes"])
+        }
+        details[name] = collection
+        keys[name] = collection["bytes"]
+
+    keys = {name: keys[name] for name in names if name in keys}
+    return {"bytes": sum(keys.values()), "keys": keys, "collections": details}
+
+def megabytes(size):
+    return f"{size / 2 ** 20:.2f} MB"
+
+def print_report(result):
+    # the report as tables, largest first
+    print(f"total {megabytes(result['bytes'])}")
+    for name, size in sorted(result["keys"].items(), key=lambda item: -item[1]):
+        print(f"    {name:<24} {megabytes(size):>12}")
+    for name, collection in result["collections"].items():
+        print(f"\n{name}: {collection['records']} records, {collection['resident']} in memory, "
+              f"{megabytes(collection['bytes'])}, {collection['average']:.0f} bytes each")
+        for field, totals in collection["fields"].items():
+            outliers = ", ".join(f"{item['id']} ({item['bytes']} bytes)" for item in totals["largest"])
+            print(f"    {field:<16} {megabytes(totals['bytes']):>12} {totals['average']:>9.0f} each   largest: {outliers}")
+        outliers = ", ".join(f"{item['id']} ({item['bytes']} bytes)" for item in collection["largest"])
+        print(f"    largest records: {outliers}")
+
+if __name__ == "__main__":
+    data_store.load()
+    print_report(report(data_store, int(sys.argv[1]) if len(sys.argv) > 1 else 5, pause=0))
@@ -1,7 +1,7 @@
 from src.error import AccessError, InputError
 from src.data_store import data_store
 from src.sessions import get_auth_user_id
-from src.user import notifications_send_reacted, notifications_send_tagged
+from src.user import find_joined_location, notifications_send_reacted, notifications_send_tagged
 from src.stats import *
 from src.gen_timestamp import get_curr_timestamp
 import re
@@ -50,7 +50,6 @@ def message_send_v1(token, channel_id, message):
 
     # at this point, everything is valid
     message_id_tracker = store["message_id_tracker"]
-    channel_messages = channel_info["messages"]
 
     # timestamp
     timestamp = get_curr_timestamp()
@@ -73,13 +72,8 @@ def message_send_v1(token, channel_id, message):
         "is_pinned":    False
     }
 
-    # append new message_id to the channel messages list
-    channel_messages.append(message_id_tracker)
-
-    messages = store["messages"]
-    messages[message_id_tracker] = new_message
-
-    store["message_id_tracker"] = message_id_tracker + 1
+    # append new message to the channel messages list
+    data_store.insert_message("channel", channel_id, new_message)
 
     # Update user_stats and workspace_stats for messages_sent
     update_workspace_stats_messages("add")
@@ -120,36 +114,9 @@ def message_edit_v1(token, message_id, message):
     auth_user_id = get_auth_user_id(token)
 
     store = data_store.get()
-    channels = store["channels"]
-    dms = store["dms"]
 
-    location_found = False
-    location_info = {}
-    location_type = ""
     # check message_id is within a channel/dm that the user has joined
-
-    # find location of message_id
-    for ch_id, channel in channels.items():
-        if auth_user_id in channel["all_members"]:
-            if message_id in channel["messages"]:
-                location_found = True
-                location_info = channel
-                location_id = ch_id
-                location_type = "channel"
-                break
-    
-    if location_found == False:
-        for dm_id, dm in dms.items():
-            if auth_user_id in dm["members"]:
-                if message_id in dm["messages"]:
-                    location_found = True
-                    location_info = dm
-                    location_id = dm_id
-                    location_type = "dm"
-                    break
-    
-    if location_found == False:
-        raise InputError(description="message_id not within a channel/dm that the user has joined")
+    location_type, location_id, location_info = find_joined_location(store, auth_user_id, message_id)
 
     # if it reaches this point, the user is part of the channel/dm of the message
     # and a valid location has been found
@@ -176,6 +143,7 @@ def message_edit_v1(token, message_id, message):
         location_info["messages"].remove(message_id)
         # this will work whether location_type is a channel or dm
         store["messages"].pop(message_id)
+        data_store.message_locations.discard(store, [message_id])
         update_workspace_stats_messages("remove")
     else:
         notifications_send_tagged(auth_user_id, message, location_id, location_type)
@@ -210,10 +178,16 @@ def message_remove_v1(token, message_id):
     return {}
 
 # add user's reacts info to a list of messages based on if the caller_id has reacted to messages
+# returns copies of `messages` with whether auth_user_id reacted added to each
+# react, leaving the store as it is so messages can be read under a shared lock
 def add_user_react_info(auth_user_id, messages):
-    for message in messages:
-        react = message["reacts"][0]
-        react["is_this_user_reacted"] = auth_user_id in react["u_ids"]
+    return [
+        {**message, "reacts": [
+            {**react, "u_ids": list(react["u_ids"]), "is_this_user_reacted": auth_user_id in react["u_ids"]}
+            for react in message["reacts"]
+        ]}
+        for message in messages
+    ]
 
 
 # returns a list of type `messages` which contain the `query_str`.
@@ -263,16 +237,14 @@ def search_v1(token, query_str):
     matches = []
     # stores the valid messages which match the query string
 
-    for channel in channels.values():
-        if auth_user_id in channel["all_members"]:
-            matches += helper_search_v1(all_messages, channel["messages"], auth_user_id, query_str)
+    for channel_id in data_store.joined("channel", auth_user_id):
+        matches += helper_search_v1(all_messages, channels[channel_id]["messages"], auth_user_id, query_str)
 
-    for dm in dms.values():
-        if auth_user_id in dm["members"]:
-            matches += helper_search_v1(all_messages, dm["messages"], auth_user_id, query_str)
+    for dm_id in data_store.joined("dm", auth_user_id):
+        matches += helper_search_v1(all_messages, dms[dm_id]["messages"], auth_user_id, query_str)
 
     # Add info about if the caller user has reacted to each message in the list of messages
-    add_user_react_info(auth_user_id, matches)
+    matches = add_user_react_info(auth_user_id, matches)
 
     return {
         "messages": matches
@@ -367,26 +339,22 @@ def helper_msg_sendlater(channel_id, user_id, new_message):
     Return Value:
         None
     '''
-    #load data store
-    store = data_store.get()
-    message_id_tracker = store["message_id_tracker"]
-    channels = store["channels"]
-
-    #add the new message to the data store
-    all_messages = channels[channel_id]["messages"]
-    all_messages.append(message_id_tracker)
-    store["messages"][message_id_tracker] = new_message
+    # runs on a timer thread, so has to take the store for writing itself
+    with data_store.transaction():
+        #load data store
+        store = data_store.get()
 
-    # send notifications to tagged users
-    notifications_send_tagged(user_id, new_message["message"], channel_id, "channel")
+        #add the new message to the data store
+        data_store.insert_message("channel", channel_id, new_message)
 
-    store["message_id_tracker"] = message_id_tracker + 1
+        # send notifications to tagged users
+        notifications_send_tagged(user_id, new_message["message"], channel_id, "channel")
 
-    # Update user_stats and workspace stats for messages_sent
-    update_workspace_stats_messages("add")
-    update_user_stats_messages(user_id)
+        # Update user_stats and workspace stats for messages_sent
+        update_workspace_stats_messages("add")
+        update_user_stats_messages(user_id)
 
-    data_store.set(store)
+        data_store.set(store)
 
 def message_pin_v1(token, message_id):
     '''
@@ -412,35 +380,10 @@ def message_pin_v1(token, message_id):
     auth_user_id = get_auth_user_id(token)
 
     store = data_store.get()
-    channels = store["channels"]
-    dms = store["dms"]
     messages = store["messages"]
 
-    location_found = False    
-    location_info = {}
-    location_type = ""
-    
     # check message_id is within a channel/dm that the user has joined
-    # find location of message_id
-    for channel in channels.values():
-        if auth_user_id in channel["all_members"]:
-            if message_id in channel["messages"]:
-                location_found = True
-                location_info = channel
-                location_type = "channel"
-                break
-    
-    if location_found == False:
-        for dm in dms.values():
-            if auth_user_id in dm["members"]:
-                if message_id in dm["messages"]:
-                    location_found = True
-                    location_info = dm
-                    location_type = "dm"
-                    break
-    
-    if location_found == False:
-        raise InputError(description="message_id not within a channel/dm that the user has joined")
+    location_type, _, location_info = find_joined_location(store, auth_user_id, message_id)
     
     if messages[message_id]["is_pinned"] == True:
         raise InputError(description="The message is already pinned")
@@ -484,35 +427,10 @@ def message_unpin_v1(token, message_id):
     auth_user_id = get_auth_user_id(token)
 
     store = data_store.get()
-    channels = store["channels"]
-    dms = store["dms"]
     messages = store["messages"]
 
-    location_found = False    
-    location_info = {}
-    location_type = ""
-    
     # check message_id is within a channel/dm that the user has joined
-    # find location of message_id
-    for channel in channels.values():
-        if auth_user_id in channel["all_members"]:
-            if message_id in channel["messages"]:
-                location_found = True
-                location_info = channel
-                location_type = "channel"
-                break
-    
-    if location_found == False:
-        for dm in dms.values():
-            if auth_user_id in dm["members"]:
-                if message_id in dm["messages"]:
-                    location_found = True
-                    location_info = dm
-                    location_type = "dm"
-                    break
-    
-    if location_found == False:
-        raise InputError(description="message_id not within a channel/dm that the user has joined")
+    location_type, _, location_info = find_joined_location(store, auth_user_id, message_id)
     
     if messages[message_id]["is_pinned"] == False:
         raise InputError(description="The message is already not pinned")
@@ -0,0 +1,158 @@
+import pickle
+import threading
+import time
+from src import config
+from src.data_store import data_store
+
+'''
+message_gc.py
+
+Collects the messages no channel or dm refers to any more, eg. every
+message of a dm removed by dm_remove_v1, which would otherwise stay in the
+store, and so in memory and in every snapshot, for good.
+
+A cycle of the collector first marks every message_id some channel or dm
+holds, then deletes every other message, in small batches each in a unit
+of work of its own with a pause after it, so a request is never held up by
+more than one batch, however many messages there are. A message that is
+referred to when the cycle begins can't lose its channel or dm without
+becoming garbage, and messages sent once the cycle has begun are newer
+than any it deletes, so the store can go on changing between batches.
+clear_v1 starts the message_ids over, so a cycle that sees that happen
+stops where it is, and as the message_ids may have gone past where they
+were by then, each message is checked again against the Datastore's index
+of message locations before it is deleted.
+
+The collector runs in a background thread every config.message_gc_interval
+seconds, and keeps count of what it has reclaimed, see metrics.
+'''
+
+class MessageCollector:
+    '''
+    Incremental collector of the orphaned messages of a Datastore
+
+    Arguments:
+        data_store (Datastore)  - store to collect
+        batch (int)             - most channels or dms marked, or messages
+                                  deleted, in one unit of work
+        pause (int)             - milliseconds between units of work
+    '''
+    def __init__(self, data_store, batch=config.message_gc_batch, pause=config.message_gc_pause):
+        self.data_store = data_store
+        self.batch = batch
+        self.pause = pause / 1000
+        self.__lock = threading.Lock()
+        self.__stopped = threading.Event()
+        self.__thread = None
+        self.__metrics = {
+            "cycles":               0,
+            "records_reclaimed":    0,
+            "bytes_reclaimed":      0,
+            "last_cycle":           None
+        }
+
+    def collect(self):
+        '''
+        Runs one whole cycle of the collector
+
+        Return Value:
+            dictionary of the messages deleted ("records"), the size of their
+            pickles ("bytes"), when the cycle began ("time_start") and how
+            many seconds it took ("duration"), or None if it was stopped
+        '''
+        start = time.time()
+        with self.data_store.read() as store:
+            tracker = store["message_id_tracker"]
+            locations = [(collection, list(store[collection])) for collection in ("channels", "dms")]
+
+        # mark
+        referenced = set()
+        for collection, location_ids in locations:
+            for index in range(0, len(location_ids), self.batch):
+                with self.data_store.read() as store:
+                    if not self.__still(store, tracker):
+                        return None
+                    for location_id in location_ids[index:index + self.batch]:
+                        location = store[collection].get(location_id)
+                        if location is not None:
+                            referenced.update(location["messages"])
+                if self.__stopped.wait(self.pause):
+                    return None
+
+        # sweep every message from before the cycle that wasn't marked
+        with self.data_store.read() as store:
+            orphans = [
+                message_id for message_id in store["messages"].keys()
+                if message_id < tracker and message_id not in referenced
+            ]
+        cycle = {"records": 0, "bytes": 0, "time_start": int(start), "duration": 0}
+        for index in range(0, len(orphans), self.batch):
+            records, size = 0, 0
+            with self.data_store.write() as store:
+                if not self.__still(store, tracker):
+                    return None
+                messages = store["messages"]
+                locations = self.data_store.message_locations
+                for message_id in orphans[index:index + self.batch]:
+                    message = messages.get(message_id)
+                    # a message sent since the store was cleared may have
+                    # been given the message_id of one that wasn't marked
+                    if message is not None and locations.locate(store, message_id) is None:
+                        size += len(pickle.dumps(message, pickle.HIGHEST_PROTOCOL))
+                        del messages[message_id]
+                        records += 1
+                self.data_store.set(store)
+            cycle["records"] += records
+            cycle["bytes"] += size
+            with self.__lock:
+                self.__metrics["records_reclaimed"] += records
+                self.__metrics["bytes_reclaimed"] += size
+            if self.__stopped.wait(self.pause):
+                return None
+
+        cycle["duration"] = time.time() - start
+        with self.__lock:
+            self.__metrics["cycles"] += 1
+            self.__metrics["last_cycle"] = cycle
+        return cycle
+
+    def __still(self, store, tracker):
+        # whether the message_ids haven't started over since the cycle began
+        return store["message_id_tracker"] >= tracker
+
+    def metrics(self):
+        '''
+        Return Value:
+            dictionary of the number of cycles run ("cycles"), the number of
+            messages deleted ("records_reclaimed") and the size of their
+            pickles ("bytes_reclaimed") over every cycle, and the last cycle
+            run ("last_cycle", see collect, or None)
+        '''
+        with self.__lock:
+            return dict(self.__metrics)
+
+    def start(self, interval):
+        '''
+        Runs a cycle every `interval` seconds in a background thread, until
+        stop is called
+        '''
+        self.__stopped.clear()
+        if self.__thread is None:
+            self.__thread = threading.Thread(target=self.__loop, args=(interval,), daemon=True)
+            self.__thread.start()
+
+    def stop(self):
+        '''
+        Stops the background thread, leaving any cycle under way where it is
+        '''
+        self.__stopped.set()
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+
+    def __loop(self, interval):
+        while not self.__stopped.wait(interval):
+            self.collect()
+
+# the collector of the server's data store
+collector = MessageCollector(data_store)
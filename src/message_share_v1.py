@@ -1,7 +1,7 @@
 from src.error import AccessError, InputError
 from src.data_store import data_store
 from src.sessions import get_auth_user_id
-from src.user import notifications_send_reacted, notifications_send_tagged
+from src.user import find_joined_location, notifications_send_reacted, notifications_send_tagged
 from src.stats import *
 from src.gen_timestamp import get_curr_timestamp
 from src.dm import message_senddm_v1
@@ -45,22 +45,7 @@ def message_share_v1(token, og_message_id, message, channel_id, dm_id):
             raise AccessError(description = "user not member of dm, the message is being sent to")
 
     #check if the og message id belongs to a message
-    location_found = False
-    for channel in channels.values():
-        if auth_user_id in channel["all_members"]:
-            if og_message_id in channel["messages"]:
-                location_found = True
-                break
-    
-    if location_found == False:
-        for dm in dms.values():
-            if auth_user_id in dm["members"]:
-                if og_message_id in dm["messages"]:
-                    location_found = True
-                    break
-
-    if location_found == False:
-        raise InputError(description="message_id not within a channel/dm that the user has joined")
+    find_joined_location(store, auth_user_id, og_message_id)
 
     # get the message from og message id
     messages = store["messages"]
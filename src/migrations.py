@@ -0,0 +1,192 @@
+import copy
+import threading
+from src.journal import LazyDict, TrackedDict, TrackedList
+from src.snapshot_format import MessagePages
+
+'''
+migrations.py
+
+Changes to the shape of the records of the store, eg. a key every channel
+has from some release on, applied to the records stored before that release.
+
+Each collection of records (users, channels, dms and messages) has a list of
+migrations, and the number of them a record has been through is its
+version. Every snapshot says which version its collections are at (see
+storage.py), and loading an older one doesn't upgrade every record up front,
+which for millions of messages would hold up the restart: the collection is
+loaded as is, and each record is upgraded the first time it is accessed.
+
+Loading a collection into memory makes it a MigratingDict, which upgrades a
+record when it is first read, and loading messages from the pages of a
+snapshot upgrades each one as it is read from its page. Journal frames
+replayed on top of an older snapshot may set whole records as they were
+written then, so those are upgraded as they are replayed (see upgrade_op).
+The next snapshot written reads every record, so is entirely at the current
+version.
+
+A migration changes a record in place, and must leave a record that has
+already been through it as it is, eg. it only adds a key that is missing.
+To add one, append a function of the record to the collection's list,
+eg. had channels been stored before standups were added:
+
+    @migration("channels")
+    def add_standup(channel):
+        channel.setdefault("standup", {"is_active": False, "message_queue": [], "time_finish": 0})
+
+and never remove or reorder the ones already there. Every collection is at
+version 0 so far, which snapshots written before versions were kept are
+taken to be at too.
+'''
+
+# the migrations of each collection, in the order they were added
+MIGRATIONS = {
+    "users":    [],
+    "channels": [],
+    "dms":      [],
+    "messages": []
+}
+
+def migration(collection):
+    '''
+    Decorator adding a function of a record as the next migration of
+    `collection`
+    '''
+    def add(function):
+        MIGRATIONS[collection].append(function)
+        return function
+    return add
+
+def versions():
+    # the current version of each collection
+    return {collection: len(functions) for collection, functions in MIGRATIONS.items()}
+
+def upgrade(collection, record, version):
+    '''
+    Applies every migration of `collection` after `version` to `record`
+
+    Arguments:
+        collection (str)  - collection the record is in
+        record (dict)     - record stored at `version`
+        version (int)     - number of migrations it has been through
+
+    Return Value:
+        the record at the current version, as a plain dict if it had to change
+    '''
+    functions = MIGRATIONS[collection][version:]
+    if not functions or not isinstance(record, dict):
+        return record
+    if isinstance(record, (TrackedDict, TrackedList)):
+        # changing a tracked record would be seen by open snapshots as a change
+        # made to the store, so they'd go on seeing the record from before it
+        record = copy.deepcopy(record)
+    for function in functions:
+        function(record)
+    return record
+
+def outdated(schema):
+    # version of each collection stored at an older version than the current one
+    current = versions()
+    return {
+        collection: schema.get(collection, 0) for collection in current
+        if schema.get(collection, 0) < current[collection]
+    }
+
+def migrate(store, schema):
+    '''
+    Makes every collection of a store loaded from disk that is at an older
+    version upgrade its records as they are accessed
+
+    Arguments:
+        store (dict)   - store as loaded, before any journal is replayed
+        schema (dict)  - version each collection was stored at, where one
+                         stored before versions were kept is at 0
+    '''
+    for collection, version in outdated(schema).items():
+        records = store.get(collection)
+        if isinstance(records, MessagePages):
+            records.upgrade = lambda record, collection=collection, version=version: upgrade(collection, record, version)
+        elif isinstance(records, dict) and not isinstance(records, LazyDict):
+            store[collection] = MigratingDict(Unmigrated(records, collection, version))
+
+def upgrade_op(op, schema):
+    '''
+    An operation of a journal frame replayed on top of a store at the
+    versions in `schema`, with any whole record it sets upgraded
+
+    Arguments:
+        op (tuple)     - (kind, path, *args), see journal.py
+        schema (dict)  - version each collection was stored at, see migrate
+    '''
+    kind, path = op[0], op[1]
+    if kind != "setitem":
+        return op
+    versions = outdated(schema)
+    if len(path) == 1 and path[0] in versions:
+        return (kind, path, op[2], upgrade(path[0], op[3], versions[path[0]]))
+    if not path and op[2] in versions and isinstance(op[3], dict):
+        records = {key: upgrade(op[2], record, versions[op[2]]) for key, record in op[3].items()}
+        return (kind, path, op[2], records)
+    return op
+
+class Unmigrated:
+    '''
+    Source of a MigratingDict (see LazyDict), handing out each record of a
+    collection stored at an older version once, upgraded
+
+    Arguments:
+        records (dict)    - the collection as it was loaded
+        collection (str)  - which collection it is
+        version (int)     - version it was stored at
+    '''
+    def __init__(self, records, collection, version):
+        self.__lock = threading.Lock()
+        self.__records = dict(dict.items(records))
+        self.__keys = list(self.__records)
+        self.__collection = collection
+        self.__version = version
+
+    def fetch(self, keys):
+        records = {}
+        with self.__lock:
+            for key in keys:
+                if key in self.__records:
+                    record = self.__records.pop(key)
+                    if isinstance(record, (TrackedDict, TrackedList)):
+                        record._parent = None
+                    records[key] = upgrade(self.__collection, record, self.__version)
+        return records
+
+    def contains(self, key):
+        return key in self.__records
+
+    def keys(self):
+        # records already handed out keep their place
+        return list(self.__keys)
+
+    def discard(self, keys):
+        with self.__lock:
+            for key in keys:
+                self.__records.pop(key, None)
+            self.__keys = [key for key in self.__keys if key not in keys]
+
+class MigratingDict(LazyDict):
+    '''
+    LazyDict of a collection stored at an older version, see migrate
+
+    A record is upgraded when it is first accessed and from then on stays in
+    memory like the records of any other collection, since there is nowhere
+    to read it back from.
+    '''
+    __slots__ = ()
+
+    def _keep(self, key, value):
+        dict.__setitem__(self, key, value)
+        self._alive[key] = value
+
+    def trim(self, touched):
+        if (self._key,) in touched:
+            return
+        with self._lock:
+            removed = {key for key in self._removed if (self._key, key) not in touched}
+            self._source.discard(removed)
+            self._removed -= removed
@@ -2,11 +2,14 @@ from src.data_store import data_store
 
 def clear_v1():
     store = data_store.get()
-    store["users"] = {}
-    store["channels"] = {}
-    store["dms"] = {}
-    store["messages"] = {}
+    # collections are cleared in place, as the storage may load them lazily
+    store["users"].clear()
+    store["channels"].clear()
+    store["dms"].clear()
+    store["messages"].clear()
     store["session_id_tracker"] = 0
     store["dm_id_tracker"] = 0
     store["message_id_tracker"] = 0
+    # message_ids are given out again from 0
+    data_store.reset_indexes()
     data_store.set(store)
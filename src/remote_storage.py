@@ -0,0 +1,178 @@
+import os
+import pickle
+import socket
+import struct
+import threading
+from src.journal import apply_op
+
+'''
+remote_storage.py
+
+Storage for a Datastore whose store is kept by a store daemon (see
+store_server.py), so that several processes can serve requests from the
+same store.
+
+Each process keeps a copy of the whole store, which is brought up to date
+with the changes other processes have committed before every unit of work
+(see Datastore.begin). A unit of work that writes also takes the daemon's
+lock, so only one process writes at a time, and writing the store commits
+the operations recorded since the last write to the daemon, which persists
+them and hands them on to the other processes.
+
+Messages to and from the daemon are pickled tuples, each preceded by its
+length:
+
+    length (4 bytes) | pickled (command, *arguments)
+
+    ("load",)                   -> ("store", seq, store)
+    ("catch_up", seq, lock)     -> ("frames", seq, [(seq, ops), ...]) or
+                                   ("store", seq, store) if seq is too far behind
+    ("commit", ops)             -> ("committed", seq)
+    ("replace", store)          -> ("committed", seq)
+    ("unlock",)                 -> ("unlocked",)
+    any command                 -> ("error", description) if it failed
+
+seq numbers the commits, and ops are the pickled operations of a ChangeLog.
+catch_up with lock waits for the daemon's lock, and commit and replace take
+it if it isn't held already; each of them releases it again.
+'''
+
+MESSAGE_HEADER = struct.Struct("<I")
+
+def send_message(sock, message):
+    data = pickle.dumps(message, pickle.HIGHEST_PROTOCOL)
+    sock.sendall(MESSAGE_HEADER.pack(len(data)) + data)
+
+def receive_exactly(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return bytes(data)
+
+def receive_message(sock):
+    # the next message, or None once the other end has closed the connection
+    header = receive_exactly(sock, MESSAGE_HEADER.size)
+    if header is None:
+        return None
+    data = receive_exactly(sock, MESSAGE_HEADER.unpack(header)[0])
+    if data is None:
+        return None
+    return pickle.loads(data)
+
+class RemoteStorage:
+    '''
+    Store kept by the store daemon listening at `path`. The fsync policy is
+    the daemon's to apply, see config.store_persistence.
+    '''
+    records_changes = True
+    records_ops = True
+    pinned = frozenset()
+    lazy = False
+    # other processes change the store too
+    shared = True
+
+    def __init__(self, path, fsync):
+        self.path = path
+        self.fsync = fsync
+        # last commit applied to this process's store
+        self.seq = 0
+        # commits of this process made while it was behind, which it already has
+        self.own = set()
+        # whether this process holds the daemon's lock
+        self.locked = False
+        self.lock = threading.Lock()
+        self.sock = None
+        self.pid = None
+
+    def request(self, *message):
+        '''
+        Sends a message to the daemon and waits for its reply
+
+        Exceptions:
+            ConnectionError  - the daemon closed the connection
+            RuntimeError     - the daemon couldn't carry out the command
+        '''
+        with self.lock:
+            if self.sock is None or self.pid != os.getpid():
+                # a forked process can't share its parent's connection, and a
+                # new connection may be to a restarted daemon, whose seqs
+                # start over, so the whole store is fetched again
+                self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                self.sock.connect(self.path)
+                self.pid = os.getpid()
+                self.seq = -1
+            send_message(self.sock, message)
+            reply = receive_message(self.sock)
+        if reply is None:
+            self.sock = None
+            raise ConnectionError("the store daemon closed the connection")
+        if reply[0] == "error":
+            raise RuntimeError(reply[1])
+        return reply
+
+    def load(self, initial):
+        _, self.seq, store = self.request("load")
+        self.own = set()
+        return store
+
+    def catch_up(self, lock):
+        '''
+        Fetches the changes committed since this process last caught up
+
+        Arguments:
+            lock (bool)  - whether to take the daemon's lock first
+
+        Return Value:
+            update to give to apply, or None if there is nothing to apply
+        '''
+        reply = self.request("catch_up", self.seq, lock)
+        self.locked = lock
+        if reply[0] == "frames" and not reply[2]:
+            return None
+        return reply
+
+    def apply(self, store, update):
+        '''
+        Applies an update from catch_up to `store`, unless it has been
+        applied already
+
+        Return Value:
+            the store to replace `store` with, or None
+        '''
+        kind, seq = update[0], update[1]
+        if seq <= self.seq:
+            return None
+        if kind == "store":
+            self.seq = seq
+            self.own = set()
+            return update[2]
+        for frame_seq, ops in update[2]:
+            if frame_seq > self.seq and frame_seq not in self.own:
+                for op in ops:
+                    apply_op(store, pickle.loads(op))
+            self.seq = max(self.seq, frame_seq)
+        return None
+
+    def write(self, store, ops, touched):
+        if ops is None:
+            _, seq = self.request("replace", store)
+        elif ops:
+            _, seq = self.request("commit", ops)
+        else:
+            return False
+        self.locked = False
+        if seq == self.seq + 1:
+            self.seq = seq
+        else:
+            # committed without catching up first, the commits before it are still to come
+            self.own.add(seq)
+        return True
+
+    def release(self):
+        # called once a unit of work that writes ends, committed or not
+        if self.locked:
+            self.request("unlock")
+            self.locked = False
@@ -0,0 +1,71 @@
+import threading
+
+'''
+rwlock.py
+
+Reader-writer lock for the data store. Any number of threads can hold it
+for reading at once, or one thread for writing.
+'''
+
+class RWLock:
+    '''
+    A thread can take the lock again while it holds it, and can read while
+    it is writing, but can't start writing while it is only reading, as two
+    readers doing so would wait on each other forever. Writers that are
+    waiting go before readers that aren't in yet, so a steady stream of
+    reads can't keep a write out.
+    '''
+    def __init__(self):
+        self.__changed = threading.Condition()
+        self.__readers = 0
+        self.__writer = None
+        self.__writes = 0
+        self.__waiting_writers = 0
+        # reads held by each thread, and whether each one counts in __readers
+        self.__local = threading.local()
+
+    def __reads(self):
+        if not hasattr(self.__local, 'reads'):
+            self.__local.reads = []
+        return self.__local.reads
+
+    def acquire_read(self):
+        reads = self.__reads()
+        if reads or self.__writer == threading.get_ident():
+            # already holds the lock, so waiting for writers would deadlock
+            reads.append(False)
+            return
+        with self.__changed:
+            while self.__writer is not None or self.__waiting_writers:
+                self.__changed.wait()
+            self.__readers += 1
+        reads.append(True)
+
+    def release_read(self):
+        if self.__reads().pop():
+            with self.__changed:
+                self.__readers -= 1
+                if not self.__readers:
+                    self.__changed.notify_all()
+
+    def acquire_write(self):
+        me = threading.get_ident()
+        if self.__writer == me:
+            self.__writes += 1
+            return
+        if any(self.__reads()):
+            raise RuntimeError("can't write while holding the lock for reading")
+        with self.__changed:
+            self.__waiting_writers += 1
+            while self.__writer is not None or self.__readers:
+                self.__changed.wait()
+            self.__waiting_writers -= 1
+            self.__writer = me
+            self.__writes = 1
+
+    def release_write(self):
+        with self.__changed:
+            self.__writes -= 1
+            if not self.__writes:
+                self.__writer = None
+                self.__changed.notify_all()
@@ -1,11 +1,10 @@
 import sys
 import json
 import os
-import pickle
 import signal
 import requests
 from json import dumps, loads
-from flask import Flask, request, send_file
+from flask import Flask, g, request, send_file
 from flask_cors import CORS
 
 from src.error import InputError
@@ -23,10 +22,13 @@ from src.image_helper import *
 from src.standup import *
 from src.stats import *
 from src.message_share_v1 import *
+from src.message_gc import collector
 
 
 def quit_gracefully(*args):
     '''For coverage'''
+    # write out anything the write-behind thread hasn't persisted yet
+    data_store.close()
     exit(0)
 
 def defaultHandler(err):
@@ -48,6 +50,47 @@ APP.register_error_handler(Exception, defaultHandler)
 
 #### NO NEED TO MODIFY ABOVE THIS POINT, EXCEPT IMPORTS
 
+# endpoints that never change the data store, and the kind of unit of work
+# each runs in: reads run alongside each other, and the longest reads work on
+# a snapshot so they don't hold up writers either
+READ_ONLY_ENDPOINTS = {
+    "channel_messages": "read",
+    "dm_messages":      "read",
+    "search":           "snapshot",
+    "users_all":        "snapshot",
+    "users_stats":      "snapshot",
+    "admin_backup":     "snapshot",
+    "admin_gc_stats":   "read"
+}
+
+# endpoints that go through the whole store a batch at a time, each batch a
+# unit of work of its own, so aren't one unit of work from start to end
+INCREMENTAL_ENDPOINTS = {"admin_memory_report"}
+
+# each request is one unit of work, so the data store is written to disk at
+# most once per request no matter how many times it is set. every other
+# request is a transaction, so one that fails leaves nothing half done. a
+# unit of work that couldn't begin, eg. as the store daemon couldn't be
+# reached, has nothing to roll back or end
+@APP.before_request
+def begin_unit_of_work():
+    g.unit_of_work = False
+    if request.endpoint in INCREMENTAL_ENDPOINTS:
+        return
+    data_store.begin(READ_ONLY_ENDPOINTS.get(request.endpoint, "transaction"))
+    g.unit_of_work = True
+
+@APP.after_request
+def roll_back_failed_request(response):
+    if response.status_code >= 400 and g.get("unit_of_work") and request.endpoint not in READ_ONLY_ENDPOINTS:
+        data_store.roll_back()
+    return response
+
+@APP.teardown_request
+def end_unit_of_work(exception):
+    if g.get("unit_of_work"):
+        data_store.end()
+
 # Example
 @APP.route("/echo", methods=['GET'])
 def echo():
@@ -325,6 +368,34 @@ def admin_userpermission_change():
 
     return dumps(admin_userpermission_change_v1(token, u_id, permission_id))
 
+@APP.route("/admin/backup/v1", methods=['POST'])
+def admin_backup():
+    data = request.get_json()
+    token = data["token"]
+
+    return dumps(admin_backup_v1(token))
+
+@APP.route("/admin/restore/v1", methods=['POST'])
+def admin_restore():
+    data = request.get_json()
+
+    token = data["token"]
+    backup = data["backup"]
+
+    return dumps(admin_restore_v1(token, backup))
+
+@APP.route("/admin/gc/stats/v1", methods=['GET'])
+def admin_gc_stats():
+    token = request.args.get("token")
+
+    return dumps(admin_gc_stats_v1(token))
+
+@APP.route("/admin/memory/report/v1", methods=['GET'])
+def admin_memory_report():
+    token = request.args.get("token")
+
+    return dumps(admin_memory_report_v1(token))
+
 @APP.route("/notifications/get/v1", methods = ['GET'])
 def notifications_get():
     token = request.args.get("token")
@@ -477,15 +548,17 @@ def users_stats():
 
 if __name__ == "__main__":
     signal.signal(signal.SIGINT, quit_gracefully) # For coverage
-    try:
-        with open('database.p', 'rb') as FILE:
-            store = pickle.load(FILE)
-            data_store.set(store)
-    except FileNotFoundError:
-        data_store.__init__
+    # restore the latest snapshot and replay the journal on top of it
+    data_store.load()
+    if config.write_behind:
+        data_store.start_write_behind(config.write_behind_interval, config.write_behind_max_dirty)
+    # delete the messages of removed dms in the background
+    if config.message_gc_interval is not None:
+        collector.start(config.message_gc_interval)
     
     # updates user urls in data_store to new port
-    update_port_numbers(config.port)
+    with data_store.transaction():
+        update_port_numbers(config.port)
 
     APP.run(port=config.port) # Do not edit this port
     
@@ -0,0 +1,509 @@
+import array
+import collections
+import mmap
+import os
+import pickle
+import struct
+import sys
+import threading
+import time
+import zlib
+from bisect import bisect_left, bisect_right
+from itertools import islice
+from src.journal import TrackedDict, TrackedList, track
+
+'''
+snapshot_format.py
+
+The binary format snapshots of the store are written in.
+
+    header:   magic (8 bytes) | version (2 bytes) | number of sections (4 bytes)
+    section:  kind (1 byte) | name length (2 bytes) | payload length (8 bytes)
+              | name | payload
+
+Each top level value of the store is one section, plus a meta section for
+the snapshot's own metadata. Messages are stored as columns: arrays of the
+ids, u_ids and timestamps, the text of every message in one blob with the
+offset of each message, and the reacts flattened into arrays the same way.
+Loading builds each message straight from the columns, already tracked,
+rather than unpickling it and then copying it into tracked containers. Every
+other value is a pickled section, as is any message without the usual shape.
+
+The messages are split by message_id into pages of PAGE_SIZE, each stored as
+its own set of columns behind an index of the first message_id of every
+page, so a single message can be read without reading the rest (see
+MessagePages).
+
+Pages of archived messages, ie. every message in the page was sent more
+than an archive age ago (see config.archive_message_age), can have their
+text compressed, each page on its own with zlib, all with one dictionary of
+the words most common in their text. The dictionary is a section of its own,
+which comes before the messages section of the same name, and a compressed
+page has an extra part at the end of its columns saying so. A page is only
+decompressed when it is decoded, so a message that is never read is never
+decompressed.
+
+Snapshots written before this format, ie. a plain pickle of the store, can
+still be loaded, and can be converted with
+
+    python3 -m src.snapshot_format database.p
+'''
+
+MAGIC = b"STREAMS\x00"
+VERSION = 3
+HEADER = struct.Struct("<8sHI")
+SECTION = struct.Struct("<BHQ")
+LENGTH = struct.Struct("<Q")
+
+# kinds of section
+PICKLED = 0
+MESSAGES = 1        # version 1 only, every message in one set of columns
+META = 2
+MESSAGE_PAGES = 3
+TEXT_DICTIONARY = 4 # version 3, the dictionary of the compressed pages of a message pages section
+
+# how the text of a page is compressed, in the extra part of a compressed page
+ZLIB = 1
+
+PAGE_SIZE = 1024
+
+# the most a zlib dictionary can use, and the number of archived messages sampled to build it
+DICTIONARY_SIZE = 32 * 1024
+DICTIONARY_SAMPLE = 10000
+
+MESSAGE_KEYS = {"message_id", "u_id", "message", "time_created", "reacts", "is_pinned"}
+REACT_KEYS = {"react_id", "u_ids"}
+# is_this_user_reacted of a react, which is added when messages are read
+REACTED = {None: 0, False: 1, True: 2}
+
+def is_int(value):
+    return type(value) is int and -2 ** 63 <= value < 2 ** 63
+
+def is_regular(message):
+    '''
+    Whether `message` has the usual shape, and so can be stored in columns
+    '''
+    if not isinstance(message, dict) or message.keys() != MESSAGE_KEYS:
+        return False
+    if not (is_int(message["message_id"]) and is_int(message["u_id"]) and is_int(message["time_created"])):
+        return False
+    if type(message["message"]) is not str or type(message["is_pinned"]) is not bool:
+        return False
+    if not isinstance(message["reacts"], list):
+        return False
+    for react in message["reacts"]:
+        if not isinstance(react, dict) or react.keys() - {"is_this_user_reacted"} != REACT_KEYS:
+            return False
+        if not is_int(react["react_id"]) or type(react.get("is_this_user_reacted", False)) is not bool:
+            return False
+        if not isinstance(react["u_ids"], list) or not all(is_int(u_id) for u_id in react["u_ids"]):
+            return False
+    return True
+
+def to_bytes(column):
+    # columns are always written little endian
+    if sys.byteorder == "big":
+        column = array.array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+def from_bytes(typecode, data):
+    column = array.array(typecode)
+    column.frombytes(data)
+    if sys.byteorder == "big":
+        column.byteswap()
+    return column
+
+def encode_messages(messages, dictionary=None):
+    '''
+    Payload of a messages section, or None if `messages` can't be stored in
+    columns, ie. it has a key that isn't an int. The text is compressed with
+    `dictionary` if one is given.
+    '''
+    keys = array.array("q")
+    regular = bytearray()
+    irregular = []
+    message_ids, u_ids, times = array.array("q"), array.array("q"), array.array("q")
+    pinned = bytearray()
+    offsets = array.array("Q", [0])
+    texts = []
+    react_counts, react_ids, react_user_counts = array.array("I"), array.array("q"), array.array("I")
+    reacted = bytearray()
+    react_u_ids = array.array("q")
+
+    for key, message in messages.items():
+        if not is_int(key):
+            return None
+        keys.append(key)
+        if not is_regular(message):
+            regular.append(0)
+            irregular.append(message)
+            continue
+        regular.append(1)
+        message_ids.append(message["message_id"])
+        u_ids.append(message["u_id"])
+        times.append(message["time_created"])
+        pinned.append(message["is_pinned"])
+        texts.append(message["message"])
+        offsets.append(offsets[-1] + len(message["message"]))
+        react_counts.append(len(message["reacts"]))
+        for react in message["reacts"]:
+            react_ids.append(react["react_id"])
+            reacted.append(REACTED[react.get("is_this_user_reacted")])
+            react_user_counts.append(len(react["u_ids"]))
+            react_u_ids.extend(react["u_ids"])
+
+    text = "".join(texts).encode("utf-8", "surrogatepass")
+    if dictionary is not None:
+        compressor = zlib.compressobj(zdict=dictionary)
+        text = compressor.compress(text) + compressor.flush()
+    parts = [
+        to_bytes(keys), bytes(regular), to_bytes(message_ids), to_bytes(u_ids),
+        to_bytes(times), bytes(pinned), to_bytes(offsets), text, to_bytes(react_counts),
+        to_bytes(react_ids), bytes(reacted), to_bytes(react_user_counts), to_bytes(react_u_ids),
+        pickle.dumps(irregular, pickle.HIGHEST_PROTOCOL)
+    ]
+    if dictionary is not None:
+        parts.append(bytes([ZLIB]))
+    return b"".join(LENGTH.pack(len(part)) + part for part in parts)
+
+def split(payload):
+    # the length prefixed parts of a set of columns
+    parts = []
+    offset = 0
+    while offset < len(payload):
+        length, = LENGTH.unpack_from(payload, offset)
+        offset += LENGTH.size
+        parts.append(payload[offset:offset + length])
+        offset += length
+    return parts
+
+def decode_messages(payload, messages=None, dictionary=None):
+    '''
+    Tracked dict of the messages in a set of columns, added to `messages` if
+    given. `dictionary` is the one the text was compressed with, if it was.
+    '''
+    parts = split(payload)
+    keys = from_bytes("q", parts[0])
+    regular = bytes(parts[1])
+    message_ids = iter(from_bytes("q", parts[2]))
+    u_ids = iter(from_bytes("q", parts[3]))
+    times = iter(from_bytes("q", parts[4]))
+    pinned = iter(bytes(parts[5]))
+    offsets = from_bytes("Q", parts[6])
+    text = bytes(parts[7])
+    if len(parts) > 14 and parts[14][0] == ZLIB:
+        text = zlib.decompressobj(zdict=dictionary).decompress(text)
+    text = text.decode("utf-8", "surrogatepass")
+    texts = map(text.__getitem__, map(slice, offsets[:-1], offsets[1:]))
+    react_counts = iter(from_bytes("I", parts[8]))
+    react_ids = iter(from_bytes("q", parts[9]))
+    reacted = iter(bytes(parts[10]))
+    react_user_counts = iter(from_bytes("I", parts[11]))
+    react_u_ids = iter(from_bytes("q", parts[12]))
+    irregular = iter(pickle.loads(parts[13]))
+
+    if messages is None:
+        messages = TrackedDict()
+    for key, is_regular_message in zip(keys, regular):
+        if not is_regular_message:
+            dict.__setitem__(messages, key, track(next(irregular), messages, key))
+            continue
+
+        message = TrackedDict(messages, key)
+        reacts = TrackedList(message, "reacts")
+        for _ in range(next(react_counts)):
+            react = TrackedDict(reacts)
+            react_users = TrackedList(react, "u_ids")
+            list.extend(react_users, islice(react_u_ids, next(react_user_counts)))
+            dict.__setitem__(react, "react_id", next(react_ids))
+            dict.__setitem__(react, "u_ids", react_users)
+            flag = next(reacted)
+            if flag:
+                dict.__setitem__(react, "is_this_user_reacted", flag == REACTED[True])
+            list.append(reacts, react)
+        dict.update(message, {
+            "message_id":   next(message_ids),
+            "u_id":         next(u_ids),
+            "message":      next(texts),
+            "time_created": next(times),
+            "reacts":       reacts,
+            "is_pinned":    bool(next(pinned))
+        })
+        dict.__setitem__(messages, key, message)
+    return messages
+
+def is_archived(message, before):
+    # whether a message was sent before the time `before`
+    return isinstance(message, dict) and is_int(message.get("time_created")) and message["time_created"] < before
+
+def build_dictionary(texts):
+    '''
+    Shared zlib dictionary for compressing `texts`: the words used most
+    often in them, the most common last, where zlib finds them most cheaply
+    '''
+    counts = collections.Counter()
+    for text in texts:
+        counts.update(text.split())
+    words = []
+    size = 0
+    for word, count in counts.most_common():
+        size += len(word.encode("utf-8", "surrogatepass")) + 1
+        if count < 2 or size > DICTIONARY_SIZE:
+            break
+        words.append(word)
+    words.reverse()
+    return " ".join(words).encode("utf-8", "surrogatepass")
+
+def encode_pages(messages, archive_before=None):
+    '''
+    Payload of a message pages section, or None if `messages` can't be
+    stored in columns
+
+        page count | first key of each page | offset of each page and the
+        end of the last | the columns of each page
+
+    Arguments:
+        messages (dict)         - the messages
+        archive_before (int)    - compress the text of the pages whose
+                                  messages were all sent before this time
+
+    Return Value:
+        (payload, the dictionary the pages were compressed with or None)
+    '''
+    if not all(is_int(key) for key in messages):
+        return None, None
+    keys = sorted(messages)
+    page_keys = [keys[start:start + PAGE_SIZE] for start in range(0, len(keys), PAGE_SIZE)]
+    archived = [
+        archive_before is not None and all(is_archived(messages[key], archive_before) for key in page)
+        for page in page_keys
+    ]
+
+    dictionary = None
+    if any(archived):
+        archived_keys = [key for page, is_archived_page in zip(page_keys, archived) if is_archived_page for key in page]
+        step = max(len(archived_keys) // DICTIONARY_SAMPLE, 1)
+        dictionary = build_dictionary(
+            messages[key]["message"] for key in archived_keys[::step] if type(messages[key].get("message")) is str
+        )
+
+    first_keys = array.array("q")
+    offsets = array.array("Q", [0])
+    pages = []
+    for page, is_archived_page in zip(page_keys, archived):
+        pages.append(encode_messages({key: messages[key] for key in page}, dictionary if is_archived_page else None))
+        first_keys.append(page[0])
+        offsets.append(offsets[-1] + len(pages[-1]))
+    return b"".join([LENGTH.pack(len(pages)), to_bytes(first_keys), to_bytes(offsets)] + pages), dictionary
+
+def read_index(payload):
+    '''
+    The first key of each page of a message pages section, and the payload
+    of each page
+    '''
+    count, = LENGTH.unpack_from(payload, 0)
+    offset = LENGTH.size
+    first_keys = from_bytes("q", payload[offset:offset + 8 * count])
+    offset += 8 * count
+    offsets = from_bytes("Q", payload[offset:offset + 8 * (count + 1)])
+    offset += 8 * (count + 1)
+    pages = [payload[offset + start:offset + end] for start, end in zip(offsets, offsets[1:])]
+    return first_keys, pages
+
+class MessagePages:
+    '''
+    Source of a LazyDict of messages (see journal.py), reading each message
+    from its page of a message pages section. A page is decoded at most once
+    for any number of messages read from it in a row.
+
+    Records are returned tracked but not part of any store, so track()
+    adopts them as is, unless `upgrade` is set to a function of a record
+    (see migrations.py), in which case they are returned as it returns them.
+
+    Arguments:
+        payload (bytes)     - the message pages section
+        dictionary (bytes)  - its text dictionary section, if it has one
+    '''
+    def __init__(self, payload=None, dictionary=None):
+        self.__lock = threading.Lock()
+        self.__dictionary = dictionary
+        self.__first_keys, self.__pages = read_index(payload) if payload is not None else ([], [])
+        self.__keys = None
+        # the last page decoded, less the records already returned
+        self.__page = None
+        self.__records = {}
+        self.upgrade = None
+
+    def __find(self, key):
+        # index of the page key would be in, or None
+        if not is_int(key):
+            return None
+        index = bisect_right(self.__first_keys, key) - 1
+        return index if index >= 0 else None
+
+    def fetch(self, keys):
+        records = {}
+        with self.__lock:
+            for key in sorted(keys):
+                index = self.__find(key)
+                if index is None:
+                    continue
+                if index != self.__page or key not in self.__records:
+                    self.__records = decode_messages(self.__pages[index], dictionary=self.__dictionary)
+                    self.__page = index
+                record = self.__records.pop(key, None)
+                if record is not None:
+                    if isinstance(record, (TrackedDict, TrackedList)):
+                        record._parent = None
+                    records[key] = self.upgrade(record) if self.upgrade else record
+        return records
+
+    def contains(self, key):
+        index = self.__find(key)
+        if index is None:
+            return False
+        page_keys = from_bytes("q", split(self.__pages[index])[0])
+        position = bisect_left(page_keys, key)
+        return position < len(page_keys) and page_keys[position] == key
+
+    def keys(self):
+        with self.__lock:
+            if self.__keys is None:
+                self.__keys = array.array("q")
+                for page in self.__pages:
+                    self.__keys.extend(from_bytes("q", split(page)[0]))
+        return self.__keys.tolist()
+
+def decode_pages(payload, dictionary=None):
+    # tracked dict of every message in a message pages section
+    messages = TrackedDict()
+    for page in read_index(payload)[1]:
+        decode_messages(page, messages, dictionary)
+    return messages
+
+def dump(store, FILE, meta=None, archive_age=None):
+    '''
+    Writes `store` to FILE as a snapshot
+
+    Arguments:
+        store (dict)        - the store
+        FILE (file)         - binary file opened for writing
+        meta (dict)         - metadata about the snapshot, eg. the journal seq
+        archive_age (int)   - seconds after which messages are archived, and
+                              so their text compressed, or None to compress
+                              nothing
+    '''
+    archive_before = None if archive_age is None else time.time() - archive_age
+    sections = []
+    for name, value in store.items():
+        payload, dictionary = None, None
+        if name == "messages" and isinstance(value, dict):
+            payload, dictionary = encode_pages(value, archive_before)
+        if dictionary is not None:
+            sections.append((TEXT_DICTIONARY, name, dictionary))
+        if payload is not None:
+            sections.append((MESSAGE_PAGES, name, payload))
+        else:
+            sections.append((PICKLED, name, pickle.dumps(value, pickle.HIGHEST_PROTOCOL)))
+    sections.append((META, "", pickle.dumps(meta or {}, pickle.HIGHEST_PROTOCOL)))
+
+    FILE.write(HEADER.pack(MAGIC, VERSION, len(sections)))
+    for kind, name, payload in sections:
+        name = name.encode()
+        FILE.write(SECTION.pack(kind, len(name), len(payload)) + name)
+        FILE.write(payload)
+
+def load(FILE, lazy=False):
+    '''
+    Reads a snapshot from FILE
+
+    Arguments:
+        FILE (file)   - binary file opened for reading
+        lazy (bool)   - whether to map the file and leave the messages on
+                        disk, returning a MessagePages in their place
+
+    Exceptions:
+        ValueError  - FILE isn't a snapshot, or was written by a newer version
+
+    Return Value:
+        (store, meta) where messages are already tracked
+    '''
+    if lazy:
+        # the mapping stays valid after the file is replaced by a newer snapshot
+        data = memoryview(mmap.mmap(FILE.fileno(), 0, access=mmap.ACCESS_READ))
+    else:
+        data = memoryview(FILE.read())
+    if len(data) < HEADER.size:
+        raise ValueError("not a snapshot")
+    magic, version, count = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError("not a snapshot")
+    if version > VERSION:
+        raise ValueError(f"snapshot version {version} is newer than {VERSION}")
+
+    store = {}
+    meta = {}
+    dictionaries = {}
+    offset = HEADER.size
+    for _ in range(count):
+        kind, name_length, length = SECTION.unpack_from(data, offset)
+        offset += SECTION.size
+        name = bytes(data[offset:offset + name_length]).decode()
+        offset += name_length
+        payload = data[offset:offset + length]
+        offset += length
+
+        if kind == MESSAGE_PAGES:
+            dictionary = dictionaries.get(name)
+            store[name] = MessagePages(payload, dictionary) if lazy else decode_pages(payload, dictionary)
+        elif kind == TEXT_DICTIONARY:
+            dictionaries[name] = bytes(payload)
+        elif kind == MESSAGES:
+            store[name] = decode_messages(payload)
+        elif kind == META:
+            meta = pickle.loads(payload)
+        else:
+            store[name] = pickle.loads(payload)
+    return store, meta
+
+def is_snapshot(path):
+    # whether the file at path is in this format, rather than a plain pickle
+    with open(path, 'rb') as FILE:
+        return FILE.read(len(MAGIC)) == MAGIC
+
+def load_pickle(FILE):
+    '''
+    Reads a snapshot written before this format, a pickle of the store
+    followed by a pickle of its metadata
+
+    Return Value:
+        (store, meta)
+    '''
+    store = pickle.load(FILE)
+    try:
+        meta = pickle.load(FILE)
+    except EOFError:
+        meta = {}
+    return store, meta
+
+def convert(path):
+    '''
+    Rewrites a pickled snapshot at path in this format, in place
+    '''
+    with open(path, 'rb') as FILE:
+        store, meta = load_pickle(FILE)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as FILE:
+        dump(store, FILE, meta)
+        FILE.flush()
+        os.fsync(FILE.fileno())
+    os.replace(temp_path, path)
+
+if __name__ == "__main__":
+    for snapshot_path in sys.argv[1:] or ['database.p']:
+        if is_snapshot(snapshot_path):
+            print(f"{snapshot_path} is already a version {VERSION} snapshot")
+        else:
+            convert(snapshot_path)
+            print(f"converted {snapshot_path}")
@@ -0,0 +1,610 @@
+import json
+import os
+import pickle
+import sqlite3
+import threading
+from src.journal import LazyDict
+
+'''
+sqlite_storage.py
+
+Keeps the store in an SQLite database (database.db) rather than a pickle.
+
+Every user, channel, dm and message is a row of its own table. The lists of
+members, the reacts of each message and the stats are split out into the
+memberships, reacts and stats tables. Top level values such as the id
+trackers live in the meta table.
+
+A write turns the operations recorded by the store's ChangeLog into the
+matching inserts, updates and deletes, so only the rows that changed are
+written, eg. sending a message inserts one messages row, one reacts row and
+two stats rows.
+
+Loading reads everything apart from the message bodies. The messages of the
+store are a LazyDict, which reads each message from the messages table the
+first time it is accessed, so neither memory nor startup time grow with the
+message history.
+'''
+
+# number of recently loaded messages kept in memory
+HOT_MESSAGES = 1000
+
+# what each fsync policy (see storage.py) is in SQLite, where in WAL mode
+# NORMAL only syncs the WAL when it is checkpointed
+SYNCHRONOUS = {
+    "always":   "FULL",
+    "interval": "NORMAL",
+    "never":    "OFF"
+}
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (
+    key             TEXT PRIMARY KEY,
+    value           BLOB
+);
+CREATE TABLE IF NOT EXISTS users (
+    id              INTEGER PRIMARY KEY,
+    email           TEXT,
+    name_first      TEXT,
+    name_last       TEXT,
+    password        TEXT,
+    handle_str      TEXT,
+    is_owner        INTEGER,
+    sessions        TEXT,
+    profile_img_url TEXT,
+    notifications   TEXT,
+    user_stats      TEXT,
+    extra           BLOB
+);
+CREATE TABLE IF NOT EXISTS channels (
+    id              INTEGER PRIMARY KEY,
+    channel_name    TEXT,
+    is_public       INTEGER,
+    standup         TEXT,
+    extra           BLOB
+);
+CREATE TABLE IF NOT EXISTS dms (
+    id              INTEGER PRIMARY KEY,
+    name            TEXT,
+    owner           INTEGER,
+    extra           BLOB
+);
+CREATE TABLE IF NOT EXISTS memberships (
+    location_type   TEXT,
+    location_id     INTEGER,
+    role            TEXT,
+    u_id            INTEGER
+);
+CREATE INDEX IF NOT EXISTS memberships_location ON memberships (location_type, location_id);
+CREATE TABLE IF NOT EXISTS messages (
+    id              INTEGER PRIMARY KEY,
+    message_id      INTEGER,
+    u_id            INTEGER,
+    message         TEXT,
+    time_created    INTEGER,
+    is_pinned       INTEGER,
+    extra           BLOB,
+    location_type   TEXT,
+    location_id     INTEGER
+);
+CREATE INDEX IF NOT EXISTS messages_location ON messages (location_type, location_id);
+CREATE TABLE IF NOT EXISTS reacts (
+    message_id      INTEGER,
+    react_id        INTEGER,
+    u_id            INTEGER
+);
+CREATE INDEX IF NOT EXISTS reacts_message ON reacts (message_id);
+CREATE TABLE IF NOT EXISTS stats (
+    u_id            INTEGER,
+    kind            TEXT,
+    num             INTEGER,
+    time_stamp      INTEGER
+);
+CREATE INDEX IF NOT EXISTS stats_user ON stats (u_id);
+'''
+
+# how each field of a record is stored:
+#   value     - column holding the value as is
+#   bool      - integer column, read back as a bool
+#   json      - text column holding the value as json
+#   stats     - json column for the plain values, with the lists in the stats table
+#   members   - rows of the memberships table, with the field as their role
+#   location  - list of message_ids, from the location of the messages rows
+#   reacts    - rows of the reacts table
+# anything else in a record is pickled into the extra column
+RECORDS = {
+    "users": (
+        ("email", "value"),
+        ("name_first", "value"),
+        ("name_last", "value"),
+        ("password", "value"),
+        ("handle_str", "value"),
+        ("is_owner", "bool"),
+        ("sessions", "json"),
+        ("profile_img_url", "value"),
+        ("notifications", "json"),
+        ("user_stats", "stats"),
+    ),
+    "channels": (
+        ("channel_name", "value"),
+        ("is_public", "bool"),
+        ("owner_members", "members"),
+        ("all_members", "members"),
+        ("messages", "location"),
+        ("standup", "json"),
+    ),
+    "dms": (
+        ("name", "value"),
+        ("owner", "value"),
+        ("members", "members"),
+        ("messages", "location"),
+    ),
+    "messages": (
+        ("message_id", "value"),
+        ("u_id", "value"),
+        ("message", "value"),
+        ("time_created", "value"),
+        ("reacts", "reacts"),
+        ("is_pinned", "bool"),
+    ),
+}
+COLUMN_KINDS = ("value", "bool", "json", "stats")
+FIELD_KINDS = {collection: dict(fields) for collection, fields in RECORDS.items()}
+COLUMNS = {
+    collection: [name for name, kind in fields if kind in COLUMN_KINDS]
+    for collection, fields in RECORDS.items()
+}
+SELECT = {
+    collection: f"SELECT id, {', '.join(columns)}, extra FROM {collection}"
+    for collection, columns in COLUMNS.items()
+}
+UPSERT = {
+    collection: (
+        f"INSERT INTO {collection} (id, {', '.join(columns)}, extra) "
+        f"VALUES ({', '.join('?' * (len(columns) + 2))}) "
+        f"ON CONFLICT (id) DO UPDATE SET "
+        + ", ".join(f"{name} = excluded.{name}" for name in columns + ["extra"])
+    )
+    for collection, columns in COLUMNS.items()
+}
+
+def stats_header(stats):
+    # the part of a stats dict that isn't kept in the stats table
+    if stats is None:
+        return None
+    return {
+        "lists": [kind for kind, value in stats.items() if isinstance(value, list)],
+        "values": {kind: value for kind, value in stats.items() if not isinstance(value, list)}
+    }
+
+def stats_from(header, lists):
+    stats = {kind: lists.get(kind, []) for kind in header["lists"]}
+    stats.update(header["values"])
+    return stats
+
+def encode(collection, key, record):
+    '''
+    Row of the collection's table for `record`
+
+    Arguments:
+        collection (str)  - "users", "channels", "dms" or "messages"
+        key (int)         - id of the record
+        record (dict)     - the record itself
+
+    Return Value:
+        list of values, in the same order as SELECT[collection]
+    '''
+    row = [key]
+    absent = []
+    for name, kind in RECORDS[collection]:
+        if name not in record:
+            absent.append(name)
+        if kind not in COLUMN_KINDS:
+            continue
+        value = record.get(name)
+        if kind == "json":
+            value = json.dumps(value)
+        elif kind == "stats":
+            value = json.dumps(stats_header(value))
+        row.append(value)
+
+    others = {name: value for name, value in record.items() if name not in FIELD_KINDS[collection]}
+    row.append(pickle.dumps((others, absent)) if others or absent else None)
+    return row
+
+def decode(collection, row, children):
+    '''
+    Record for a row read with SELECT[collection]
+
+    Arguments:
+        collection (str)  - "users", "channels", "dms" or "messages"
+        row (tuple)       - the row
+        children (dict)   - value of each field kept in another table
+
+    Return Value:
+        record (dict)
+    '''
+    columns = iter(row[1:-1])
+    others, absent = pickle.loads(row[-1]) if row[-1] is not None else ({}, ())
+    record = {}
+    for name, kind in RECORDS[collection]:
+        value = next(columns) if kind in COLUMN_KINDS else children.get(name, [])
+        if name in absent:
+            continue
+        if kind == "bool":
+            value = bool(value)
+        elif kind == "json":
+            value = json.loads(value)
+        elif kind == "stats":
+            header = json.loads(value)
+            value = None if header is None else stats_from(header, children.get(name, {}))
+        record[name] = value
+    record.update(others)
+    return record
+
+def chunks(keys, size=500):
+    # sqlite limits the number of parameters in one statement
+    for start in range(0, len(keys), size):
+        yield keys[start:start + size]
+
+class Plan:
+    '''
+    What a batch of operations changed, worked out before anything is written
+    '''
+    def __init__(self):
+        # the whole store has to be written again
+        self.everything = False
+        # top level keys to write out in full
+        self.replaced = set()
+        # (collection, key) -> "row" to write just the record's own row, or
+        # "full" to write its row and its rows in every other table
+        self.records = {}
+        # (collection, key) whose memberships are written again
+        self.members = set()
+        # (collection, key, role, u_ids) appended to a list of members
+        self.new_members = []
+        # message_id -> (collection, key) of messages added to a channel or dm
+        self.located = {}
+        # (collection, key) whose list of messages is written again
+        self.relocated = set()
+        # (u_id, kind, entries) appended to a list of stats, u_id is None for users_stats
+        self.stats = []
+        # u_ids whose stats are written again
+        self.restats = set()
+        # the plain values of users_stats changed
+        self.stats_header = False
+
+    def mark(self, collection, key, how="row"):
+        if self.records.get((collection, key)) != "full":
+            self.records[(collection, key)] = how
+
+    def is_full(self, collection, key):
+        return collection in self.replaced or self.records.get((collection, key)) == "full"
+
+class MessageTable:
+    '''
+    Source of the messages LazyDict, reading from the messages and reacts tables
+    '''
+    def __init__(self, db, lock):
+        self.__db = db
+        self.__lock = lock
+
+    def fetch(self, keys):
+        messages = {}
+        with self.__lock:
+            for chunk in chunks(list(keys)):
+                marks = ", ".join("?" * len(chunk))
+                rows = self.__db.execute(f"{SELECT['messages']} WHERE id IN ({marks})", chunk).fetchall()
+                reacts = {}
+                query = f"SELECT message_id, react_id, u_id FROM reacts WHERE message_id IN ({marks}) ORDER BY rowid"
+                for message_id, react_id, u_id in self.__db.execute(query, chunk):
+                    message_reacts = reacts.setdefault(message_id, [])
+                    # each react is a row without a u_id, followed by a row for each u_id
+                    if u_id is None:
+                        message_reacts.append({"react_id": react_id, "u_ids": []})
+                    else:
+                        message_reacts[-1]["u_ids"].append(u_id)
+                for row in rows:
+                    messages[row[0]] = decode("messages", row, {"reacts": reacts.get(row[0], [])})
+        return messages
+
+    def contains(self, key):
+        with self.__lock:
+            return self.__db.execute("SELECT 1 FROM messages WHERE id = ?", (key,)).fetchone() is not None
+
+    def keys(self):
+        with self.__lock:
+            return [key for key, in self.__db.execute("SELECT id FROM messages ORDER BY id")]
+
+class SqliteStorage:
+    '''
+    Every write updates the rows of database.db changed since the last write
+    '''
+    records_changes = True
+    records_ops = True
+    pinned = frozenset()
+    shared = False
+    lazy = True
+
+    def __init__(self, path, fsync):
+        self.path = os.path.splitext(path)[0] + '.db'
+        self.__lock = threading.RLock()
+        self.__db = sqlite3.connect(self.path, check_same_thread=False)
+        self.__db.execute("PRAGMA journal_mode = WAL")
+        self.__db.execute(f"PRAGMA synchronous = {SYNCHRONOUS[fsync]}")
+        self.__db.executescript(SCHEMA)
+
+    def close(self):
+        with self.__lock:
+            self.__db.close()
+
+    def load(self, initial):
+        '''
+        Reads the store from the database, leaving the messages on disk until
+        they are accessed
+        '''
+        with self.__lock:
+            db = self.__db
+            store = dict(initial)
+
+            stats = {}
+            for u_id, kind, num, time_stamp in db.execute("SELECT u_id, kind, num, time_stamp FROM stats ORDER BY rowid"):
+                entries = stats.setdefault(u_id, {}).setdefault(kind, [])
+                entries.append({f"num_{kind}": num, "time_stamp": time_stamp})
+
+            for key, value in db.execute("SELECT key, value FROM meta"):
+                value = pickle.loads(value)
+                if key == "users_stats":
+                    value = stats_from(value, stats.get(None, {}))
+                store[key] = value
+
+            # the members and message_ids of each channel and dm
+            children = {}
+            query = "SELECT location_type, location_id, role, u_id FROM memberships ORDER BY rowid"
+            for location_type, location_id, role, u_id in db.execute(query):
+                location = children.setdefault((location_type, location_id), {})
+                location.setdefault(role, []).append(u_id)
+            query = "SELECT location_type, location_id, id FROM messages WHERE location_type IS NOT NULL ORDER BY id"
+            for location_type, location_id, message_id in db.execute(query):
+                location = children.setdefault((location_type, location_id), {})
+                location.setdefault("messages", []).append(message_id)
+
+            store["users"] = {
+                row[0]: decode("users", row, {"user_stats": stats.get(row[0], {})})
+                for row in db.execute(f"{SELECT['users']} ORDER BY id")
+            }
+            for collection in ("channels", "dms"):
+                store[collection] = {
+                    row[0]: decode(collection, row, children.get((collection, row[0]), {}))
+                    for row in db.execute(f"{SELECT[collection]} ORDER BY id")
+                }
+            store["messages"] = LazyDict(MessageTable(db, self.__lock), HOT_MESSAGES)
+            return store
+
+    def write(self, store, ops, touched):
+        if ops is not None and not ops:
+            return False
+        with self.__lock, self.__db:
+            plan = Plan()
+            if ops is None:
+                plan.everything = True
+            for op in ops or ():
+                self.__plan(pickle.loads(op), plan)
+            self.__apply(store, plan)
+        return True
+
+    def __plan(self, op, plan):
+        kind, path = op[0], op[1]
+        if not path:
+            if kind == "clear":
+                plan.everything = True
+            else:
+                plan.replaced.add(op[2])
+            return
+
+        collection = path[0]
+        if collection == "users_stats":
+            self.__plan_stats(op, None, path[1:], plan)
+            return
+        if collection not in RECORDS:
+            plan.replaced.add(collection)
+            return
+
+        if len(path) == 1:
+            if kind == "setitem":
+                plan.mark(collection, op[2], "full")
+            elif kind == "delitem":
+                self.__delete(collection, op[2])
+                plan.records.pop((collection, op[2]), None)
+            else:
+                plan.replaced.add(collection)
+            return
+
+        key = path[1]
+        if plan.is_full(collection, key):
+            return
+        if len(path) > 2:
+            field = path[2]
+        elif kind in ("setitem", "delitem"):
+            field = op[2]
+        else:
+            # the record was cleared
+            plan.mark(collection, key, "full")
+            return
+
+        field_kind = FIELD_KINDS[collection].get(field, "value")
+        if field_kind in ("value", "bool", "json"):
+            plan.mark(collection, key)
+        elif field_kind == "stats":
+            plan.mark(collection, key)
+            if len(path) > 2:
+                self.__plan_stats(op, key, path[3:], plan)
+            else:
+                plan.restats.add(key)
+        elif field_kind == "members":
+            if len(path) == 3 and kind in ("append", "extend"):
+                u_ids = [op[2]] if kind == "append" else op[2]
+                plan.new_members.append((collection, key, field, u_ids))
+            else:
+                plan.members.add((collection, key))
+        elif field_kind == "location":
+            if len(path) == 3 and kind in ("append", "extend", "insert"):
+                message_ids = {"append": [op[-1]], "extend": op[-1], "insert": [op[-1]]}[kind]
+                for message_id in message_ids:
+                    plan.located[message_id] = (collection, key)
+            elif len(path) == 3 and kind == "delitem":
+                # messages are only taken out of a channel or dm when they are removed
+                pass
+            else:
+                plan.relocated.add((collection, key))
+        else:
+            plan.mark(collection, key, "full")
+
+    def __plan_stats(self, op, u_id, path, plan):
+        # `path` leads from the stats dict to the node the operation changed
+        kind = op[0]
+        if len(path) == 1 and kind in ("append", "extend"):
+            entries = [op[2]] if kind == "append" else op[2]
+            plan.stats.append((u_id, path[0], entries))
+        elif not path and kind == "setitem" and not isinstance(op[3], list):
+            # only a plain value changed, which is kept in the user's row or in meta
+            if u_id is None:
+                plan.stats_header = True
+        else:
+            plan.restats.add(u_id)
+
+    def __apply(self, store, plan):
+        db = self.__db
+        if plan.everything:
+            db.execute("DELETE FROM meta")
+            plan.replaced = set(store.keys())
+
+        for key in plan.replaced:
+            if key in RECORDS:
+                self.__replace(store, key)
+            elif key == "users_stats":
+                plan.restats.add(None)
+            else:
+                self.__write_meta(key, store.get(key))
+        if "messages" in plan.replaced:
+            # the replaced messages have yet to be put in their channel or dm
+            for collection in ("channels", "dms"):
+                for key, record in store[collection].items():
+                    self.__relocate(collection, key, record)
+
+        # messages go first, so a channel or dm written in full in the same
+        # write finds the rows of its messages to put them in it
+        records = sorted(plan.records.items(), key=lambda item: item[0][0] != "messages")
+        for (collection, key), how in records:
+            record = store[collection].get(key)
+            if record is not None and collection not in plan.replaced:
+                self.__upsert(collection, key, record, how == "full")
+
+        for collection, key in plan.members:
+            record = store[collection].get(key)
+            if record is not None and not plan.is_full(collection, key):
+                self.__write_members(collection, key, record)
+        for collection, key, role, u_ids in plan.new_members:
+            if not plan.is_full(collection, key) and (collection, key) not in plan.members:
+                db.executemany(
+                    "INSERT INTO memberships VALUES (?, ?, ?, ?)",
+                    [(collection, key, role, u_id) for u_id in u_ids]
+                )
+
+        for collection, key in plan.relocated:
+            record = store[collection].get(key)
+            if record is not None and not plan.is_full(collection, key):
+                self.__relocate(collection, key, record)
+        db.executemany(
+            "UPDATE messages SET location_type = ?, location_id = ? WHERE id = ?",
+            [(collection, key, message_id) for message_id, (collection, key) in plan.located.items()]
+        )
+
+        if plan.stats_header or None in plan.restats:
+            self.__write_meta("users_stats", stats_header(store.get("users_stats")))
+        for u_id in plan.restats:
+            if u_id is None:
+                self.__write_stats(None, store.get("users_stats"))
+            elif u_id in store["users"] and not plan.is_full("users", u_id):
+                self.__write_stats(u_id, store["users"][u_id].get("user_stats"))
+        rows = []
+        for u_id, kind, entries in plan.stats:
+            if u_id in plan.restats or (u_id is not None and plan.is_full("users", u_id)):
+                continue
+            rows += [(u_id, kind, entry.get(f"num_{kind}"), entry.get("time_stamp")) for entry in entries]
+        db.executemany("INSERT INTO stats VALUES (?, ?, ?, ?)", rows)
+
+    def __write_meta(self, key, value):
+        self.__db.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, pickle.dumps(value)))
+
+    def __upsert(self, collection, key, record, full):
+        self.__db.execute(UPSERT[collection], encode(collection, key, record))
+        if not full:
+            return
+        kinds = FIELD_KINDS[collection].values()
+        if "members" in kinds:
+            self.__write_members(collection, key, record)
+        if "location" in kinds:
+            self.__relocate(collection, key, record)
+        if "stats" in kinds:
+            self.__write_stats(key, record.get("user_stats"))
+        if "reacts" in kinds:
+            self.__write_reacts(key, record)
+
+    def __delete(self, collection, key):
+        db = self.__db
+        db.execute(f"DELETE FROM {collection} WHERE id = ?", (key,))
+        if collection == "users":
+            db.execute("DELETE FROM stats WHERE u_id = ?", (key,))
+        elif collection == "messages":
+            db.execute("DELETE FROM reacts WHERE message_id = ?", (key,))
+        else:
+            db.execute("DELETE FROM memberships WHERE location_type = ? AND location_id = ?", (collection, key))
+            db.execute(
+                "UPDATE messages SET location_type = NULL, location_id = NULL WHERE location_type = ? AND location_id = ?",
+                (collection, key)
+            )
+
+    def __replace(self, store, collection):
+        # read the records first, as a LazyDict reads them from this table
+        records = list(store[collection].items())
+        for key, in self.__db.execute(f"SELECT id FROM {collection}").fetchall():
+            self.__delete(collection, key)
+        for key, record in records:
+            self.__upsert(collection, key, record, True)
+
+    def __write_members(self, collection, key, record):
+        rows = [
+            (collection, key, role, u_id)
+            for role, kind in RECORDS[collection] if kind == "members"
+            for u_id in record.get(role, [])
+        ]
+        self.__db.execute("DELETE FROM memberships WHERE location_type = ? AND location_id = ?", (collection, key))
+        self.__db.executemany("INSERT INTO memberships VALUES (?, ?, ?, ?)", rows)
+
+    def __relocate(self, collection, key, record):
+        self.__db.execute(
+            "UPDATE messages SET location_type = NULL, location_id = NULL WHERE location_type = ? AND location_id = ?",
+            (collection, key)
+        )
+        self.__db.executemany(
+            "UPDATE messages SET location_type = ?, location_id = ? WHERE id = ?",
+            [(collection, key, message_id) for message_id in record.get("messages", [])]
+        )
+
+    def __write_stats(self, u_id, stats):
+        rows = [
+            (u_id, kind, entry.get(f"num_{kind}"), entry.get("time_stamp"))
+            for kind, entries in (stats or {}).items() if isinstance(entries, list)
+            for entry in entries
+        ]
+        self.__db.execute("DELETE FROM stats WHERE u_id IS ?", (u_id,))
+        self.__db.executemany("INSERT INTO stats VALUES (?, ?, ?, ?)", rows)
+
+    def __write_reacts(self, message_id, record):
+        rows = []
+        for react in record.get("reacts", []):
+            rows.append((message_id, react.get("react_id"), None))
+            rows += [(message_id, react.get("react_id"), u_id) for u_id in react.get("u_ids", [])]
+        self.__db.execute("DELETE FROM reacts WHERE message_id = ?", (message_id,))
+        self.__db.executemany("INSERT INTO reacts VALUES (?, ?, ?)", rows)
@@ -51,15 +51,17 @@ def standup_start_v1(token, channel_id, length):
 def end_standup(token, channel_id, length):
     
     time.sleep(length)
-    store = data_store.get()
-    channels = store["channels"]
-    standup = channels[channel_id]["standup"]
-    standup["is_active"] = False
-    message_queue = channels[channel_id]["standup"]["message_queue"]
-    standup_message = '\n'.join(message_queue)
-
-    message_send_v1(token, channel_id, standup_message)
-    data_store.set(store)
+    # runs on its own thread, so has to take the store for writing itself
+    with data_store.transaction():
+        store = data_store.get()
+        channels = store["channels"]
+        standup = channels[channel_id]["standup"]
+        standup["is_active"] = False
+        message_queue = channels[channel_id]["standup"]["message_queue"]
+        standup_message = '\n'.join(message_queue)
+
+        message_send_v1(token, channel_id, standup_message)
+        data_store.set(store)
 
 def standup_active_v1(token, channel_id):
     auth_user_id = get_auth_user_id(token)
@@ -1,4 +1,5 @@
 from src.data_store import data_store
+from src.store_snapshot import shallow_copy
 from src.sessions import get_auth_user_id
 from src.gen_timestamp import get_curr_timestamp
 
@@ -61,24 +62,15 @@ def get_utilization_rate():
     '''
     store = data_store.get()
     users = store["users"]
-    channels = store["channels"]
-    dms = store["dms"]
-
-    active_user_count = 0
-    in_a_channel = False
-
-    # search for num_users_who_have_joined_at_least_one_channel_or_dm
-    for u_id in users.keys():
-        for channel in channels.values():
-            if u_id in channel["all_members"]:
-                active_user_count += 1
-                in_a_channel = True
-                break
-        if not in_a_channel:
-            for dm in dms.values():
-                if u_id in dm["members"]:
-                    active_user_count += 1
-                    break
+
+    # search for num_users_who_have_joined_at_least_one_channel_or_dm, in one
+    # pass over the members of every channel and dm
+    active_users = set()
+    for channel in store["channels"].values():
+        active_users.update(channel["all_members"])
+    for dm in store["dms"].values():
+        active_users.update(dm["members"])
+    active_user_count = len(active_users)
 
     # search for total_num_users
     total_user_count = 0
@@ -341,7 +333,9 @@ def users_stats_v1(token):
 
     store = data_store.get()
 
-    users_stats = store["users_stats"]
+    # a copy of each history, as the store may only be readable here. the
+    # entries are shared, as they are never changed once added
+    users_stats = {key: shallow_copy(value) for key, value in store["users_stats"].items()}
     users_stats["utilization_rate"] = get_utilization_rate()
     return {
         "workspace_stats": users_stats
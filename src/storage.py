@@ -0,0 +1,331 @@
+import os
+import pickle
+import threading
+from src import config, migrations, snapshot_format
+from src.cold_tier import load_cold
+from src.journal import Journal, LazyDict, track
+
+'''
+storage.py
+
+The ways a Datastore can be persisted to disk. Each storage provides
+
+    records_changes  - whether it needs the store's ChangeLog to be enabled
+    records_ops      - whether it needs the operations themselves, or only
+                       which parts of the store they touched
+    load(initial)    - returns the stored store, starting from the plain
+                       store `initial` if nothing has been stored yet
+    write(store, ops, touched)
+                     - writes the store, given the operations recorded since
+                       the last write (None if the whole store has to be
+                       written) and ChangeLog.touched(). Returns whether
+                       anything was written.
+    pinned           - the parts of the store, as in ChangeLog.touched(),
+                       that have been written but that a LazyDict can't read
+                       back from disk yet, so must keep in memory
+    shared           - whether other processes change the store too, in which
+                       case it also provides catch_up, apply and release, see
+                       remote_storage.py
+    lazy             - whether the messages stay on disk until they are
+                       accessed, so have no need of a cold tier (see
+                       cold_tier.py)
+
+and is created with the path of database.p and an fsync policy (see
+config.fsync), which decides when what has been written reaches the disk
+
+    "always"    - before write returns
+    "interval"  - appended journal frames within config.fsync_interval of
+                  being written, and any other file before it replaces the
+                  file it is a new version of
+    "never"     - whenever the operating system gets around to it
+
+Files are never written over in place, see replace, so under "always" and
+"interval" a crash loses at most the last interval of writes, and under
+"never" a crash of the server (but not of the machine) loses nothing that
+has been written.
+'''
+
+# the journal is folded into a fresh snapshot once it grows past both this
+# size and the size of the last snapshot, keeping writes amortised O(change)
+JOURNAL_COMPACT_SIZE = 1024 * 1024
+
+# number of recently loaded messages kept in memory by PagedStorage
+HOT_MESSAGES = 1000
+
+def sync(FILE):
+    # makes sure what has been written to FILE is on the disk
+    FILE.flush()
+    os.fsync(FILE.fileno())
+
+def sync_directory(path):
+    # makes sure files created in or renamed into a directory stay there
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def replace(path, write, fsync):
+    '''
+    Writes a new version of the file at path, into a temporary file first
+    so a crash leaves either the old or the new version in place
+
+    Arguments:
+        path (str)          - file to replace
+        write (function)    - writes the new version to the FILE it is given
+        fsync (str)         - fsync policy
+    '''
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as FILE:
+        write(FILE)
+        if fsync != "never":
+            sync(FILE)
+    os.replace(temp_path, path)
+    if fsync != "never":
+        sync_directory(os.path.dirname(os.path.abspath(path)))
+
+class SnapshotStorage:
+    '''
+    Every write rewrites the whole store into database.p, see snapshot_format
+    '''
+    records_changes = False
+    records_ops = False
+    pinned = frozenset()
+    shared = False
+    # whether to leave the messages in the snapshot until they are accessed
+    lazy = False
+    # messages older than this many seconds are read from the snapshot
+    # straight into the cold tier, see cold_tier.py. set by the Datastore
+    cold_message_age = None
+
+    def __init__(self, path, fsync):
+        self.path = path
+        self.fsync = fsync
+        self.journal = Journal(os.path.splitext(path)[0] + '.journal')
+        self.seq = 0
+        self.snapshot_size = 0
+        # pending fsync of the journal under the "interval" policy
+        self.sync_lock = threading.Lock()
+        self.sync_timer = None
+
+    def load(self, initial):
+        '''
+        Restores the store from the latest snapshot and replays any journal
+        frames written after it
+        '''
+        store, meta = self.read_snapshot(initial)
+        schema = meta.get("schema", {})
+        upgrade = (lambda op: migrations.upgrade_op(op, schema)) if migrations.outdated(schema) else None
+        self.seq = self.journal.replay(store, meta.get("journal_seq", 0), upgrade)
+        return store
+
+    def read_snapshot(self, initial):
+        # the store in the snapshot and its metadata, or `initial` if there is
+        # no snapshot yet. records stored at an older version are upgraded as
+        # they are accessed, see migrations.py
+        try:
+            with open(self.path, 'rb') as FILE:
+                self.snapshot_size = os.fstat(FILE.fileno()).st_size
+                # snapshots written before snapshot_format are plain pickles
+                if not snapshot_format.is_snapshot(self.path):
+                    store, meta = snapshot_format.load_pickle(FILE)
+                    migrations.migrate(store, meta.get("schema", {}))
+                    return store, meta
+                cold = not self.lazy and self.cold_message_age is not None
+                store, meta = snapshot_format.load(FILE, self.lazy or cold)
+                migrations.migrate(store, meta.get("schema", {}))
+                if cold and isinstance(store.get("messages"), snapshot_format.MessagePages):
+                    directory = os.path.dirname(os.path.abspath(self.path))
+                    store["messages"] = load_cold(store["messages"], directory, self.cold_message_age)
+                return store, meta
+        except FileNotFoundError:
+            return initial, {}
+
+    def write(self, store, ops, touched):
+        self.write_snapshot(store)
+        return True
+
+    def write_snapshot(self, store):
+        def write(FILE):
+            meta = {"journal_seq": self.seq, "schema": migrations.versions()}
+            snapshot_format.dump(store, FILE, meta, config.archive_message_age)
+            self.snapshot_size = FILE.tell()
+        replace(self.path, write, self.fsync)
+
+        # every frame up to journal_seq is now part of the snapshot
+        if self.journal.size:
+            self.journal.reset()
+
+class JournalStorage(SnapshotStorage):
+    '''
+    Every write appends the changes made since the last write to
+    database.journal, which is replayed on top of database.p when the store
+    is loaded
+    '''
+    records_changes = True
+    records_ops = True
+
+    def write(self, store, ops, touched):
+        if ops is None:
+            self.write_snapshot(store)
+            return True
+        if not ops:
+            return False
+
+        self.seq += 1
+        self.journal.append(self.seq, ops)
+        self.sync_journal()
+        if self.journal.size > max(JOURNAL_COMPACT_SIZE, self.snapshot_size):
+            self.write_snapshot(store)
+        return True
+
+    def sync_journal(self):
+        # under "interval", every frame appended within an interval is synced at its end
+        if self.fsync == "always":
+            self.journal.sync()
+        elif self.fsync == "interval":
+            with self.sync_lock:
+                if self.sync_timer is None:
+                    self.sync_timer = threading.Timer(config.fsync_interval / 1000, self.sync_due)
+                    self.sync_timer.daemon = True
+                    self.sync_timer.start()
+
+    def sync_due(self):
+        with self.sync_lock:
+            self.sync_timer = None
+        self.journal.sync()
+
+class PagedStorage(JournalStorage):
+    '''
+    Journal storage that leaves the messages in database.p until they are
+    accessed, so loading only reads the rest of the store and the index of
+    the message pages, however many messages there are.
+
+    The messages of the store are a LazyDict reading from the snapshot.
+    Messages changed since the last snapshot are only in the journal, so
+    they stay in memory until the next snapshot is written.
+    '''
+    lazy = True
+
+    def __init__(self, path, fsync):
+        JournalStorage.__init__(self, path, fsync)
+        self.pinned = set()
+
+    def load(self, initial):
+        store = JournalStorage.load(self, initial)
+        # nor are the messages changed or removed by the journal
+        messages = store["messages"]
+        self.pinned |= {("messages", key) for key in list(dict.keys(messages)) + list(messages._removed)}
+        return store
+
+    def read_snapshot(self, initial):
+        store, meta = JournalStorage.read_snapshot(self, initial)
+        messages = store["messages"]
+        if isinstance(messages, snapshot_format.MessagePages):
+            store["messages"] = LazyDict(messages, HOT_MESSAGES)
+            self.pinned = set()
+        else:
+            # nothing paged yet, so keep every message in memory until the next snapshot
+            store["messages"] = LazyDict(snapshot_format.MessagePages(), HOT_MESSAGES)
+            for key, message in messages.items():
+                dict.__setitem__(store["messages"], key, track(message, store["messages"], key))
+            self.pinned = {("messages",)}
+        return store, meta
+
+    def write(self, store, ops, touched):
+        # anything written to the journal isn't in the snapshot, unless
+        # writing it to the journal leads to a new snapshot
+        self.pinned |= touched
+        return JournalStorage.write(self, store, ops, touched)
+
+    def write_snapshot(self, store):
+        JournalStorage.write_snapshot(self, store)
+        # read the messages from the new snapshot from now on
+        messages = dict.get(store, "messages")
+        if isinstance(messages, LazyDict):
+            with open(self.path, 'rb') as FILE:
+                pages = snapshot_format.load(FILE, True)[0]["messages"]
+            if isinstance(pages, snapshot_format.MessagePages):
+                messages._source = pages
+                self.pinned = set()
+
+class ShardedStorage(SnapshotStorage):
+    '''
+    Every write rewrites only the top level values of the store that
+    changed, each into its own file in database.shards/, so eg. renaming a
+    user rewrites the users but not the messages.
+
+    A write puts each changed value into a new file and then replaces the
+    manifest, which names the current file of every value, so a crash
+    part way through a write leaves the previous set of files in place.
+    '''
+    records_changes = True
+    records_ops = False
+
+    def __init__(self, path, fsync):
+        SnapshotStorage.__init__(self, path, fsync)
+        self.directory = os.path.splitext(path)[0] + '.shards'
+        self.manifest_path = os.path.join(self.directory, 'manifest.p')
+        self.generation = 0
+        self.shards = {}
+
+    def load(self, initial):
+        try:
+            with open(self.manifest_path, 'rb') as FILE:
+                manifest = pickle.load(FILE)
+        except FileNotFoundError:
+            # nothing sharded yet, start from a single file snapshot if there is one
+            return SnapshotStorage.load(self, initial)
+
+        self.generation = manifest["generation"]
+        self.shards = manifest["shards"]
+        # remove any files left behind by a write that didn't finish
+        for name in os.listdir(self.directory):
+            if name != 'manifest.p' and name not in self.shards.values():
+                os.remove(os.path.join(self.directory, name))
+
+        store = dict(initial)
+        for key, name in self.shards.items():
+            shard_path = os.path.join(self.directory, name)
+            with open(shard_path, 'rb') as FILE:
+                if snapshot_format.is_snapshot(shard_path):
+                    shard, meta = snapshot_format.load(FILE)
+                else:
+                    shard, meta = {key: pickle.load(FILE)}, {}
+            # each shard is at the version it was last written at
+            migrations.migrate(shard, meta.get("schema", {}))
+            store[key] = shard[key]
+        return store
+
+    def write(self, store, ops, touched):
+        if ops is None or () in touched or not self.shards:
+            keys = set(store)
+        else:
+            keys = {key[0] for key in touched}
+        if not keys:
+            return False
+
+        os.makedirs(self.directory, exist_ok=True)
+        self.generation += 1
+        shards = dict(self.shards)
+        for key in keys:
+            shards.pop(key, None)
+            if key in store:
+                shards[key] = f"{key}.{self.generation}.p"
+                with open(os.path.join(self.directory, shards[key]), 'wb') as FILE:
+                    meta = {"schema": migrations.versions()}
+                    snapshot_format.dump({key: store[key]}, FILE, meta, config.archive_message_age)
+                    # the new manifest must never name a file that isn't on disk yet
+                    if self.fsync != "never":
+                        sync(FILE)
+        shards = {key: shards[key] for key in store if key in shards}
+
+        manifest = {"generation": self.generation, "shards": shards}
+        replace(self.manifest_path, lambda FILE: pickle.dump(manifest, FILE), self.fsync)
+
+        # the files replaced by this write are no longer needed
+        for key, name in self.shards.items():
+            if shards.get(key) != name:
+                os.remove(os.path.join(self.directory, name))
+        self.shards = shards
+        return True
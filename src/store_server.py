@@ -0,0 +1,176 @@
+import collections
+import os
+import pickle
+import signal
+import socket
+import sys
+import threading
+from src import config
+from src.data_store import Datastore
+from src.journal import apply_op
+from src.remote_storage import receive_message, send_message
+
+'''
+store_server.py
+
+Store daemon, which keeps the data store for any number of server processes
+on the same machine and persists it, see remote_storage.py for the protocol.
+
+Start the daemon, then the servers with config.persistence = "remote", eg.
+
+    python3 -m src.store_server [socket]
+
+The daemon persists the store as config.store_persistence says, and listens
+on config.store_socket unless a socket is given.
+'''
+
+# number of recent commits kept to catch processes up, one further behind is
+# sent the whole store instead
+KEPT_COMMITS = 10000
+
+class StoreServer:
+    '''
+    Serves the store of `data_store` on a Unix socket at `path`, one thread
+    per connection
+
+    Arguments:
+        data_store (Datastore)  - loaded data store to serve
+        path (str)              - socket to listen on
+    '''
+    def __init__(self, data_store, path):
+        self.data_store = data_store
+        self.path = path
+        self.seq = 0
+        # (seq, ops) of the latest commits
+        self.commits = collections.deque(maxlen=KEPT_COMMITS)
+        # guards the above, so catching up never waits for a commit to be
+        # written to disk
+        self.log = threading.Lock()
+        # held while a commit is applied and persisted, and by anything that
+        # needs the store to match seq
+        self.persisting = threading.Lock()
+        # guards the lock handed out to connections
+        self.changed = threading.Condition()
+        self.holder = None
+        self.listener = None
+
+    def serve_forever(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(self.path)
+        self.listener.listen(64)
+        while True:
+            try:
+                connection, _ = self.listener.accept()
+            except OSError:
+                # the listener was closed by shutdown
+                return
+            threading.Thread(target=self.handle, args=(connection,), daemon=True).start()
+
+    def shutdown(self):
+        if self.listener is not None:
+            self.listener.close()
+            self.listener = None
+            os.unlink(self.path)
+        self.data_store.close()
+
+    def handle(self, connection):
+        try:
+            while True:
+                message = receive_message(connection)
+                if message is None:
+                    return
+                try:
+                    reply = getattr(self, "command_" + message[0])(connection, *message[1:])
+                except Exception as error:
+                    reply = ("error", f"{type(error).__name__}: {error}")
+                send_message(connection, reply)
+        except OSError:
+            pass
+        finally:
+            # a process that goes away can't keep the store locked
+            self.command_unlock(connection)
+            connection.close()
+
+    def store_reply(self):
+        # the whole store, a plain copy so it can be pickled as it is, which
+        # waits for a commit being persisted so it is the store as of seq
+        with self.persisting:
+            with self.log:
+                seq = self.seq
+            return ("store", seq, pickle.loads(pickle.dumps(self.data_store.get(), pickle.HIGHEST_PROTOCOL)))
+
+    def take_lock(self, connection):
+        with self.changed:
+            while self.holder not in (None, connection):
+                self.changed.wait()
+            self.holder = connection
+
+    def release_lock(self):
+        with self.changed:
+            self.holder = None
+            self.changed.notify_all()
+
+    def command_load(self, connection):
+        return self.store_reply()
+
+    def command_catch_up(self, connection, seq, lock):
+        if lock:
+            self.take_lock(connection)
+        with self.log:
+            if seq == self.seq:
+                return ("frames", self.seq, [])
+            first = self.commits[0][0] if self.commits else self.seq + 1
+            if not (seq > self.seq or seq + 1 < first):
+                return ("frames", self.seq, [commit for commit in self.commits if commit[0] > seq])
+        return self.store_reply()
+
+    def command_commit(self, connection, ops):
+        self.take_lock(connection)
+        try:
+            # written to disk outside of `changed` and `log`, so processes
+            # catching up and unlocking don't wait for it
+            with self.persisting:
+                with self.data_store.transaction() as store:
+                    for op in ops:
+                        apply_op(store, pickle.loads(op))
+                    self.data_store.set(store)
+                with self.log:
+                    self.seq += 1
+                    self.commits.append((self.seq, ops))
+                    return ("committed", self.seq)
+        finally:
+            self.release_lock()
+
+    def command_replace(self, connection, store):
+        self.take_lock(connection)
+        try:
+            with self.persisting:
+                self.data_store.set(store)
+                with self.log:
+                    self.seq += 1
+                    # a process behind this can only catch up with the whole store
+                    self.commits.clear()
+                    return ("committed", self.seq)
+        finally:
+            self.release_lock()
+
+    def command_unlock(self, connection):
+        with self.changed:
+            if self.holder is connection:
+                self.holder = None
+                self.changed.notify_all()
+        return ("unlocked",)
+
+if __name__ == "__main__":
+    data_store = Datastore(persistence=config.store_persistence)
+    data_store.load()
+    server = StoreServer(data_store, sys.argv[1] if len(sys.argv) > 1 else config.store_socket)
+
+    def quit_gracefully(*args):
+        server.shutdown()
+        exit(0)
+    signal.signal(signal.SIGINT, quit_gracefully)
+    signal.signal(signal.SIGTERM, quit_gracefully)
+    server.serve_forever()
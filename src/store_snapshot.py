@@ -0,0 +1,348 @@
+import collections.abc
+import threading
+from src.journal import SNAPSHOTS, LazyDict, MemberList, TrackedDict, TrackedList
+
+'''
+store_snapshot.py
+
+Copy-on-write snapshots of a store, which keep showing the store as it was
+when they were taken while writers go on changing it.
+
+Taking a snapshot copies nothing. While it is open, each dict or list of the
+store saves what it held before it first changes (see journal.preserve):
+  - a dict saves the old value at each key that changes, or a shallow copy
+    of itself if it is cleared
+  - a list that is only added to saves its old length, and otherwise a
+    shallow copy of itself
+Reading through the snapshot copies a dict or list as it is now, and then
+undoes on the copy whatever it has saved. A container always saves before it
+changes, so either the copy was taken before a change or what was saved for
+it is there by the time it is looked for. Copying a dict or list doesn't
+release the GIL, so no change can happen part way through a copy.
+
+What a snapshot saves is also all it takes to undo the changes made since,
+which is how the Datastore rolls back a transaction, see restore.
+
+The views a snapshot hands out are read only, and copy() of each returns a
+plain copy, eg. to put in a response.
+'''
+
+# value of a key that a dict didn't have when the snapshot was taken
+MISSING = object()
+
+class Saved:
+    '''
+    What a snapshot has saved of one container
+
+    Arguments:
+        node (TrackedDict, TrackedList or LazyDict)  - the container
+    '''
+    __slots__ = ("node", "keys", "copy", "length")
+
+    def __init__(self, node):
+        self.node = node
+        # old value at each key changed, for a dict
+        self.keys = {}
+        # shallow copy of the whole container
+        self.copy = None
+        # old length of a list only added to
+        self.length = None
+
+    def save(self, key):
+        node = self.node
+        if isinstance(node, LazyDict):
+            if key not in self.keys:
+                self.keys[key] = node.get(key, MISSING)
+        elif isinstance(node, dict):
+            # keys changed after a copy is taken are already in the copy
+            if self.copy is not None:
+                return
+            if key is None:
+                self.copy = dict.copy(node)
+            elif key not in self.keys:
+                self.keys[key] = dict.get(node, key, MISSING)
+        elif self.copy is None:
+            if key is None:
+                # only added to until now, so the old items are the first ones
+                self.copy = list.copy(node)[:self.length]
+            elif self.length is None:
+                self.length = key
+
+    def contents(self, current):
+        '''
+        What the container held when the snapshot was taken
+
+        Arguments:
+            current (dict or list)  - copy of the container taken before
+                                      calling, see the module docstring
+        '''
+        # the copy is looked for before the length, as it is saved after it
+        if isinstance(current, list):
+            if self.copy is not None:
+                return list(self.copy)
+            return current[:self.length]
+        if self.copy is not None:
+            current = dict(self.copy)
+        for key, value in list(self.keys.items()):
+            if value is MISSING:
+                current.pop(key, None)
+            else:
+                current[key] = value
+        return current
+
+class Snapshot:
+    '''
+    View of a store as it was when the snapshot was taken
+
+    Arguments:
+        store (TrackedDict)  - the store
+        version (int)        - the version of the store being viewed
+    '''
+    def __init__(self, store, version):
+        self.version = version
+        self.__store = store
+        # id of each container changed since the snapshot was taken, to what
+        # has been saved of it
+        self.__saved = {}
+        self.__lock = threading.Lock()
+        self.__root = None
+        SNAPSHOTS.add(self)
+
+    def close(self):
+        # containers can change without saving anything from now on
+        SNAPSHOTS.discard(self)
+        self.__saved = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def get(self):
+        # the top level collections are looked up over and over, so their
+        # views are only made once
+        if self.__root is None:
+            self.__root = DictView(self, self.__store, cache=True)
+        return self.__root
+
+    def preserve(self, node, key=None):
+        with self.__lock:
+            saved = self.saved(node)
+            if saved is None:
+                saved = self.__saved[id(node)] = Saved(node)
+            saved.save(key)
+
+    def saved(self, node):
+        # what has been saved of node, or None
+        saved = self.__saved.get(id(node))
+        return saved if saved is not None and saved.node is node else None
+
+    def contents(self, node):
+        # what a dict or list held when the snapshot was taken, as a plain copy
+        current = dict.copy(node) if isinstance(node, dict) else list.copy(node)
+        saved = self.saved(node)
+        return current if saved is None else saved.contents(current)
+
+    def restore(self):
+        '''
+        Puts every container changed since the snapshot was taken back the way
+        it was, without recording the changes. Nothing else can be changing
+        the store meanwhile.
+
+        Return Value:
+            whether anything had changed
+        '''
+        with self.__lock:
+            for saved in self.__saved.values():
+                node = saved.node
+                if isinstance(node, LazyDict):
+                    restore_records(node, saved.keys)
+                elif isinstance(node, dict):
+                    contents = saved.contents(dict.copy(node))
+                    dict.clear(node)
+                    dict.update(node, contents)
+                else:
+                    list.__setitem__(node, slice(None), saved.contents(list.copy(node)))
+                    if isinstance(node, MemberList):
+                        node.recount()
+            return bool(self.__saved)
+
+    def view(self, value):
+        # read only view of a value of the store
+        if isinstance(value, LazyDict):
+            return LazyView(self, value)
+        if isinstance(value, TrackedDict):
+            return DictView(self, value)
+        if isinstance(value, TrackedList):
+            return ListView(self, value)
+        return value
+
+def restore_records(node, records):
+    # puts records of a LazyDict back, pinned in memory until they are written
+    with node._lock:
+        for key, record in records.items():
+            node._alive.pop(key, None)
+            node._hot.pop(key, None)
+            if record is MISSING:
+                dict.pop(node, key, None)
+                node._removed.add(key)
+            else:
+                node._removed.discard(key)
+                dict.__setitem__(node, key, record)
+
+def thaw(value):
+    # plain copy of a value read through a snapshot
+    if isinstance(value, (DictView, LazyView)):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, ListView):
+        return [thaw(item) for item in value]
+    return value
+
+def shallow_copy(value):
+    # plain copy of a list, read through a snapshot or not, holding the same
+    # items as the store, so only for items that are never changed in place
+    if isinstance(value, ListView):
+        return value.shallow()
+    if isinstance(value, list):
+        return list.copy(value)
+    return value
+
+class Thawed(collections.abc.Mapping):
+    '''
+    Plain copies of the values of a DictView, each made as it is read, so a
+    whole store can be gone through, eg. to write a backup, holding a copy of
+    only one of its collections at a time
+    '''
+    def __init__(self, view):
+        self.__view = view
+
+    def __getitem__(self, key):
+        return thaw(self.__view[key])
+
+    def __iter__(self):
+        return iter(self.__view)
+
+    def __len__(self):
+        return len(self.__view)
+
+class View:
+    def copy(self):
+        return thaw(self)
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({thaw(self)!r})"
+
+class DictView(View, collections.abc.Mapping):
+    def __init__(self, snapshot, node, cache=False):
+        self.__snapshot = snapshot
+        self.__contents = snapshot.contents(node)
+        self.__views = {} if cache else None
+
+    def __getitem__(self, key):
+        if self.__views is None:
+            return self.__snapshot.view(self.__contents[key])
+        if key not in self.__views:
+            self.__views[key] = self.__snapshot.view(self.__contents[key])
+        return self.__views[key]
+
+    def __contains__(self, key):
+        return key in self.__contents
+
+    def __iter__(self):
+        return iter(self.__contents)
+
+    def __len__(self):
+        return len(self.__contents)
+
+class ListView(View, collections.abc.Sequence):
+    def __init__(self, snapshot, node):
+        self.__snapshot = snapshot
+        self.__node = node
+        # copied the first time they are needed
+        self.__contents = None
+        self.__members = None
+
+    def __held(self):
+        if self.__contents is None:
+            self.__contents = self.__snapshot.contents(self.__node)
+        return self.__contents
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.__snapshot.view(item) for item in self.__held()[index]]
+        return self.__snapshot.view(self.__held()[index])
+
+    def __contains__(self, value):
+        node = self.__node
+        if isinstance(node, MemberList):
+            # the members held now are the ones the snapshot was taken with
+            # if nothing was saved of them by the time they were asked
+            held = node.holds(value)
+            if held is not None and self.__snapshot.saved(node) is None:
+                return held
+            if self.__members is None:
+                try:
+                    self.__members = frozenset(self.__held())
+                except TypeError:
+                    return value in self.__held()
+            try:
+                return value in self.__members
+            except TypeError:
+                return False
+        return value in self.__held()
+
+    def __len__(self):
+        return len(self.__held())
+
+    def shallow(self):
+        # plain copy of the list, holding the items of the store themselves
+        return list(self.__held())
+
+    def __eq__(self, other):
+        return isinstance(other, (list, ListView)) and thaw(self) == list(other)
+
+class LazyView(View, collections.abc.Mapping):
+    '''
+    View of a LazyDict, which reads each record as it is needed like the
+    LazyDict itself
+    '''
+    def __init__(self, snapshot, node):
+        self.__snapshot = snapshot
+        self.__node = node
+
+    def __record(self, key):
+        record = self.__node.get(key, MISSING)
+        saved = self.__snapshot.saved(self.__node)
+        if saved is not None and key in saved.keys:
+            record = saved.keys[key]
+        return record
+
+    def __getitem__(self, key):
+        record = self.__record(key)
+        if record is MISSING:
+            raise KeyError(key)
+        return self.__snapshot.view(record)
+
+    def __contains__(self, key):
+        return self.__record(key) is not MISSING
+
+    def prefetch(self, keys):
+        # loads the records at `keys` in one read, see LazyDict.prefetch
+        self.__node.prefetch(keys)
+
+    def __iter__(self):
+        keys = self.__node.keys()
+        saved = self.__snapshot.saved(self.__node)
+        saved = dict(saved.keys) if saved is not None else {}
+        # keys added since the snapshot are left out, and removed ones put back
+        listed = set(keys)
+        keys = [key for key in keys if saved.get(key) is not MISSING]
+        keys.extend(key for key, record in saved.items() if record is not MISSING and key not in listed)
+        return iter(keys)
+
+    def __len__(self):
+        return sum(1 for _ in self)
@@ -162,12 +162,13 @@ def user_profile_setemail_v1(token, email):
     if re.fullmatch(R'^[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}$', email) == None:
         raise InputError(description="Invalid email format")
     # - Email address is already being used by another user
-    for user in users.values():
-        if user["email"] == email:
-            raise InputError(description="Email already taken")
+    if data_store.emails.find(store, email) is not None:
+        raise InputError(description="Email already taken")
 
-    user = store["users"][auth_user_id]
+    user = users[auth_user_id]
+    data_store.emails.discard(store, user["email"])
     user["email"] = email
+    data_store.emails.add(store, email, auth_user_id)
     data_store.set(store)
 
     return {}
@@ -194,7 +195,6 @@ def user_profile_sethandle_v1(token, handle_str):
     '''
     auth_user_id = get_auth_user_id(token)
     store = data_store.get()
-    users = store["users"]
     user = store["users"][auth_user_id]
     
     handle_length = len(handle_str)
@@ -205,11 +205,13 @@ def user_profile_sethandle_v1(token, handle_str):
     if handle_str.isalnum() == False:
         raise InputError(description="Handle must only contain alphanumeric characters.")
 
-    if is_taken(users, handle_str) == True:
+    if is_taken(handle_str) == True:
         raise InputError(description="Handle is already taken.")
     
     # Update user handle
+    data_store.handles.discard(store, user["handle_str"])
     user["handle_str"] = handle_str
+    data_store.handles.add(store, handle_str, auth_user_id)
     data_store.set(store)
 
     return {}
@@ -312,52 +314,50 @@ def user_profile_uploadphoto_v1(token, img_url, x_start, y_start, x_end, y_end):
 # determine wether the given handle is in a specified channel
 def handle_in_channel(handle, channel_id):
     store = data_store.get()
-    users = store["users"]
     channel = store["channels"][channel_id]
 
-    for u_id in channel["all_members"]:
-        if users[u_id]["handle_str"] == handle:
-            return True
+    u_id = to_uid(handle)
+    return u_id is not None and u_id in channel["all_members"]
 
 # determine wether the given handle is in a specified dm
 def handle_in_dm(handle, dm_id):
     store = data_store.get()
-    users = store["users"]
     dm = store["dms"][dm_id]
 
-    for u_id in dm["members"]:
-        if users[u_id]["handle_str"] == handle:
-            return True
+    u_id = to_uid(handle)
+    return u_id is not None and u_id in dm["members"]
 
 def to_uid(handle):
     store = data_store.get()
-    users = store["users"]
-
-    for u_id, user in users.items():
-        if user["handle_str"] == handle:
-            return u_id
+    return data_store.handles.find(store, handle)
             
 # find location of message in channel
 def find_location(message_id):
     store = data_store.get()
-    channels = store["channels"]
-    dms = store["dms"]
-    
-    # Search for location of message in channels
-    for ch_id, channel in channels.items():
-        if message_id in channel["messages"]:
-            return {
-                "location_type": "channel",
-                "location_id": ch_id
-            }
-
-    # If not found, then search for location in dms
-    for dm_id, dm in dms.items():
-        if message_id in dm["messages"]:
-            return {
-                "location_type": "dm",
-                "location_id": dm_id
-            }
+    location = data_store.message_locations.locate(store, message_id)
+    if location is None:
+        return None
+    location_type, location_id = location
+    return {
+        "location_type": location_type,
+        "location_id": location_id
+    }
+
+# find the channel/dm of a message, if the user has joined it
+# returns (location_type, location_id, location_info), or raises an InputError
+def find_joined_location(store, auth_user_id, message_id):
+    location = data_store.message_locations.locate(store, message_id)
+    if location is not None:
+        location_type, location_id = location
+        if location_type == "channel":
+            location_info = store["channels"][location_id]
+            members = location_info["all_members"]
+        else:
+            location_info = store["dms"][location_id]
+            members = location_info["members"]
+        if auth_user_id in members:
+            return location_type, location_id, location_info
+    raise InputError(description="message_id not within a channel/dm that the user has joined")
 
 # send notifications to users tagged in a message
 def notifications_send_tagged(sender_id, message, platform_id, platform_type):
@@ -0,0 +1,173 @@
+import copy
+import json
+import sys
+from src.data_store import data_store, initial_object
+from src.journal import LazyDict
+from src.snapshot_format import PAGE_SIZE
+from src.store_snapshot import LazyView, thaw
+
+'''
+workspace.py
+
+Export and import of the whole workspace as JSON Lines, one record per line,
+for moving a workspace between environments, migrating it, or seeding a
+load test with it. Neither holds more than a line of the file in memory at
+once. An export is written from a snapshot of the store, so requests go on
+being served while it is written, and an import builds the whole store
+before it replaces the one there is.
+
+    {"type": "workspace", "format": 2, "session_id_tracker": 2, "dm_id_tracker": 1, "message_id_tracker": 3}
+    {"type": "user", "u_id": 0, "email": ..., "user_stats": {...}}
+    {"type": "channel", "channel_id": 0, "channel_name": ..., "all_members": [0, 1], ...}
+    {"type": "dm", "dm_id": 0, "name": ..., "members": [0, 1], ...}
+    {"type": "message", "channel_id": 0, "key": 0, "message_id": 0, "message": ..., ...}
+    {"type": "users_stats", "channels_exist": [...], ...}
+
+The first line is the workspace's own, and every channel and dm comes before
+the messages. Channels and dms are written without their list of messages:
+each message says which channel or dm it is in, and the messages of each
+are written in the order of the list, so importing rebuilds every list in
+one pass as it goes. Each message is written with the key it is stored
+under, which isn't always its message_id: a message sent later keeps the
+message_id it was given when it was scheduled, but is stored under the one
+it is given when it is sent, see message_sendlater_v1. A message no channel or dm holds any more isn't
+exported, see message_gc.py.
+
+    python3 -m src.workspace export workspace.jsonl
+    python3 -m src.workspace import workspace.jsonl
+
+export reads the store the server would restore, and import replaces it.
+'''
+
+FORMAT = 2
+
+# formats import reads, the first of which has no key for a message, as its
+# message_id was taken to be its key
+FORMATS = (1, 2)
+
+# collection, the key of each record's id in a line, and its type
+COLLECTIONS = (
+    ("users",       "u_id",         "user"),
+    ("channels",    "channel_id",   "channel"),
+    ("dms",         "dm_id",        "dm")
+)
+
+TRACKERS = ("session_id_tracker", "dm_id_tracker", "message_id_tracker")
+
+def write_line(FILE, kind, fields):
+    FILE.write(json.dumps(dict({"type": kind}, **fields), separators=(",", ":")))
+    FILE.write("\n")
+
+def export_workspace(store, FILE):
+    '''
+    Writes every record of a store to FILE as JSON Lines
+
+    Arguments:
+        store (dict)  - the store, or a snapshot of it
+        FILE (file)   - text file opened for writing
+
+    Return Value:
+        dictionary of the number of records of each type written
+    '''
+    counts = {"user": 0, "channel": 0, "dm": 0, "message": 0}
+    write_line(FILE, "workspace", dict({"format": FORMAT}, **{tracker: store[tracker] for tracker in TRACKERS}))
+    for collection, id_key, kind in COLLECTIONS:
+        for record_id, record in store[collection].items():
+            fields = {key: thaw(value) for key, value in record.items() if key != "messages"}
+            write_line(FILE, kind, dict({id_key: record_id}, **fields))
+            counts[kind] += 1
+
+    messages = store["messages"]
+    for collection, id_key, _ in COLLECTIONS[1:]:
+        for location_id, location in store[collection].items():
+            message_ids = thaw(location["messages"])
+            for start in range(0, len(message_ids), PAGE_SIZE):
+                page = message_ids[start:start + PAGE_SIZE]
+                if isinstance(messages, (LazyDict, LazyView)):
+                    messages.prefetch(page)
+                for message_id in page:
+                    message = messages.get(message_id)
+                    if message is not None:
+                        write_line(FILE, "message", dict({id_key: location_id, "key": message_id}, **thaw(message)))
+                        counts["message"] += 1
+
+    write_line(FILE, "users_stats", thaw(store["users_stats"]))
+    return counts
+
+def import_workspace(FILE):
+    '''
+    Reads a store written by export_workspace from FILE, in one pass
+
+    Arguments:
+        FILE (file)  - text file opened for reading
+
+    Exceptions:
+        ValueError  - FILE isn't an export of a workspace, or a message is
+                      in a channel or dm that isn't
+
+    Return Value:
+        plain store
+    '''
+    store = copy.deepcopy(initial_object)
+    ids = {kind: (collection, id_key) for collection, id_key, kind in COLLECTIONS}
+    header = False
+    for number, line in enumerate(FILE, 1):
+        if not line.strip():
+            continue
+        try:
+            fields = json.loads(line)
+            kind = fields.pop("type")
+        except (ValueError, KeyError, AttributeError, TypeError):
+            raise ValueError(f"line {number} is not a record")
+
+        if not header:
+            if kind != "workspace" or fields.get("format") not in FORMATS:
+                raise ValueError("not an export of a workspace")
+            for tracker in TRACKERS:
+                store[tracker] = fields[tracker]
+            header = True
+        elif kind in ids:
+            collection, id_key = ids[kind]
+            record_id = fields.pop(id_key)
+            if kind != "user":
+                fields["messages"] = []
+            store[collection][record_id] = fields
+        elif kind == "message":
+            collection, id_key = ("channels", "channel_id") if "channel_id" in fields else ("dms", "dm_id")
+            location = store[collection].get(fields.pop(id_key, None))
+            if location is None:
+                raise ValueError(f"line {number} is a message of a {id_key[:-3]} that doesn't exist")
+            key = fields.pop("key", fields.get("message_id"))
+            location["messages"].append(key)
+            store["messages"][key] = fields
+        elif kind == "users_stats":
+            store["users_stats"] = fields
+        else:
+            raise ValueError(f"line {number} is a record of unknown type {kind}")
+    if not header:
+        raise ValueError("not an export of a workspace")
+    return store
+
+def export_file(data_store, path):
+    # exports the store of data_store to the file at path, from a snapshot so
+    # writers aren't held up while it is written
+    with data_store.snapshot() as snapshot:
+        with open(path, 'w') as FILE:
+            return export_workspace(snapshot.get(), FILE)
+
+def import_file(data_store, path):
+    # replaces the store of data_store with the workspace exported to the file at path
+    with open(path) as FILE:
+        store = import_workspace(FILE)
+    with data_store.transaction():
+        data_store.set(store)
+    return {"user": len(store["users"]), "channel": len(store["channels"]),
+            "dm": len(store["dms"]), "message": len(store["messages"])}
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] not in ("export", "import"):
+        sys.exit("usage: python3 -m src.workspace export|import workspace.jsonl")
+    data_store.load()
+    counts = (export_file if sys.argv[1] == "export" else import_file)(data_store, sys.argv[2])
+    print(f"{sys.argv[1]}ed " + ", ".join(f"{count} {kind}s" for kind, count in counts.items()))
+    data_store.close()
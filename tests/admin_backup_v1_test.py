@@ -0,0 +1,117 @@
+import os
+import pytest
+import requests
+from src import config
+from src.admin import prune_backups
+from src.config import url
+
+INPUT_ERROR = 400
+ACCESS_ERROR = 403
+NO_ERROR = 200
+
+@pytest.fixture(autouse=True)
+def backups():
+    # the server writes backups to its own backup directory, so each test
+    # removes the ones it took
+    before = set(os.listdir(config.backup_directory)) if os.path.isdir(config.backup_directory) else set()
+    yield
+    if os.path.isdir(config.backup_directory):
+        for name in set(os.listdir(config.backup_directory)) - before:
+            os.remove(os.path.join(config.backup_directory, name))
+
+@pytest.fixture
+def data():
+    # clear used data
+    requests.delete(url + 'clear/v1')
+
+    # create user 1, a global owner
+    response1 = requests.post(url + "auth/register/v2", json={
+        "email": "user1@gmail.com",
+        "password": "password",
+        "name_first": "Luke",
+        "name_last": "Pierce"
+
+    })
+    token1 = response1.json()["token"]
+
+    # create user 2
+    response2 = requests.post(url + "auth/register/v2", json={
+        "email": "user2@gmail.com",
+        "password": "password",
+        "name_first": "Artem",
+        "name_last": "Wing"
+
+    })
+    token2 = response2.json()["token"]
+
+    # user 1 creates a channel
+    requests.post(url + "channels/create/v2", json={
+        "token":        token1,
+        "name":         "channel1",
+        "is_public":    True
+    })
+
+    values = {
+        "token1": token1,
+        "token2": token2,
+    }
+    return values
+
+def list_channels(token):
+    response = requests.get(url + "channels/listall/v2", params={"token": token})
+    return [channel["name"] for channel in response.json()["channels"]]
+
+# token user is not a global owner
+def test_backup_not_owner(data):
+    response = requests.post(url + "admin/backup/v1", json={"token": data["token2"]})
+    assert response.status_code == ACCESS_ERROR
+
+# invalid token
+def test_backup_invalid_token(data):
+    response = requests.post(url + "admin/backup/v1", json={"token": "invalid"})
+    assert response.status_code == ACCESS_ERROR
+
+# token user is not a global owner
+def test_restore_not_owner(data):
+    backup = requests.post(url + "admin/backup/v1", json={"token": data["token1"]}).json()["backup"]
+    response = requests.post(url + "admin/restore/v1", json={"token": data["token2"], "backup": backup})
+    assert response.status_code == ACCESS_ERROR
+
+# backup doesn't refer to a backup, including one outside the backup directory
+def test_restore_invalid_backup(data):
+    for backup in ["backup-0-0.p", "../database.p", 5]:
+        response = requests.post(url + "admin/restore/v1", json={"token": data["token1"], "backup": backup})
+        assert response.status_code == INPUT_ERROR
+
+# restoring a backup undoes the changes made since it was taken
+def test_backup_restore(data):
+    response = requests.post(url + "admin/backup/v1", json={"token": data["token1"]})
+    assert response.status_code == NO_ERROR
+    backup = response.json()["backup"]
+
+    requests.post(url + "channels/create/v2", json={
+        "token":        data["token1"],
+        "name":         "channel2",
+        "is_public":    True
+    })
+    assert list_channels(data["token1"]) == ["channel1", "channel2"]
+
+    response = requests.post(url + "admin/restore/v1", json={"token": data["token1"], "backup": backup})
+    assert response.status_code == NO_ERROR
+    assert response.json()["time_stamp"] == int(backup.split("-")[1])
+    assert list_channels(data["token1"]) == ["channel1"]
+
+# only the newest backups are kept, and other files are left alone
+def test_prune_backups(monkeypatch, tmp_path):
+    monkeypatch.setattr(config, "backup_directory", str(tmp_path))
+    monkeypatch.setattr(config, "max_backups", 3)
+    names = ["backup-100-2.p", "backup-90-5.p", "backup-100-10.p", "backup-80-1.p", "backup-120-0.p", "notes.txt"]
+    for name in names:
+        (tmp_path / name).write_bytes(b"")
+    prune_backups()
+    assert sorted(os.listdir(tmp_path)) == ["backup-100-10.p", "backup-100-2.p", "backup-120-0.p", "notes.txt"]
+
+    monkeypatch.setattr(config, "max_backups", None)
+    (tmp_path / "backup-1-0.p").write_bytes(b"")
+    prune_backups()
+    assert len(os.listdir(tmp_path)) == 5
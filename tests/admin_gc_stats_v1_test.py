@@ -0,0 +1,57 @@
+import pytest
+import requests
+from src.config import url
+
+ACCESS_ERROR = 403
+NO_ERROR = 200
+
+@pytest.fixture
+def data():
+    # clear used data
+    requests.delete(url + 'clear/v1')
+
+    # create user 1, a global owner
+    response1 = requests.post(url + "auth/register/v2", json={
+        "email": "user1@gmail.com",
+        "password": "password",
+        "name_first": "Luke",
+        "name_last": "Pierce"
+
+    })
+    token1 = response1.json()["token"]
+
+    # create user 2
+    response2 = requests.post(url + "auth/register/v2", json={
+        "email": "user2@gmail.com",
+        "password": "password",
+        "name_first": "Artem",
+        "name_last": "Wing"
+
+    })
+    token2 = response2.json()["token"]
+
+    values = {
+        "token1": token1,
+        "token2": token2,
+    }
+    return values
+
+# token user is not a global owner
+def test_gc_stats_not_owner(data):
+    response = requests.get(url + "admin/gc/stats/v1", params={"token": data["token2"]})
+    assert response.status_code == ACCESS_ERROR
+
+# invalid token
+def test_gc_stats_invalid_token(data):
+    response = requests.get(url + "admin/gc/stats/v1", params={"token": "invalid"})
+    assert response.status_code == ACCESS_ERROR
+
+# a global owner gets what the collector has reclaimed so far
+def test_gc_stats_working(data):
+    response = requests.get(url + "admin/gc/stats/v1", params={"token": data["token1"]})
+    assert response.status_code == NO_ERROR
+    stats = response.json()
+    assert stats["cycles"] >= 0
+    assert stats["records_reclaimed"] >= 0
+    assert stats["bytes_reclaimed"] >= 0
+    assert "last_cycle" in stats
@@ -0,0 +1,58 @@
+import pytest
+import requests
+from src.config import url
+
+ACCESS_ERROR = 403
+NO_ERROR = 200
+
+@pytest.fixture
+def data():
+    # clear used data
+    requests.delete(url + 'clear/v1')
+
+    # create user 1, a global owner
+    response1 = requests.post(url + "auth/register/v2", json={
+        "email": "user1@gmail.com",
+        "password": "password",
+        "name_first": "Luke",
+        "name_last": "Pierce"
+
+    })
+    token1 = response1.json()["token"]
+
+    # create user 2
+    response2 = requests.post(url + "auth/register/v2", json={
+        "email": "user2@gmail.com",
+        "password": "password",
+        "name_first": "Artem",
+        "name_last": "Wing"
+
+    })
+    token2 = response2.json()["token"]
+
+    values = {
+        "token1": token1,
+        "token2": token2,
+    }
+    return values
+
+# token user is not a global owner
+def test_memory_report_not_owner(data):
+    response = requests.get(url + "admin/memory/report/v1", params={"token": data["token2"]})
+    assert response.status_code == ACCESS_ERROR
+
+# invalid token
+def test_memory_report_invalid_token(data):
+    response = requests.get(url + "admin/memory/report/v1", params={"token": "invalid"})
+    assert response.status_code == ACCESS_ERROR
+
+# a global owner gets the size of every part of the store
+def test_memory_report_working(data):
+    response = requests.get(url + "admin/memory/report/v1", params={"token": data["token1"]})
+    assert response.status_code == NO_ERROR
+    report = response.json()
+    assert report["bytes"] == sum(report["keys"].values())
+    users = report["collections"]["users"]
+    assert users["records"] == 2
+    assert "user_stats" in users["fields"]
+    assert {user["id"] for user in users["largest"]} == {0, 1}
@@ -0,0 +1,73 @@
+import threading
+import pytest
+from src.data_store import Datastore
+
+'''
+conftest.py
+
+Fixtures and helpers shared by the tests of the data store and its
+storages, which each work on a store of their own in pytest's tmp_path
+rather than going through the server.
+'''
+
+@pytest.fixture
+def store_path(tmp_path):
+    return str(tmp_path / "database.p")
+
+@pytest.fixture(params=["journal", "paged", "sqlite"])
+def data_store(request, store_path):
+    # a user and a channel of 3 messages, read back from disk
+    data_store = load(store_path, request.param)
+    with data_store.write() as store:
+        store["users"][0] = {"email": "a@b.com", "sessions": [1]}
+        store["channels"][0] = {"channel_name": "general", "all_members": [0], "messages": []}
+        for index in range(3):
+            send(data_store, "channel", 0, f"message {index}", message_id=index, time_created=index)
+        data_store.set(store)
+    # read the messages back from disk, where the storage does so
+    return load(store_path, request.param)
+
+def load(path, persistence="journal", **options):
+    # a data store loaded from `path`, with the other options Datastore takes
+    data_store = Datastore(path, persistence, **options)
+    data_store.load()
+    return data_store
+
+def reload(path, persistence="journal"):
+    # the store as it was written to disk
+    return load(path, persistence).get()
+
+def message(text="hi", message_id=None, u_id=0, time_created=0, reacts=None):
+    # a message the way message/send/v1 stores it
+    return {
+        "message_id":   message_id,
+        "u_id":         u_id,
+        "message":      text,
+        "time_created": time_created,
+        "reacts":       [{"react_id": 1, "u_ids": []}] if reacts is None else reacts,
+        "is_pinned":    False
+    }
+
+def send(data_store, location_type, location_id, text="hi", **fields):
+    # adds a message to a channel or dm, and returns its message_id
+    return data_store.insert_message(location_type, location_id, message(text, **fields))
+
+def edit(data_store):
+    # changes every part of the store the data_store fixture holds
+    with data_store.write() as store:
+        store["users"][0]["sessions"].append(2)
+        store["users"][1] = {"email": "c@d.com", "sessions": []}
+        store["channels"][0]["all_members"].append(1)
+        send(data_store, "channel", 0, "message 3", message_id=3, u_id=1, time_created=3, reacts=[])
+        store["messages"][0]["message"] = "edited"
+        store["messages"][1]["reacts"][0]["u_ids"].append(1)
+        store["channels"][0]["messages"].remove(2)
+        del store["messages"][2]
+        data_store.set(store)
+
+def elsewhere(target, *args):
+    # the calling thread can't write while it has a snapshot open
+    thread = threading.Thread(target=target, args=args, daemon=True)
+    thread.start()
+    thread.join(5)
+    assert not thread.is_alive()
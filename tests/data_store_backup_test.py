@@ -0,0 +1,46 @@
+import copy
+import pytest
+from src import data_store as data_store_module
+from tests.conftest import edit, elsewhere, load
+
+@pytest.fixture
+def during_backup(monkeypatch):
+    # runs a function on another thread just before each backup is written
+    during = []
+    replace = data_store_module.replace
+    def slow_replace(path, write, fsync):
+        for function in during:
+            elsewhere(function)
+        replace(path, write, fsync)
+    monkeypatch.setattr(data_store_module, "replace", slow_replace)
+    return during
+
+# testing that a backup holds the store as it was when it began, whatever is written meanwhile
+def test_backup_consistent(data_store, during_backup, tmp_path):
+    before = copy.deepcopy(data_store.get())
+    during_backup.append(lambda: edit(data_store))
+    meta = data_store.backup(str(tmp_path / "backup.p"))
+    assert meta["version"] == 0
+    assert data_store.get()["messages"][0]["message"] == "edited"
+
+    data_store.restore(str(tmp_path / "backup.p"))
+    assert data_store.get() == before
+
+# testing that a restored store is written to disk, and can go on being changed
+def test_backup_restore_elsewhere(data_store, tmp_path):
+    data_store.backup(str(tmp_path / "backup.p"))
+    restored = load(str(tmp_path / "restored.p"))
+    restored.restore(str(tmp_path / "backup.p"))
+    edit(restored)
+
+    reloaded = load(str(tmp_path / "restored.p"))
+    assert reloaded.get() == restored.get()
+    assert sorted(reloaded.get()["messages"]) == [0, 1, 3]
+
+# testing that a file that isn't a backup is rejected, and the store is left as it was
+def test_backup_restore_invalid(data_store, tmp_path):
+    before = copy.deepcopy(data_store.get())
+    (tmp_path / "backup.p").write_bytes(b"not a backup")
+    with pytest.raises(ValueError):
+        data_store.restore(str(tmp_path / "backup.p"))
+    assert data_store.get() == before
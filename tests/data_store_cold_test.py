@@ -0,0 +1,72 @@
+import copy
+import time
+import pytest
+from src import cold_tier
+from src.cold_tier import ColdDict
+from tests.conftest import load, send
+
+DAY = 24 * 60 * 60
+
+@pytest.fixture(params=["journal", "snapshot"])
+def path(request, store_path):
+    # a channel of 10 messages a week old, then 10 sent just now, which are
+    # either replayed from the journal or read from the pages of a snapshot
+    data_store = load(store_path, request.param, cold_message_age=None)
+    now = int(time.time())
+    with data_store.write() as store:
+        store["channels"][0] = {"channel_name": "general", "all_members": [0], "messages": []}
+        for index in range(20):
+            time_created = now - 7 * DAY if index < 10 else now
+            send(data_store, "channel", 0, f"message {index}", message_id=index, time_created=time_created)
+        data_store.set(store)
+    return store_path
+
+def hot(data_store):
+    # message_ids of the messages held in memory
+    return sorted(dict.keys(data_store.get()["messages"]))
+
+# testing that old messages are moved out of memory, and still read as before
+def test_cold_messages_moved(path):
+    expected = copy.deepcopy(load(path, cold_message_age=None).get())
+    data_store = load(path, cold_message_age=DAY)
+    assert isinstance(data_store.get()["messages"], ColdDict)
+    assert hot(data_store) == list(range(10, 20))
+    assert data_store.get() == expected
+    assert data_store.page_messages("channel", 0, 15, 5)[0]["message"] == "message 4"
+
+# testing that changes to cold messages are kept, and move them out of memory again once written
+def test_cold_messages_changed(path):
+    data_store = load(path, cold_message_age=DAY)
+    with data_store.write() as store:
+        store["messages"][3]["reacts"][0]["u_ids"].append(0)
+        store["messages"][4]["message"] = "edited"
+        del store["messages"][5]
+        store["channels"][0]["messages"].remove(5)
+        data_store.set(store)
+    assert hot(data_store) == [3, 4] + list(range(10, 20))
+
+    store = data_store.get()
+    store["messages"].tier()
+    assert hot(data_store) == list(range(10, 20))
+    assert store["messages"][3]["reacts"][0]["u_ids"] == [0]
+    assert store["messages"][4]["message"] == "edited"
+    assert 5 not in store["messages"]
+    assert load(path, cold_message_age=None).get() == data_store.get()
+    assert load(path, cold_message_age=DAY).get() == data_store.get()
+
+# testing that compacting the segment leaves only the latest version of each message
+def test_cold_segment_compacted(path, monkeypatch):
+    monkeypatch.setattr(cold_tier, "COMPACT_SIZE", 0)
+    monkeypatch.setattr(cold_tier, "COMPACT_FRACTION", 0.2)
+    data_store = load(path, cold_message_age=DAY)
+    segment = data_store.get()["messages"]._source
+    size = segment.size
+    for index in range(10):
+        with data_store.write() as store:
+            store["messages"][index]["message"] = f"edited {index}"
+            data_store.set(store)
+        store["messages"].tier()
+    # without compacting, every message would be in the segment twice
+    assert segment.size < size * 1.5
+    assert [store["messages"][index]["message"] for index in range(10)] == [f"edited {index}" for index in range(10)]
+    assert load(path, cold_message_age=None).get() == data_store.get()
@@ -0,0 +1,69 @@
+import os
+import time
+import pytest
+from src import config, snapshot_format
+from src.data_store import Datastore
+from tests.conftest import load, reload
+
+@pytest.fixture
+def fsyncs(monkeypatch):
+    # number of times os.fsync has been called
+    calls = []
+    real_fsync = os.fsync
+    def fsync(fd):
+        calls.append(fd)
+        real_fsync(fd)
+    monkeypatch.setattr(os, "fsync", fsync)
+    return calls
+
+def send(data_store, text):
+    store = data_store.get()
+    store["messages"][store["message_id_tracker"]] = {"message_id": store["message_id_tracker"], "message": text}
+    store["message_id_tracker"] += 1
+    data_store.set(store)
+
+# testing that every write is synced before it returns under "always"
+def test_fsync_always(store_path, fsyncs):
+    data_store = load(store_path, "journal", fsync="always")
+    for index in range(3):
+        send(data_store, str(index))
+    assert len(fsyncs) == 3
+
+# testing that journal writes are synced together at the end of an interval
+def test_fsync_interval(store_path, fsyncs, monkeypatch):
+    monkeypatch.setattr(config, "fsync_interval", 50)
+    data_store = load(store_path, "journal", fsync="interval")
+    for index in range(3):
+        send(data_store, str(index))
+    assert len(fsyncs) == 0
+    time.sleep(0.2)
+    assert len(fsyncs) == 1
+
+# testing that nothing is synced under "never"
+@pytest.mark.parametrize("persistence", ["snapshot", "journal", "sharded", "sqlite"])
+def test_fsync_never(store_path, fsyncs, persistence):
+    data_store = load(store_path, persistence, fsync="never")
+    for index in range(3):
+        send(data_store, str(index))
+    assert len(fsyncs) == 0
+
+# testing that a write that fails part way leaves the last snapshot in place
+def test_torn_snapshot_write(store_path, monkeypatch):
+    data_store = load(store_path, "snapshot", fsync="always")
+    send(data_store, "hello")
+
+    def torn_dump(store, FILE, meta=None, archive_age=None):
+        FILE.write(b"STREAMS")
+        raise OSError("disk full")
+    monkeypatch.setattr(snapshot_format, "dump", torn_dump)
+    with pytest.raises(OSError):
+        send(data_store, "world")
+    monkeypatch.undo()
+
+    messages = reload(store_path, "snapshot")["messages"]
+    assert [message["message"] for message in messages.values()] == ["hello"]
+
+# testing that a mistyped policy is refused rather than treated as "never"
+def test_unknown_fsync_policy(store_path):
+    with pytest.raises(ValueError):
+        Datastore(store_path, "journal", "sometimes")
@@ -0,0 +1,58 @@
+import threading
+import time
+import pytest
+from src.storage import JournalStorage
+from tests.conftest import load, reload
+
+@pytest.fixture
+def written(monkeypatch):
+    # slows every write down, and keeps the message_id_trackers written
+    written = []
+    write = JournalStorage.write
+    def slow_write(self, store, ops, touched):
+        time.sleep(0.01)
+        wrote = write(self, store, ops, touched)
+        written.append(store["message_id_tracker"])
+        return wrote
+    monkeypatch.setattr(JournalStorage, "write", slow_write)
+    return written
+
+def send_all(data_store, threads, sends, check=lambda message_id: None):
+    def send():
+        for _ in range(sends):
+            with data_store.transaction() as store:
+                message_id = store["message_id_tracker"]
+                store["messages"][message_id] = {"message_id": message_id}
+                store["message_id_tracker"] = message_id + 1
+                data_store.set(store)
+            check(message_id)
+
+    running = [threading.Thread(target=send) for _ in range(threads)]
+    for thread in running:
+        thread.start()
+    for thread in running:
+        thread.join()
+
+# testing that units of work ending together are written together, and all of them are kept
+def test_group_commit_batches(store_path, written):
+    data_store = load(store_path, group_commit=True)
+    send_all(data_store, 8, 10)
+    assert data_store.writes < 40
+    assert reload(store_path) == data_store.get()
+    assert sorted(reload(store_path)["messages"]) == list(range(80))
+
+# testing that a unit of work only ends once its changes are on disk
+def test_group_commit_durable(store_path, written):
+    data_store = load(store_path, group_commit=True)
+    late = []
+    def check(message_id):
+        if not written or written[-1] <= message_id:
+            late.append(message_id)
+    send_all(data_store, 8, 5, check)
+    assert late == []
+
+# testing that without group commit every unit of work is written on its own
+def test_group_commit_off(store_path, written):
+    data_store = load(store_path, group_commit=False)
+    send_all(data_store, 4, 5)
+    assert data_store.writes == 20
@@ -0,0 +1,157 @@
+import copy
+import pytest
+from tests.conftest import elsewhere, load, send
+
+@pytest.fixture(params=["journal", "sqlite"])
+def data_store(request, store_path):
+    # a channel and a dm with 3 messages each, read back from disk
+    data_store = load(store_path, request.param)
+    with data_store.write() as store:
+        store["channels"][0] = {"channel_name": "general", "all_members": [0], "messages": []}
+        store["dms"][0] = {"name": "dm", "owner": 0, "members": [0], "messages": []}
+        for index in range(3):
+            send(data_store, "channel", 0)
+            send(data_store, "dm", 0)
+        data_store.set(store)
+    return load(store_path, request.param)
+
+def locate(data_store, message_id):
+    return data_store.message_locations.locate(data_store.get(), message_id)
+
+# testing that the location of every message is found from the store loaded
+def test_locations_loaded(data_store):
+    assert [locate(data_store, message_id) for message_id in range(6)] == [
+        ("channel", 0), ("dm", 0), ("channel", 0), ("dm", 0), ("channel", 0), ("dm", 0)
+    ]
+    assert locate(data_store, 6) is None
+
+# testing that messages sent and removed, and dms removed, are kept up to date
+def test_locations_changed(data_store):
+    with data_store.write() as store:
+        message_id = send(data_store, "dm", 0)
+        assert locate(data_store, message_id) == ("dm", 0)
+        store["channels"][0]["messages"].remove(0)
+        del store["messages"][0]
+        data_store.message_locations.discard(store, [0])
+        del store["dms"][0]
+        data_store.set(store)
+    assert [locate(data_store, message_id) for message_id in range(8)] == [None, None, ("channel", 0), None, ("channel", 0), None, None, None]
+
+# testing that changes rolled back, a new store and a cleared store are followed
+def test_locations_reset(data_store):
+    with data_store.transaction() as store:
+        store["dms"][1] = {"name": "new", "owner": 0, "members": [0], "messages": []}
+        message_id = send(data_store, "dm", 1)
+        store["channels"][0]["messages"].remove(0)
+        del store["messages"][0]
+        data_store.message_locations.discard(store, [0])
+        data_store.roll_back()
+    assert locate(data_store, message_id) is None
+    assert locate(data_store, 0) == ("channel", 0)
+
+    store = copy.deepcopy(data_store.get())
+    store["channels"][0]["messages"] = []
+    store["dms"][0]["messages"].append(0)
+    data_store.set(store)
+    assert locate(data_store, 0) == ("dm", 0)
+
+    with data_store.write() as store:
+        for collection in ("channels", "dms", "messages"):
+            store[collection].clear()
+        store["message_id_tracker"] = 0
+        data_store.reset_indexes()
+        store["channels"][5] = {"channel_name": "new", "all_members": [0], "messages": []}
+        send(data_store, "channel", 5)
+        data_store.set(store)
+    assert locate(data_store, 0) == ("channel", 5)
+
+# testing that the channels and dms of each user are found, and kept up to date
+def test_memberships(data_store):
+    with data_store.write() as store:
+        assert data_store.joined("channel", 0) == [0] and data_store.joined("dm", 0) == [0]
+        store["channels"][1] = {"channel_name": "new", "all_members": [], "messages": []}
+        data_store.add_member("channel", 1, 0)
+        data_store.add_member("channel", 1, 1)
+        data_store.remove_member("channel", 0, 0)
+        data_store.remove_member("dm", 0, 0)
+        data_store.set(store)
+    assert data_store.joined("channel", 0) == [1] and data_store.joined("dm", 0) == []
+    assert data_store.joined("channel", 1) == [1] and data_store.joined("channel", 2) == []
+
+    with data_store.transaction():
+        data_store.remove_member("channel", 1, 1)
+        data_store.roll_back()
+    assert data_store.joined("channel", 1) == [1]
+
+# testing that a snapshot sees the members as they were when it was taken,
+# while others join and leave
+def test_memberships_snapshot(data_store):
+    def join():
+        with data_store.write() as store:
+            data_store.add_member("dm", 0, 1)
+            data_store.set(store)
+    def leave():
+        with data_store.write() as store:
+            data_store.remove_member("channel", 0, 0)
+            data_store.set(store)
+
+    with data_store.write() as store:
+        assert data_store.joined("channel", 0) == [0]
+        data_store.set(store)
+    with data_store.snapshot():
+        elsewhere(join)
+        assert data_store.joined("dm", 1) == []
+        elsewhere(leave)
+        assert data_store.joined("channel", 0) == [0]
+    assert data_store.joined("channel", 0) == [] and data_store.joined("dm", 1) == [0]
+
+# testing that the user with each email is found, and not once it has changed
+def test_unique(data_store):
+    with data_store.write() as store:
+        for u_id in range(3):
+            store["users"][u_id] = {"email": f"user{u_id}@unsw.edu.au"}
+        data_store.set(store)
+    store = data_store.get()
+    emails = data_store.emails
+    assert [emails.find(store, f"user{u_id}@unsw.edu.au") for u_id in range(4)] == [0, 1, 2, None]
+
+    with data_store.write() as store:
+        store["users"][3] = {"email": "new@unsw.edu.au"}
+        emails.add(store, "new@unsw.edu.au", 3)
+        emails.discard(store, "user1@unsw.edu.au")
+        store["users"][1]["email"] = None
+        # changed without the index being told
+        store["users"][2]["email"] = "other@unsw.edu.au"
+        data_store.set(store)
+    assert [emails.find(store, f"user{u_id}@unsw.edu.au") for u_id in range(3)] == [0, None, None]
+    assert emails.find(store, "new@unsw.edu.au") == 3
+
+# testing that colliding handles are given the smallest number free, also
+# after handles given out are freed again
+def test_handles(data_store):
+    handles = data_store.handles
+    with data_store.write() as store:
+        def register(u_id):
+            handle = handles.unused(store, "johnsmith")
+            store["users"][u_id] = {"handle_str": handle}
+            handles.add(store, handle, u_id)
+            return handle
+        assert [register(u_id) for u_id in range(4)] == ["johnsmith", "johnsmith0", "johnsmith1", "johnsmith2"]
+        # john smith 2 takes the handle the next one would get, and 0 frees theirs
+        handles.discard(store, "johnsmith1")
+        store["users"][2]["handle_str"] = "johnsmith3"
+        handles.add(store, "johnsmith3", 2)
+        handles.discard(store, "johnsmith0")
+        store["users"][1]["handle_str"] = None
+        assert [register(u_id) for u_id in range(4, 8)] == ["johnsmith0", "johnsmith1", "johnsmith4", "johnsmith5"]
+        assert handles.find(store, "johnsmith3") == 2
+        data_store.set(store)
+
+    # from the store alone, once the index has been reset
+    data_store.reset_indexes()
+    with data_store.write() as store:
+        assert handles.find(store, "johnsmith") == 0 and handles.suffixes == {"johnsmith": 6}
+        handles.discard(store, "johnsmith4")
+        del store["users"][6]
+        assert register(8) == "johnsmith4" and register(9) == "johnsmith6"
+        data_store.set(store)
@@ -0,0 +1,161 @@
+import random
+import pytest
+from src import snapshot_format, storage
+from src.data_store import Datastore
+from src.journal import MemberList
+from tests.conftest import load, reload
+
+@pytest.fixture
+def journal_store(store_path):
+    # data store with one user and one channel already persisted
+    data_store = Datastore(store_path, "journal")
+    store = data_store.get()
+    store["users"][0] = {
+        "handle_str":   "bigboss",
+        "sessions":     [0],
+        "notifications": []
+    }
+    store["channels"][0] = {
+        "channel_name": "general",
+        "all_members":  [0],
+        "messages":     []
+    }
+    data_store.set(store)
+    return data_store
+
+# testing that every kind of change survives a restart
+def test_journal_replay(journal_store, store_path):
+    store = journal_store.get()
+    store["channels"][0]["messages"].append(0)
+    store["messages"][0] = {
+        "message_id":   0,
+        "message":      "hello",
+        "reacts":       [{"react_id": 1, "u_ids": []}]
+    }
+    store["messages"][0]["reacts"][0]["u_ids"].append(0)
+    store["users"][0]["notifications"].insert(0, {"notification_message": "hi"})
+    store["users"][0]["sessions"].remove(0)
+    store["message_id_tracker"] += 1
+    journal_store.set(store)
+
+    store["messages"].pop(0)
+    store["channels"][0]["messages"].clear()
+    journal_store.set(store)
+
+    assert reload(store_path) == store
+
+# testing that a set only appends the changes made since the last set
+def test_journal_write_is_size_of_change(journal_store, store_path, tmp_path):
+    store = journal_store.get()
+    store["users"][0]["notifications"].extend([{"notification_message": "x" * 100}] * 1000)
+    journal_store.set(store)
+
+    journal = tmp_path / "database.journal"
+    size_before = journal.stat().st_size
+    store["channels"][0]["messages"].append(0)
+    journal_store.set(store)
+
+    assert journal.stat().st_size - size_before < 100
+    assert reload(store_path) == store
+
+# testing that a torn frame left by a crash is ignored
+def test_journal_torn_frame(journal_store, store_path, tmp_path):
+    store = journal_store.get()
+    store["channels"][0]["messages"].append(0)
+    journal_store.set(store)
+    expected = reload(store_path)
+
+    journal = tmp_path / "database.journal"
+    data = journal.read_bytes()
+    store["channels"][0]["messages"].append(1)
+    journal_store.set(store)
+    # cut the last frame in half
+    torn = journal.read_bytes()
+    journal.write_bytes(torn[:len(data) + (len(torn) - len(data)) // 2])
+
+    assert reload(store_path) == expected
+
+# testing that the journal is folded into the snapshot once it grows too large
+def test_journal_compaction(journal_store, store_path, tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "JOURNAL_COMPACT_SIZE", 1000)
+    store = journal_store.get()
+    for message_id in range(100):
+        store["channels"][0]["messages"].append(message_id)
+        journal_store.set(store)
+
+    assert (tmp_path / "database.journal").stat().st_size < 1000
+    assert reload(store_path) == store
+
+    # the snapshot holds every collection of the store
+    with open(store_path, "rb") as FILE:
+        snapshot, meta = snapshot_format.load(FILE)
+    assert snapshot.keys() == store.keys()
+    assert meta["journal_seq"] > 0
+
+# testing that a snapshot store picks up a journal left by a journal store
+def test_snapshot_mode_replays_journal(journal_store, store_path):
+    store = journal_store.get()
+    store["channels"][0]["messages"].append(0)
+    journal_store.set(store)
+
+    data_store = load(store_path, "snapshot")
+    snapshot_store = data_store.get()
+    assert snapshot_store == store
+
+    snapshot_store["channels"][0]["messages"].append(1)
+    data_store.set(snapshot_store)
+    assert reload(store_path, "journal") == snapshot_store
+
+# testing that the members of a channel are looked up from their tickets
+# through every kind of change, and stored as the list they are
+def test_member_list(journal_store, store_path):
+    members = journal_store.get()["channels"][0]["all_members"]
+    assert isinstance(members, MemberList) and 0 in members and 1 not in members
+    members.extend([1, 2, 3])
+    members.insert(0, 4)
+    members.append(2)
+    members.remove(2)
+    members[1] = 5
+    del members[-1]
+    members.pop(0)
+    assert members == [5, 1, 3]
+    assert [u_id for u_id in range(7) if u_id in members] == [1, 3, 5]
+    with pytest.raises(ValueError):
+        members.remove(0)
+    members[:] = [6, 1]
+    assert 6 in members and 5 not in members
+    journal_store.set(journal_store.get())
+
+    store = reload(store_path)
+    assert store == journal_store.get()
+    assert isinstance(store["channels"][0]["all_members"], MemberList)
+
+    # a rolled back change is counted again
+    with journal_store.transaction():
+        members.clear()
+        members.append(3)
+        assert 6 not in members
+        journal_store.roll_back()
+    assert members == [6, 1] and 6 in members and 3 not in members
+
+# testing that members removed from anywhere in a long list are found at the
+# positions a plain list has them, as tombstones pile up and are cleared
+def test_member_list_positions(journal_store, store_path):
+    members = journal_store.get()["channels"][0]["all_members"]
+    expected = [0]
+    randomness = random.Random(0)
+    for u_id in range(1, 1000):
+        members.append(u_id)
+        expected.append(u_id)
+        if u_id % 3 == 0:
+            removed = randomness.choice(expected)
+            members.remove(removed)
+            expected.remove(removed)
+            assert removed not in members
+        if u_id % 100 == 0:
+            u_id = randomness.choice(expected)
+            assert members.index(u_id) == expected.index(u_id)
+    assert members == expected
+    assert [u_id for u_id in range(1000) if u_id in members] == sorted(expected)
+    journal_store.set(journal_store.get())
+    assert reload(store_path)["channels"][0]["all_members"] == expected
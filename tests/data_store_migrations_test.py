@@ -0,0 +1,87 @@
+import pytest
+from src import migrations, snapshot_format
+from src.migrations import MigratingDict
+from tests.conftest import load
+
+STANDUP = {"is_active": False, "message_queue": [], "time_finish": 0}
+
+def add_standup(channel):
+    channel.setdefault("standup", dict(STANDUP, message_queue=[]))
+
+@pytest.fixture(autouse=True)
+def standup_migration(monkeypatch):
+    # as if channels had been stored before standups were added
+    monkeypatch.setitem(migrations.MIGRATIONS, "channels", [add_standup])
+
+@pytest.fixture
+def path(store_path):
+    # a snapshot written before channels had standups, or versions were kept
+    store = load(store_path).get()
+    for channel_id in range(3):
+        store["channels"][channel_id] = {"channel_name": f"channel {channel_id}", "all_members": [0], "messages": []}
+    with open(store_path, 'wb') as FILE:
+        snapshot_format.dump(store, FILE, {"journal_seq": 0})
+    return store_path
+
+# testing that records of an old snapshot are only upgraded once they are accessed
+@pytest.mark.parametrize("persistence", ["snapshot", "journal", "paged", "sharded"])
+def test_upgraded_when_accessed(path, persistence):
+    data_store = load(path, persistence)
+    channels = data_store.get()["channels"]
+    assert isinstance(channels, MigratingDict)
+    assert dict.keys(channels) == set()
+    assert channels[1]["standup"] == STANDUP
+    assert list(dict.keys(channels)) == [1]
+    assert list(channels) == [0, 1, 2]
+
+# testing that the next snapshot written is at the current version
+def test_snapshot_upgraded(path):
+    data_store = load(path, "snapshot")
+    with data_store.write() as store:
+        store["channels"][1]["standup"]["is_active"] = True
+        data_store.set(store)
+    with open(path, 'rb') as FILE:
+        store, meta = snapshot_format.load(FILE)
+    assert meta["schema"] == migrations.versions()
+    assert [channel["standup"]["is_active"] for channel in store["channels"].values()] == [False, True, False]
+    assert not isinstance(load(path, "snapshot").get()["channels"], MigratingDict)
+
+# testing that records set by old journal frames are upgraded as they are replayed
+def test_journal_upgraded(path, monkeypatch):
+    monkeypatch.setitem(migrations.MIGRATIONS, "channels", [])
+    data_store = load(path)
+    with data_store.write() as store:
+        store["channels"][3] = {"channel_name": "channel 3", "all_members": [0], "messages": []}
+        data_store.set(store)
+
+    monkeypatch.setitem(migrations.MIGRATIONS, "channels", [add_standup])
+    data_store = load(path)
+    assert data_store.get()["channels"][3]["standup"] == STANDUP
+    with data_store.write() as store:
+        store["channels"][3]["standup"]["is_active"] = True
+        data_store.set(store)
+    assert load(path).get()["channels"][3]["standup"]["is_active"] is True
+
+# testing that messages left on disk are upgraded as they are read from their page
+@pytest.mark.parametrize("persistence", ["journal", "paged"])
+def test_messages_upgraded(store_path, persistence, monkeypatch):
+    monkeypatch.setitem(migrations.MIGRATIONS, "messages", [lambda message: message.setdefault("is_pinned", False)])
+    store = load(store_path).get()
+    store["channels"][0] = {"channel_name": "general", "all_members": [0], "messages": [2, 1, 0], "standup": STANDUP}
+    for message_id in range(3):
+        store["messages"][message_id] = {"message_id": message_id, "u_id": 0, "message": "hi", "time_created": 0, "reacts": []}
+    with open(store_path, 'wb') as FILE:
+        snapshot_format.dump(store, FILE, {"journal_seq": 0, "schema": {"channels": 1}})
+
+    data_store = load(store_path, persistence)
+    assert not isinstance(data_store.get()["channels"], MigratingDict)
+    assert [message["is_pinned"] for message in data_store.page_messages("channel", 0, 0)] == [False] * 3
+
+# testing that a backup taken before a migration is upgraded once restored
+def test_restore_upgraded(path, tmp_path):
+    data_store = load(str(tmp_path / "other.p"))
+    data_store.restore(path)
+    with data_store.snapshot() as snapshot:
+        assert snapshot.get()["channels"][2]["standup"] == STANDUP
+    assert data_store.get()["channels"][2]["standup"] == STANDUP
+    assert load(str(tmp_path / "other.p")).get() == data_store.get()
@@ -0,0 +1,85 @@
+import gc
+import pickle
+import pytest
+from src import snapshot_format, storage
+from tests.conftest import load, send
+
+@pytest.fixture
+def store_path(tmp_path):
+    # snapshot with a channel of 3000 messages, spread over three pages
+    path = str(tmp_path / "database.p")
+    data_store = load(path, "snapshot")
+    store = data_store.get()
+    store["channels"][0] = {"channel_name": "general", "all_members": [0], "messages": []}
+    for index in range(3000):
+        send(data_store, "channel", 0, f"message {index}", message_id=index, time_created=index)
+    data_store.set(store)
+    return path
+
+# testing that loading leaves the messages on disk until they are accessed
+def test_paged_lazy(store_path):
+    messages = load(store_path, "paged").get()["messages"]
+    assert dict.__len__(messages) == 0
+    assert len(messages._hot) == 0
+    assert len(messages) == 3000
+    assert 2500 in messages
+    assert 3000 not in messages
+    assert messages[2500]["message"] == "message 2500"
+    assert messages.get(-1) is None
+
+# testing that a page of messages comes out most recent first
+def test_paged_page_messages(store_path):
+    page = load(store_path, "paged").page_messages("channel", 0, 0)
+    assert [message["message_id"] for message in page] == list(range(2999, 2949, -1))
+
+# testing that changes only in the journal aren't forgotten once written
+def test_paged_changes_kept(store_path):
+    data_store = load(store_path, "paged")
+    store = data_store.get()
+    store["messages"][10]["message"] = "edited"
+    store["channels"][0]["messages"].remove(20)
+    store["messages"].pop(20)
+    data_store.set(store)
+    gc.collect()
+
+    assert store["messages"][10]["message"] == "edited"
+    assert 20 not in store["messages"]
+    reloaded = load(store_path, "paged")
+    assert reloaded.get() == store
+
+    # the journal is replayed over the snapshot, and still has to be kept
+    reloaded.set(reloaded.get())
+    gc.collect()
+    assert reloaded.get()["messages"][10]["message"] == "edited"
+    assert 20 not in reloaded.get()["messages"]
+
+# testing that messages are read from the new snapshot once one is written
+def test_paged_compaction(store_path, tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "JOURNAL_COMPACT_SIZE", 0)
+    data_store = load(store_path, "paged")
+    store = data_store.get()
+    # edit messages until the journal outgrows the snapshot and is compacted
+    for edited in range(3000):
+        store["messages"][edited]["message"] = "edited"
+        data_store.set(store)
+        if (tmp_path / "database.journal").stat().st_size == 0:
+            break
+
+    messages = data_store.get()["messages"]
+    assert 0 < edited < 2999
+    assert dict.__len__(messages) == 0
+    assert all(messages[index]["message"] == "edited" for index in range(edited + 1))
+    assert load(store_path, "paged").get()["messages"][edited]["message"] == "edited"
+
+# testing that a pickled snapshot is loaded in full, and kept until the next snapshot
+def test_paged_legacy(store_path):
+    with open(store_path, "rb") as FILE:
+        store, _ = snapshot_format.load(FILE)
+    with open(store_path, "wb") as FILE:
+        pickle.dump(store, FILE)
+
+    data_store = load(store_path, "paged")
+    assert dict.__len__(data_store.get()["messages"]) == 3000
+    data_store.set(data_store.get())
+    assert dict.__len__(data_store.get()["messages"]) == 3000
+    assert load(store_path, "paged").get() == store
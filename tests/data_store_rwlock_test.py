@@ -0,0 +1,99 @@
+import threading
+import time
+import pytest
+from src.rwlock import RWLock
+from tests.conftest import load
+
+@pytest.fixture
+def data_store(store_path):
+    return load(store_path)
+
+def run(target, *args):
+    thread = threading.Thread(target=target, args=args, daemon=True)
+    thread.start()
+    return thread
+
+# testing that any number of readers can hold the lock at once
+def test_readers_share(data_store):
+    both_in = threading.Barrier(2, timeout=2)
+    def reader():
+        with data_store.read():
+            both_in.wait()
+
+    threads = [run(reader), run(reader)]
+    for thread in threads:
+        thread.join()
+    assert not both_in.broken
+
+# testing that a writer waits for readers, and readers for a writer
+def test_writer_excludes(data_store):
+    events = []
+    def writer():
+        with data_store.write():
+            events.append("write")
+    def reader():
+        with data_store.read():
+            events.append("read")
+
+    with data_store.read():
+        thread = run(writer)
+        thread.join(0.1)
+        events.append("read")
+    thread.join()
+
+    with data_store.write():
+        thread = run(reader)
+        thread.join(0.1)
+        events.append("write")
+    thread.join()
+    assert events == ["read", "write", "write", "read"]
+
+# testing that a waiting writer goes before readers that come after it
+def test_writer_preferred():
+    lock = RWLock()
+    events = []
+    def writer():
+        lock.acquire_write()
+        events.append("write")
+        lock.release_write()
+    def reader():
+        lock.acquire_read()
+        events.append("read")
+        lock.release_read()
+
+    lock.acquire_read()
+    writing = run(writer)
+    time.sleep(0.05)
+    reading = run(reader)
+    time.sleep(0.05)
+    assert events == []
+    lock.release_read()
+    writing.join()
+    reading.join()
+    assert events == ["write", "read"]
+
+# testing that the lock can be taken again by the thread holding it
+def test_reentrant(data_store):
+    with data_store.write():
+        with data_store.write():
+            with data_store.read():
+                pass
+    with data_store.read():
+        with data_store.read():
+            with pytest.raises(RuntimeError):
+                data_store.begin()
+
+# testing that concurrent writers never see the same message_id_tracker
+def test_writers_serialised(data_store):
+    def send():
+        for _ in range(20):
+            with data_store.write() as store:
+                message_id = store["message_id_tracker"]
+                time.sleep(0.0001)
+                store["message_id_tracker"] = message_id + 1
+                data_store.set(store)
+
+    threads = [run(send) for _ in range(5)]
+    for thread in threads:
+        thread.join()
+    assert data_store.get()["message_id_tracker"] == 100
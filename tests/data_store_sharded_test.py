@@ -0,0 +1,65 @@
+import os
+import pickle
+import pytest
+from src.data_store import Datastore
+from tests.conftest import load, reload
+
+@pytest.fixture
+def sharded_store(store_path):
+    # data store with a user, a channel and a message already persisted
+    data_store = load(store_path, "sharded")
+    store = data_store.get()
+    store["users"][0] = {"handle_str": "bigboss", "name_first": "big"}
+    store["channels"][0] = {"channel_name": "general", "messages": []}
+    data_store.insert_message("channel", 0, {"message_id": 0, "message": "hello"})
+    data_store.set(store)
+    return data_store
+
+def shards(tmp_path):
+    with open(tmp_path / "database.shards" / "manifest.p", "rb") as FILE:
+        return pickle.load(FILE)["shards"]
+
+# testing that the shards are put back together on load
+def test_sharded_round_trip(sharded_store, store_path):
+    store = sharded_store.get()
+    store["messages"][0]["message"] = "edited"
+    store["users"][0]["name_first"] = "small"
+    sharded_store.set(store)
+
+    assert reload(store_path, "sharded") == store
+
+# testing that a write only rewrites the collections that changed
+def test_sharded_writes_changed_collections(sharded_store, tmp_path):
+    before = shards(tmp_path)
+    store = sharded_store.get()
+    store["users"][0]["name_first"] = "small"
+    sharded_store.set(store)
+
+    after = shards(tmp_path)
+    assert after["users"] != before["users"]
+    assert {key: name for key, name in after.items() if key != "users"} == \
+        {key: name for key, name in before.items() if key != "users"}
+    # the old users shard has been removed
+    assert sorted(os.listdir(tmp_path / "database.shards")) == sorted(list(after.values()) + ["manifest.p"])
+
+# testing that a store kept in database.p is picked up and then sharded
+def test_sharded_from_snapshot(store_path, tmp_path):
+    data_store = Datastore(store_path, "snapshot")
+    store = data_store.get()
+    store["users"][0] = {"handle_str": "bigboss"}
+    data_store.set(store)
+
+    sharded = load(store_path, "sharded")
+    assert sharded.get() == store
+    sharded.set(sharded.get())
+    assert set(shards(tmp_path)) == set(store)
+    assert reload(store_path, "sharded") == store
+
+# testing that files left behind by an unfinished write are ignored
+def test_sharded_unfinished_write(sharded_store, store_path, tmp_path):
+    expected = reload(store_path, "sharded")
+    with open(tmp_path / "database.shards" / "users.99.p", "wb") as FILE:
+        pickle.dump({}, FILE)
+
+    assert reload(store_path, "sharded") == expected
+    assert not os.path.exists(tmp_path / "database.shards" / "users.99.p")
@@ -0,0 +1,91 @@
+import copy
+import threading
+import pytest
+from tests.conftest import edit, elsewhere
+
+# testing that a snapshot still shows the store as it was once it is changed
+def test_snapshot_unchanged(data_store):
+    before = copy.deepcopy(data_store.get())
+    with data_store.snapshot() as snapshot:
+        elsewhere(edit, data_store)
+        view = data_store.get()
+        assert view is snapshot.get()
+        assert view == before
+        assert list(view["messages"]) == [0, 1, 2]
+        assert 3 not in view["messages"]
+        assert view["messages"][2]["message"] == "message 2"
+        assert view["messages"][1]["reacts"][0]["u_ids"] == []
+        assert view["channels"][0]["all_members"].copy() == [0]
+
+    store = data_store.get()
+    assert store["messages"][0]["message"] == "edited"
+    assert sorted(store["messages"]) == [0, 1, 3]
+    assert store["users"][0]["sessions"] == [1, 2]
+
+# testing that a snapshot can't be changed, and only copies of it can
+def test_snapshot_read_only(data_store):
+    with data_store.snapshot():
+        view = data_store.get()
+        with pytest.raises(TypeError):
+            view["users"][0]["email"] = "e@f.com"
+        with pytest.raises(TypeError):
+            data_store.set(view)
+        with pytest.raises(RuntimeError):
+            data_store.begin()
+        user = view["users"][0].copy()
+        user["sessions"].append(3)
+        assert type(user["sessions"]) is list
+    assert data_store.get()["users"][0]["sessions"] == [1]
+
+# testing that writers go ahead while a snapshot is open on another thread
+def test_snapshot_doesnt_block_writers(data_store):
+    opened = threading.Event()
+    done = threading.Event()
+    seen = []
+    def reader():
+        with data_store.snapshot():
+            opened.set()
+            done.wait(2)
+            seen.append(data_store.get()["messages"][0]["message"])
+
+    thread = threading.Thread(target=reader, daemon=True)
+    thread.start()
+    opened.wait(2)
+    edit(data_store)
+    done.set()
+    thread.join()
+    assert seen == ["message 0"]
+
+# testing that a snapshot's version is the number of sets it has seen
+def test_snapshot_version(data_store):
+    with data_store.snapshot() as first:
+        elsewhere(edit, data_store)
+        with data_store.snapshot() as second:
+            assert second.version == first.version + 1
+            assert sorted(data_store.get()["messages"]) == [0, 1, 3]
+        assert sorted(data_store.get()["messages"]) == [0, 1, 2]
+
+# testing that a snapshot finds the members a channel had when it was taken,
+# while they join and leave
+def test_snapshot_members(data_store):
+    def join():
+        with data_store.write() as store:
+            store["channels"][0]["all_members"].append(1)
+            data_store.set(store)
+    def leave():
+        with data_store.write() as store:
+            store["channels"][0]["all_members"].remove(0)
+            data_store.set(store)
+
+    with data_store.write() as store:
+        assert 0 in store["channels"][0]["all_members"]
+        data_store.set(store)
+    with data_store.snapshot():
+        members = data_store.get()["channels"][0]["all_members"]
+        assert 0 in members and 1 not in members
+        elsewhere(join)
+        elsewhere(leave)
+        assert 0 in members and 1 not in members
+        assert 0 in data_store.get()["channels"][0]["all_members"]
+        assert list(members) == [0]
+    assert data_store.get()["channels"][0]["all_members"] == [1]
@@ -0,0 +1,161 @@
+import pytest
+from src import sqlite_storage
+from tests.conftest import load, message
+
+@pytest.fixture
+def sqlite_store(store_path):
+    # data store with two users, a channel and a dm already persisted
+    data_store = load(store_path, "sqlite")
+    store = data_store.get()
+    for u_id in range(2):
+        store["users"][u_id] = {
+            "email":            f"user{u_id}@email.com",
+            "name_first":       "first",
+            "name_last":        "last",
+            "password":         "hash",
+            "handle_str":       f"firstlast{u_id}",
+            "is_owner":         u_id == 0,
+            "sessions":         [u_id],
+            "profile_img_url":  "http://localhost:8080/images/default.jpg",
+            "notifications":    [],
+            "user_stats": {
+                "channels_joined":  [{"num_channels_joined": 0, "time_stamp": 1}],
+                "dms_joined":       [{"num_dms_joined": 0, "time_stamp": 1}],
+                "messages_sent":    [{"num_messages_sent": 0, "time_stamp": 1}],
+                "involvement_rate": 0
+            }
+        }
+    store["users_stats"] = {
+        "channels_exist":   [{"num_channels_exist": 0, "time_stamp": 1}],
+        "dms_exist":        [{"num_dms_exist": 0, "time_stamp": 1}],
+        "messages_exist":   [{"num_messages_exist": 0, "time_stamp": 1}],
+        "utilization_rate": 0
+    }
+    store["channels"][0] = {
+        "channel_name":     "general",
+        "is_public":        True,
+        "owner_members":    [0],
+        "all_members":      [0],
+        "messages":         [],
+        "standup":          {"is_active": False, "message_queue": [], "time_finish": 0}
+    }
+    store["dms"][0] = {
+        "name":     "firstlast0, firstlast1",
+        "owner":    0,
+        "members":  [0, 1],
+        "messages": []
+    }
+    store["dm_id_tracker"] = 1
+    data_store.set(store)
+    return data_store
+
+def send(data_store, location_type, location_id, u_id, text):
+    store = data_store.get()
+    message_id = data_store.insert_message(location_type, location_id, message(
+        text, message_id=store["message_id_tracker"], u_id=u_id, time_created=2
+    ))
+    store["users"][u_id]["user_stats"]["messages_sent"].append({"num_messages_sent": 1, "time_stamp": 2})
+    store["users_stats"]["messages_exist"].append({"num_messages_exist": 1, "time_stamp": 2})
+    data_store.set(store)
+    return message_id
+
+# testing that every kind of change survives a restart
+def test_sqlite_round_trip(sqlite_store, store_path):
+    first = send(sqlite_store, "channel", 0, 0, "hello")
+    send(sqlite_store, "dm", 0, 1, "hi")
+    sqlite_store.add_member("channel", 0, 1)
+    store = sqlite_store.get()
+    store["messages"][first]["reacts"][0]["u_ids"].append(1)
+    store["messages"][first]["is_pinned"] = True
+    store["users"][1]["notifications"].insert(0, {"channel_id": 0, "dm_id": -1, "notification_message": "hi"})
+    store["users"][0]["user_stats"]["involvement_rate"] = 0.5
+    store["users_stats"]["utilization_rate"] = 1.0
+    store["channels"][0]["owner_members"].remove(0)
+    sqlite_store.set(store)
+
+    assert load(store_path, "sqlite").get() == store
+
+# testing that removed messages and dms are removed from the database
+def test_sqlite_remove(sqlite_store, store_path):
+    first = send(sqlite_store, "channel", 0, 0, "hello")
+    send(sqlite_store, "channel", 0, 0, "world")
+    send(sqlite_store, "dm", 0, 1, "hi")
+    store = sqlite_store.get()
+    store["channels"][0]["messages"].remove(first)
+    store["messages"].pop(first)
+    store["dms"].pop(0)
+    sqlite_store.set(store)
+
+    reloaded = load(store_path, "sqlite").get()
+    assert reloaded == store
+    assert first not in reloaded["messages"]
+
+# testing that a cleared store stays cleared
+def test_sqlite_clear(sqlite_store, store_path):
+    send(sqlite_store, "channel", 0, 0, "hello")
+    store = sqlite_store.get()
+    for collection in ("users", "channels", "dms", "messages"):
+        store[collection].clear()
+    store["message_id_tracker"] = 0
+    sqlite_store.set(store)
+
+    reloaded = load(store_path, "sqlite").get()
+    assert reloaded == store
+    assert len(reloaded["messages"]) == 0
+
+# testing that messages are only read in when they are accessed
+def test_sqlite_messages_lazy(sqlite_store, store_path):
+    for index in range(10):
+        send(sqlite_store, "channel", 0, 0, f"message {index}")
+
+    messages = load(store_path, "sqlite").get()["messages"]
+    assert dict.__len__(messages) == 0
+    assert len(messages) == 10
+    assert 3 in messages
+    assert messages[3]["message"] == "message 3"
+
+# testing that written messages don't stay in memory as history grows
+def test_sqlite_memory_flat(sqlite_store, monkeypatch, store_path):
+    monkeypatch.setattr(sqlite_storage, "HOT_MESSAGES", 10)
+    data_store = load(store_path, "sqlite")
+    for index in range(100):
+        send(data_store, "channel", 0, 0, f"message {index}")
+
+    messages = data_store.get()["messages"]
+    assert dict.__len__(messages) == 0
+    assert len(messages._hot) <= 10
+    assert messages[0]["message"] == "message 0"
+
+# testing that a message changed after being unpinned is still written
+def test_sqlite_change_after_write(sqlite_store, store_path):
+    message_id = send(sqlite_store, "channel", 0, 0, "hello")
+    message = sqlite_store.get()["messages"][message_id]
+    message["message"] = "edited"
+    sqlite_store.set(sqlite_store.get())
+
+    assert load(store_path, "sqlite").get()["messages"][message_id]["message"] == "edited"
+
+# testing that messages sent to a channel in the write that creates it stay in it
+def test_sqlite_new_channel_messages(sqlite_store, store_path):
+    with sqlite_store.write() as store:
+        store["channels"][1] = {**store["channels"][0], "channel_name": "new", "messages": []}
+        send(sqlite_store, "channel", 1, 0, "hello")
+        send(sqlite_store, "channel", 1, 0, "world")
+
+    assert load(store_path, "sqlite").get()["channels"][1]["messages"] == [0, 1]
+
+# testing that pages of messages come most recent first
+@pytest.mark.parametrize("persistence", ["journal", "sqlite"])
+def test_page_messages(store_path, persistence):
+    data_store = load(store_path, persistence)
+    store = data_store.get()
+    store["dms"][0] = {"name": "dm", "owner": 0, "members": [0], "messages": []}
+    for index in range(120):
+        data_store.insert_message("dm", 0, {"message_id": index, "message": str(index)})
+    data_store.set(store)
+
+    page = data_store.page_messages("dm", 0, 0)
+    assert [message["message"] for message in page] == [str(index) for index in range(119, 69, -1)]
+    page = data_store.page_messages("dm", 0, 100)
+    assert [message["message"] for message in page] == [str(index) for index in range(19, -1, -1)]
+    assert data_store.page_messages("dm", 0, 120) == []
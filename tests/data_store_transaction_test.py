@@ -0,0 +1,84 @@
+import copy
+import pytest
+from tests.conftest import load, send
+
+@pytest.fixture(params=["journal", "sqlite"])
+def persistence(request):
+    return request.param
+
+@pytest.fixture
+def data_store(persistence, store_path):
+    data_store = load(store_path, persistence)
+    with data_store.write() as store:
+        store["users"][0] = {"email": "a@b.com", "sessions": [1], "notifications": []}
+        store["channels"][0] = {"channel_name": "general", "all_members": [0], "messages": []}
+        for index in range(3):
+            send(data_store, "channel", 0, f"message {index}", message_id=index, time_created=index)
+        data_store.set(store)
+    # read the messages back from disk, where the storage does so
+    return load(store_path, persistence)
+
+def change_everything(data_store):
+    store = data_store.get()
+    store["users"][0]["sessions"].append(2)
+    store["users"][0]["notifications"].insert(0, {"notification_message": "hi"})
+    store["users"][1] = {"email": "c@d.com", "sessions": []}
+    store["channels"][0]["all_members"].remove(0)
+    send(data_store, "channel", 0, "message 3", message_id=3, time_created=3)
+    store["messages"][0]["message"] = "edited"
+    store["messages"][1]["reacts"][0]["u_ids"].append(1)
+    store["channels"][0]["messages"].remove(2)
+    del store["messages"][2]
+    store["dms"].clear()
+    data_store.set(store)
+
+# testing that a transaction is written to disk once, however often it is set
+def test_transaction_commit(data_store):
+    writes = data_store.writes
+    with data_store.transaction():
+        change_everything(data_store)
+        data_store.set(data_store.get())
+    assert data_store.writes == writes + 1
+    assert data_store.get()["messages"][0]["message"] == "edited"
+
+# testing that a transaction that raises leaves the store as it was
+def test_transaction_rollback(data_store, store_path, persistence):
+    before = copy.deepcopy(data_store.get())
+    writes = data_store.writes
+    with pytest.raises(ValueError):
+        with data_store.transaction():
+            change_everything(data_store)
+            raise ValueError
+
+    store = data_store.get()
+    assert store == before
+    assert sorted(store["messages"]) == [0, 1, 2]
+    assert store["messages"][2]["message"] == "message 2"
+    assert data_store.writes == writes
+
+    # the store carries on from where it was, on disk as well
+    with data_store.transaction():
+        store["messages"][1]["message"] = "edited"
+        data_store.set(store)
+    assert load(store_path, persistence).get() == store
+
+# testing that rolling back an inner transaction keeps the outer one's changes
+def test_transaction_nested(data_store):
+    with data_store.transaction() as store:
+        store["users"][0]["sessions"].append(2)
+        with data_store.transaction():
+            store["users"][0]["sessions"].append(3)
+            send(data_store, "channel", 0, "message 3", message_id=3, time_created=3)
+            data_store.roll_back()
+            assert 3 not in store["messages"]
+        data_store.set(store)
+    assert data_store.get()["users"][0]["sessions"] == [1, 2]
+    assert data_store.get()["message_id_tracker"] == 3
+
+# testing that only a transaction can be rolled back
+def test_roll_back_outside_transaction(data_store):
+    with pytest.raises(RuntimeError):
+        data_store.roll_back()
+    with data_store.write():
+        with pytest.raises(RuntimeError):
+            data_store.roll_back()
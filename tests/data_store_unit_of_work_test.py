@@ -0,0 +1,69 @@
+import threading
+import pytest
+from src.data_store import Datastore
+from tests.conftest import reload
+
+@pytest.fixture
+def data_store(store_path):
+    return Datastore(store_path, "journal")
+
+def send_message(data_store, channel_id, message_id):
+    # mimics message_send_v1, which sets the store several times
+    store = data_store.get()
+    store["channels"].setdefault(channel_id, {"messages": []})
+    data_store.set(store)
+    store["channels"][channel_id]["messages"].append(message_id)
+    data_store.set(store)
+    store["message_id_tracker"] = message_id + 1
+    data_store.set(store)
+
+# testing that every set is written straight away outside a unit of work
+def test_set_outside_unit_of_work(data_store):
+    send_message(data_store, 0, 0)
+    assert data_store.sets == 3
+    assert data_store.writes == 3
+
+# testing that a unit of work writes to disk once
+def test_unit_of_work_flushes_once(data_store):
+    with data_store.unit_of_work():
+        send_message(data_store, 0, 0)
+        assert data_store.writes == 0
+    assert data_store.sets == 3
+    assert data_store.writes == 1
+
+# testing that nested units of work only flush when the outermost one ends
+def test_nested_unit_of_work(data_store):
+    with data_store.unit_of_work():
+        with data_store.unit_of_work():
+            send_message(data_store, 0, 0)
+        assert data_store.writes == 0
+        send_message(data_store, 0, 1)
+    assert data_store.writes == 1
+
+# testing that a unit of work without any sets doesn't write
+def test_unit_of_work_no_sets(data_store):
+    with data_store.unit_of_work():
+        data_store.get()
+    assert data_store.writes == 0
+
+# testing that the unit of work is still flushed when an error is raised
+def test_unit_of_work_exception(data_store, store_path):
+    with pytest.raises(ValueError):
+        with data_store.unit_of_work():
+            send_message(data_store, 0, 0)
+            raise ValueError
+    assert data_store.writes == 1
+
+    assert reload(store_path) == data_store.get()
+
+# testing that a unit of work only defers sets made on its own thread, and
+# that other threads wait for it to end before writing
+def test_unit_of_work_per_thread(data_store):
+    with data_store.unit_of_work():
+        thread = threading.Thread(target=send_message, args=(data_store, 1, 0))
+        thread.start()
+        thread.join(0.2)
+        assert thread.is_alive()
+        assert data_store.writes == 0
+    thread.join()
+    assert data_store.writes == 3
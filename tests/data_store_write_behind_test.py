@@ -0,0 +1,60 @@
+import time
+import pytest
+from src.data_store import Datastore
+from tests.conftest import reload
+
+@pytest.fixture
+def data_store(store_path):
+    data_store = Datastore(store_path, "journal")
+    yield data_store
+    data_store.close()
+
+def add_message(data_store, message_id):
+    store = data_store.get()
+    store["messages"][message_id] = {"message_id": message_id, "message": "hi"}
+    data_store.set(store)
+
+def wait_for_writes(data_store, writes):
+    # gives the write-behind thread up to a second to catch up
+    for _ in range(100):
+        if data_store.writes >= writes:
+            return
+        time.sleep(0.01)
+
+# testing that set returns without writing and the interval triggers a write
+def test_write_behind_interval(data_store):
+    data_store.start_write_behind(50, 1000)
+    add_message(data_store, 0)
+    add_message(data_store, 1)
+    assert data_store.writes == 0
+
+    wait_for_writes(data_store, 1)
+    assert data_store.sets == 2
+    assert data_store.writes == 1
+
+# testing that enough dirty sets trigger a write before the interval is up
+def test_write_behind_max_dirty(data_store):
+    data_store.start_write_behind(60 * 1000, 5)
+    for message_id in range(5):
+        add_message(data_store, message_id)
+
+    wait_for_writes(data_store, 1)
+    assert data_store.writes == 1
+
+# testing that a unit of work counts as a single dirty set
+def test_write_behind_unit_of_work(data_store):
+    data_store.start_write_behind(60 * 1000, 2)
+    with data_store.unit_of_work():
+        for message_id in range(5):
+            add_message(data_store, message_id)
+    time.sleep(0.1)
+    assert data_store.writes == 0
+
+# testing that closing the store writes out everything that is still dirty
+def test_write_behind_close(data_store, store_path):
+    data_store.start_write_behind(60 * 1000, 1000)
+    add_message(data_store, 0)
+    data_store.close()
+    assert data_store.writes == 1
+
+    assert reload(store_path) == data_store.get()
@@ -0,0 +1,48 @@
+import pytest
+from benchmarks.common import make_store
+from src.data_store import Datastore
+from src.memory_report import deep_size, report
+from tests.conftest import load
+
+@pytest.fixture
+def store():
+    # user 3 with a long history of notifications, and a channel with far more messages
+    store = make_store(users=10, channels=3, messages=300)
+    store["users"][3]["notifications"] = [{"channel_id": 0, "dm_id": -1, "notification_message": "x" * 100}] * 50
+    store["channels"][2]["messages"].extend(range(300, 1300))
+    return store
+
+def stored(path, persistence, store):
+    # a data store loaded from `store` once it has been written to disk, which
+    # keeps every message it loads in memory whatever the config says
+    Datastore(path, persistence, cold_message_age=None).set(store)
+    return load(path, persistence, cold_message_age=None)
+
+# testing that objects held twice are only counted once, and shared values not at all
+def test_deep_size():
+    text = "x" * 1000
+    assert deep_size([text, text]) < 2 * deep_size(text)
+    assert deep_size([None, True, 1]) == deep_size([None, False, 2])
+
+# testing that each collection and field is measured, with the largest records found
+def test_report(store, store_path):
+    data_store = stored(store_path, "journal", store)
+    result = report(data_store, top=2, batch=4, pause=0)
+    assert result["bytes"] == sum(result["keys"].values())
+    assert list(result["keys"]) == list(store)
+
+    users = result["collections"]["users"]
+    assert users["records"] == users["resident"] == 10
+    assert users["fields"]["notifications"]["largest"][0]["id"] == 3
+    assert list(users["fields"])[0] == "notifications"
+    assert result["collections"]["channels"]["largest"][0]["id"] == 2
+    assert len(result["collections"]["messages"]["largest"]) == 2
+    assert result["collections"]["messages"]["resident"] == 300
+
+# testing that messages left on disk aren't loaded to be measured
+def test_report_lazy(store, store_path):
+    data_store = stored(store_path, "paged", store)
+    data_store.page_messages("channel", 0, 0, 10)
+    messages = report(data_store, pause=0)["collections"]["messages"]
+    assert messages["records"] == 300
+    assert 10 <= messages["resident"] < 300
@@ -0,0 +1,122 @@
+import threading
+import pytest
+from src.message_gc import MessageCollector
+from tests.conftest import load, send
+
+@pytest.fixture
+def path(store_path):
+    # a channel and two dms of 10 messages each
+    data_store = load(store_path)
+    with data_store.write() as store:
+        store["channels"][0] = {"channel_name": "general", "all_members": [0], "messages": []}
+        for dm_id in range(2):
+            store["dms"][dm_id] = {"name": f"dm {dm_id}", "owner": 0, "members": [0], "messages": []}
+        for index in range(10):
+            send(data_store, "channel", 0, f"channel {index}")
+            send(data_store, "dm", 0, f"dm 0 {index}")
+            send(data_store, "dm", 1, f"dm 1 {index}")
+        data_store.set(store)
+    return store_path
+
+def referenced(store):
+    # message_ids some channel or dm holds
+    locations = list(store["channels"].values()) + list(store["dms"].values())
+    return {message_id for location in locations for message_id in location["messages"]}
+
+# testing that the messages of a removed dm are collected, and nothing else
+def test_removed_dm_collected(path):
+    data_store = load(path)
+    with data_store.write() as store:
+        del store["dms"][1]
+        data_store.set(store)
+
+    collector = MessageCollector(data_store, batch=3, pause=0)
+    cycle = collector.collect()
+    store = data_store.get()
+    assert cycle["records"] == 10 and cycle["bytes"] > 0
+    assert set(store["messages"]) == referenced(store)
+    assert len(store["messages"]) == 20
+    assert collector.metrics()["records_reclaimed"] == 10
+    assert collector.metrics()["bytes_reclaimed"] == cycle["bytes"]
+
+    # nothing is left to collect, and what was collected is gone from disk too
+    assert collector.collect()["records"] == 0
+    assert collector.metrics()["cycles"] == 2
+    assert load(path).get() == store
+
+# testing that messages sent and dms removed while a cycle runs are handled
+def test_collected_while_changing(path):
+    data_store = load(path)
+    collector = MessageCollector(data_store, batch=1, pause=1)
+    done = threading.Event()
+    def change():
+        for index in range(50):
+            with data_store.write() as store:
+                dm_id = store["dm_id_tracker"] = store["dm_id_tracker"] + 1
+                store["dms"][dm_id] = {"name": "new", "owner": 0, "members": [0], "messages": []}
+                send(data_store, "dm", dm_id, f"new {index}")
+                send(data_store, "channel", 0, f"channel new {index}")
+                if index % 2:
+                    del store["dms"][dm_id]
+                data_store.set(store)
+        done.set()
+
+    changing = threading.Thread(target=change)
+    changing.start()
+    while not done.is_set():
+        collector.collect()
+    changing.join()
+    collector.collect()
+    store = data_store.get()
+    assert set(store["messages"]) == referenced(store)
+
+# testing that a cycle stops once the store has been cleared, rather than
+# taking the messages sent since for ones it found no channel or dm for
+def test_cleared_stops_cycle(path):
+    data_store = load(path)
+    collector = MessageCollector(data_store, batch=1, pause=0)
+    reads = 0
+    read = data_store.read
+    def read_then_clear():
+        # the store is cleared and used again right after the cycle begins
+        nonlocal reads
+        reads += 1
+        if reads == 2:
+            with data_store.write() as store:
+                for collection in ("channels", "dms", "messages"):
+                    store[collection].clear()
+                store["message_id_tracker"] = 0
+                store["dms"][5] = {"name": "new", "owner": 0, "members": [0], "messages": []}
+                for index in range(3):
+                    send(data_store, "dm", 5, f"new {index}")
+                data_store.set(store)
+        return read()
+    data_store.read = read_then_clear
+    assert collector.collect() is None
+    assert list(data_store.get()["messages"]) == [0, 1, 2]
+
+# testing that messages sent once the store has been cleared, between the
+# mark and the sweep, aren't deleted for having the message_ids of orphans
+def test_cleared_before_sweep(path):
+    data_store = load(path)
+    with data_store.write() as store:
+        del store["dms"][1]
+        data_store.set(store)
+    collector = MessageCollector(data_store, batch=100, pause=0)
+    write = data_store.write
+    def clear_then_write():
+        # the store is cleared and used again right before the first batch
+        data_store.write = write
+        with write() as store:
+            for collection in ("channels", "dms", "messages"):
+                store[collection].clear()
+            store["message_id_tracker"] = 0
+            data_store.reset_indexes()
+            store["dms"][5] = {"name": "new", "owner": 0, "members": [0], "messages": []}
+            for index in range(35):
+                send(data_store, "dm", 5, f"new {index}")
+            data_store.set(store)
+        return write()
+    data_store.write = clear_then_write
+    assert collector.collect()["records"] == 0
+    assert list(data_store.get()["messages"]) == list(range(35))
@@ -0,0 +1,123 @@
+import pickle
+import pytest
+from src import snapshot_format
+from src.data_store import Datastore
+from src.journal import TrackedDict
+
+@pytest.fixture
+def store():
+    return {
+        "users":        {0: {"handle_str": "bigboss", "name_first": "big"}},
+        "channels":     {0: {"channel_name": "general", "messages": [0, 1, 2]}},
+        "dms":          {},
+        "messages": {
+            0: {
+                "message_id":   0,
+                "u_id":         0,
+                "message":      "hello \U0001F600",
+                "time_created": 1637000000,
+                "reacts":       [{"react_id": 1, "u_ids": [0, 3]}],
+                "is_pinned":    True
+            },
+            1: {
+                "message_id":   1,
+                "u_id":         3,
+                "message":      "",
+                "time_created": 1637000001,
+                "reacts":       [{"react_id": 1, "u_ids": [], "is_this_user_reacted": False}],
+                "is_pinned":    False
+            },
+            # doesn't have the usual shape, so isn't stored in columns
+            2: {"message_id": 2, "message": "odd", "extra": [1]}
+        },
+        "message_id_tracker": 3
+    }
+
+def round_trip(tmp_path, store, meta=None):
+    path = tmp_path / "database.p"
+    with open(path, "wb") as FILE:
+        snapshot_format.dump(store, FILE, meta)
+    with open(path, "rb") as FILE:
+        return snapshot_format.load(FILE)
+
+# testing that a snapshot loads back to the store it was written from
+def test_round_trip(tmp_path, store):
+    loaded, meta = round_trip(tmp_path, store, {"journal_seq": 4})
+    assert loaded == store
+    assert meta == {"journal_seq": 4}
+    assert type(loaded["messages"]) == TrackedDict
+    assert "is_this_user_reacted" not in loaded["messages"][0]["reacts"][0]
+
+# testing that messages with keys that can't be stored in columns are pickled
+def test_irregular_keys(tmp_path, store):
+    store["messages"]["key"] = store["messages"].pop(0)
+    assert round_trip(tmp_path, store)[0] == store
+
+# testing that messages loaded from a snapshot are tracked like any others
+def test_loaded_messages_tracked(tmp_path, store):
+    path = str(tmp_path / "database.p")
+    data_store = Datastore(path, "snapshot")
+    data_store.set(store)
+    data_store = Datastore(path, "journal")
+    data_store.load()
+    loaded = data_store.get()
+    loaded["messages"][0]["reacts"][0]["u_ids"].append(5)
+    loaded["messages"][2]["extra"].append(2)
+    data_store.set(loaded)
+
+    reloaded = Datastore(path, "journal")
+    reloaded.load()
+    assert reloaded.get()["messages"][0]["reacts"][0]["u_ids"] == [0, 3, 5]
+    assert reloaded.get()["messages"][2]["extra"] == [1, 2]
+
+# testing that pickled snapshots from before the format still load, and convert
+def test_legacy_pickle(tmp_path, store):
+    path = str(tmp_path / "database.p")
+    with open(path, "wb") as FILE:
+        pickle.dump(store, FILE)
+        pickle.dump({"journal_seq": 0}, FILE)
+
+    data_store = Datastore(path, "snapshot")
+    data_store.load()
+    assert data_store.get() == store
+
+    snapshot_format.convert(path)
+    assert snapshot_format.is_snapshot(path)
+    data_store.load()
+    assert data_store.get() == store
+
+# testing that snapshots from a newer version are refused
+def test_newer_version(tmp_path):
+    path = tmp_path / "database.p"
+    path.write_bytes(snapshot_format.HEADER.pack(snapshot_format.MAGIC, snapshot_format.VERSION + 1, 0))
+    with open(path, "rb") as FILE:
+        with pytest.raises(ValueError):
+            snapshot_format.load(FILE)
+
+# testing that the text of archived pages is compressed, and reads back the same whether loaded at once or lazily
+def test_archived_compressed(tmp_path, store):
+    words = ["standup", "meeting", "tomorrow", "deadline", "project", "review", "lunch"]
+    for message_id in range(3, 3 * snapshot_format.PAGE_SIZE):
+        store["messages"][message_id] = {
+            "message_id":   message_id,
+            "u_id":         0,
+            "message":      " ".join(words[(message_id * index) % len(words)] for index in range(20)),
+            # only the middle page is archived, as the first has a message without a time
+            "time_created": 1637000000 if message_id < 2 * snapshot_format.PAGE_SIZE else 2 ** 40,
+            "reacts":       [],
+            "is_pinned":    False
+        }
+    sizes = {}
+    for archive_age in (None, 0):
+        path = tmp_path / f"database{archive_age}.p"
+        with open(path, "wb") as FILE:
+            snapshot_format.dump(store, FILE, archive_age=archive_age)
+        sizes[archive_age] = path.stat().st_size
+        with open(path, "rb") as FILE:
+            assert snapshot_format.load(FILE)[0] == store
+        with open(path, "rb") as FILE:
+            pages = snapshot_format.load(FILE, lazy=True)[0]["messages"]
+            assert pages.fetch([4, 3 * snapshot_format.PAGE_SIZE - 1]) == {
+                key: store["messages"][key] for key in [4, 3 * snapshot_format.PAGE_SIZE - 1]
+            }
+    assert sizes[0] < sizes[None] * 0.8
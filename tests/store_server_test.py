@@ -0,0 +1,121 @@
+import collections
+import threading
+import pytest
+from src.data_store import RemoteDatastore
+from src.store_server import StoreServer
+from tests.conftest import load, reload
+
+@pytest.fixture
+def server(store_path, tmp_path):
+    server = StoreServer(load(store_path), str(tmp_path / "database.sock"))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    # wait until the daemon is listening
+    while server.listener is None:
+        thread.join(0.01)
+    yield server
+    server.shutdown()
+
+def connect(server):
+    # each RemoteDatastore has a connection of its own, like a process would
+    data_store = RemoteDatastore(server.path)
+    data_store.load()
+    return data_store
+
+def add_user(data_store, u_id):
+    with data_store.transaction() as store:
+        store["users"][u_id] = {"email": f"user{u_id}@email.com", "sessions": []}
+        data_store.set(store)
+
+# testing that a change made through one client reaches the others and the disk
+def test_remote_shared(server, store_path):
+    first, second = connect(server), connect(server)
+    add_user(first, 0)
+    assert 0 not in second.get()["users"]
+    with second.read() as store:
+        assert store["users"][0]["email"] == "user0@email.com"
+    add_user(second, 1)
+    with first.snapshot():
+        assert sorted(first.get()["users"]) == [0, 1]
+
+    assert reload(store_path) == first.get() == second.get()
+
+# testing that clients writing at once never see the same message_id_tracker
+def test_remote_writers_serialised(server):
+    clients = [connect(server) for _ in range(4)]
+    def send(data_store):
+        for _ in range(25):
+            with data_store.transaction() as store:
+                store["message_id_tracker"] += 1
+                data_store.set(store)
+
+    threads = [threading.Thread(target=send, args=(client,)) for client in clients]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert server.data_store.get()["message_id_tracker"] == 100
+    with clients[0].read() as store:
+        assert store["message_id_tracker"] == 100
+
+# testing that a rolled back transaction is never committed, and lets go of the lock
+def test_remote_roll_back(server):
+    first, second = connect(server), connect(server)
+    with pytest.raises(ValueError):
+        with first.transaction() as store:
+            store["users"][0] = {"email": "user0@email.com", "sessions": []}
+            first.set(store)
+            raise ValueError
+    add_user(second, 1)
+    assert sorted(server.data_store.get()["users"]) == [1]
+    with first.read() as store:
+        assert sorted(store["users"]) == [1]
+
+# testing that a client too far behind is sent the whole store
+def test_remote_far_behind(server):
+    server.commits = collections.deque(maxlen=2)
+    first, second = connect(server), connect(server)
+    for u_id in range(5):
+        add_user(first, u_id)
+    with second.read() as store:
+        assert sorted(store["users"]) == list(range(5))
+    add_user(second, 5)
+    assert sorted(server.data_store.get()["users"]) == list(range(6))
+
+# testing that clients catch up with the commits made so far while another
+# commit is being written to disk
+def test_remote_catch_up_while_persisting(server):
+    first, second = connect(server), connect(server)
+    add_user(first, 0)
+    caught_up = []
+    def read():
+        with second.read() as store:
+            caught_up.append(sorted(store["users"]))
+
+    with server.persisting:
+        thread = threading.Thread(target=read, daemon=True)
+        thread.start()
+        thread.join(5)
+        assert caught_up == [[0]]
+
+# testing that a unit of work that couldn't begin, as the daemon couldn't be
+# reached, leaves nothing open to end, and the client goes on once it can be
+def test_remote_begin_unreachable(server, store_path):
+    client = RemoteDatastore(server.path)
+    server.shutdown()
+    with pytest.raises(OSError):
+        client.begin("transaction")
+    with pytest.raises(RuntimeError):
+        client.end()
+
+    restarted = StoreServer(load(store_path), server.path)
+    thread = threading.Thread(target=restarted.serve_forever, daemon=True)
+    thread.start()
+    while restarted.listener is None:
+        thread.join(0.01)
+    try:
+        add_user(client, 0)
+        add_user(connect(restarted), 1)
+        assert sorted(reload(store_path)["users"]) == [0, 1]
+    finally:
+        restarted.shutdown()
@@ -0,0 +1,110 @@
+import io
+import json
+import pytest
+from benchmarks.common import make_store
+from src import workspace
+from src.data_store import Datastore
+from src.workspace import export_file, export_workspace, import_file, import_workspace
+from tests.conftest import elsewhere, load, reload
+
+@pytest.fixture
+def store():
+    # a small workspace, with a dm and a message no channel or dm holds
+    store = make_store(users=20, channels=3, messages=50)
+    store["dms"][0] = {"name": "user0, user1", "owner": 0, "members": [0, 1], "messages": []}
+    store["dm_id_tracker"] = 1
+    for message_id in range(50, 53):
+        store["dms"][0]["messages"].append(message_id)
+        store["messages"][message_id] = dict(store["messages"][0], message_id=message_id, message=f"dm {message_id}")
+    store["messages"][53] = dict(store["messages"][0], message_id=53)
+    store["message_id_tracker"] = 54
+    return store
+
+# testing that a workspace comes back from its export as it was
+def test_round_trip(store):
+    FILE = io.StringIO()
+    counts = export_workspace(store, FILE)
+    assert counts == {"user": 20, "channel": 3, "dm": 1, "message": 53}
+    lines = [json.loads(line) for line in FILE.getvalue().splitlines()]
+    assert lines[0]["type"] == "workspace" and lines[-1]["type"] == "users_stats"
+    assert len(lines) == 2 + 20 + 3 + 1 + 53
+
+    FILE.seek(0)
+    imported = import_workspace(FILE)
+    del store["messages"][53]
+    assert imported == store
+
+# testing that a message is imported under the key it was stored under,
+# which isn't its message_id when it was sent later
+def test_round_trip_keys(store):
+    store["messages"][54] = dict(store["messages"][0], message_id=5, message="sent later")
+    store["channels"][0]["messages"].append(54)
+    store["message_id_tracker"] = 55
+    FILE = io.StringIO()
+    export_workspace(store, FILE)
+    FILE.seek(0)
+    imported = import_workspace(FILE)
+    assert imported["messages"][54]["message_id"] == 5 and imported["messages"][5]["message_id"] == 5
+    assert imported["channels"][0]["messages"] == store["channels"][0]["messages"]
+    del store["messages"][53]
+    assert imported == store
+
+# testing that an export without keys, of the first format, is still read
+def test_import_format_1():
+    imported = import_workspace(io.StringIO(
+        '{"type": "workspace", "format": 1, "session_id_tracker": 0, "dm_id_tracker": 0, "message_id_tracker": 1}\n'
+        '{"type": "channel", "channel_id": 0, "channel_name": "general"}\n'
+        '{"type": "message", "channel_id": 0, "message_id": 0, "message": "hi"}\n'
+    ))
+    assert imported["channels"][0]["messages"] == [0] and imported["messages"][0] == {"message_id": 0, "message": "hi"}
+
+# testing that an import replaces the store, which is written to disk
+def test_import_into_data_store(store, store_path, tmp_path):
+    del store["messages"][53]
+    data_store = Datastore(store_path, "journal")
+    data_store.set(store)
+    path = str(tmp_path / "workspace.jsonl")
+    export_file(data_store, path)
+
+    other = load(str(tmp_path / "other.p"), "paged")
+    assert import_file(other, path)["message"] == 53
+    assert reload(str(tmp_path / "other.p"), "paged") == data_store.get()
+
+# testing that an export is of the store as it was when it began, and
+# writers go ahead while it is written
+@pytest.mark.parametrize("persistence", ["journal", "paged"])
+def test_export_while_writing(store, store_path, tmp_path, persistence, monkeypatch):
+    del store["messages"][53]
+    Datastore(store_path, persistence).set(store)
+    data_store = load(store_path, persistence)
+    def write():
+        with data_store.write() as written:
+            written["channels"][0]["channel_name"] = "renamed"
+            written["messages"][0]["message"] = "edited"
+            data_store.set(written)
+
+    # a writer changes the store once the export has begun
+    write_line = workspace.write_line
+    def writing_line(FILE, kind, fields):
+        if kind == "workspace":
+            elsewhere(write)
+        write_line(FILE, kind, fields)
+    monkeypatch.setattr(workspace, "write_line", writing_line)
+
+    path = str(tmp_path / "workspace.jsonl")
+    export_file(data_store, path)
+    with open(path) as FILE:
+        assert import_workspace(FILE) == store
+    assert data_store.get()["messages"][0]["message"] == "edited"
+
+# testing that anything but an export is rejected
+@pytest.mark.parametrize("text", [
+    "",
+    "not json\n",
+    '{"type": "user", "u_id": 0}\n',
+    '{"type": "workspace", "format": 1, "session_id_tracker": 0, "dm_id_tracker": 0, "message_id_tracker": 1}\n'
+    '{"type": "message", "channel_id": 0, "message_id": 0}\n'
+])
+def test_import_invalid(text):
+    with pytest.raises(ValueError):
+        import_workspace(io.StringIO(text))